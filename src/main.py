@@ -4,29 +4,166 @@ file: main.py
 description: File that passes control to the correct server or client depending on platform
 
 author: Matt London
+
+note:
+    - Each mode is only imported once it is selected, so a restart of the server does not wait on the imports of the
+      client or head tilt (brainflow), and a mode whose dependencies are not installed does not break the others
 """
-import sys
+from wheelchair_interface.startup import STARTUP
+
+import argparse
 import logging
 
-from wheelchair_interface.rnet_controller.RNetController import RNetController
-from wheelchair_interface.clientserver import pi_server, nano_client
-from wheelchair_interface.input_receivers import headtilt
+from wheelchair_interface.protocol.resources import *
+
+
+def run_server(args: argparse.Namespace) -> None:
+    """
+    Serve commands from the UART onto the chair
+    """
+    from wheelchair_interface.clientserver import pi_server
+    STARTUP.mark("imported")
+
+    pi_server.main(args.record, args.record_received, args.bus, args.device, args.baud, args.frame_period,
+                   args.transport, args.transmit_cpu, args.fifo_priority,
+                   None if args.no_watchdog else args.watchdog_window, not args.no_coalesce)
+
+
+def run_client(args: argparse.Namespace) -> None:
+    """
+    Translate socket commands to the UART
+    """
+    from wheelchair_interface.clientserver import nano_client
+    STARTUP.mark("imported")
+
+    nano_client.main(args.device, args.baud, host=args.host, port=args.port, override_port=args.override_port,
+                     unix_path=args.unix_path or None, coalesce=not args.no_coalesce)
+
+
+def run_headtilt(args: argparse.Namespace) -> None:
+    """
+    Drive the chair from the tilt of the head
+    """
+    from functools import partial
+    from wheelchair_interface.clientserver.socket_client import send_move_cmd
+    from wheelchair_interface.input_receivers import headtilt
+    STARTUP.mark("imported")
+
+    headtilt.headTilt(args.board_id, args.serial_port, args.rate,
+                      partial(send_move_cmd, host=args.host, port=args.port))
+
+
+def run_wasd(args: argparse.Namespace) -> None:
+    """
+    Drive the chair from the keyboard
+    """
+    from wheelchair_interface.input_receivers import WASD
+    STARTUP.mark("imported")
+
+    WASD.main(args.bus)
+
+
+def run_command(args: argparse.Namespace) -> None:
+    """
+    Set the speed range of the chair and exit
+    """
+    from wheelchair_interface.rnet_controller.RNetController import RNetController
+    STARTUP.mark("imported")
+
+    controller = RNetController(args.bus)
+    STARTUP.ready()
+    controller.set_speed_range(args.speed)
+    controller.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: Parser for every mode and its options
+    """
+    parser = argparse.ArgumentParser(description="NXT wheelchair control")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="Level of messages to log")
+    parser.add_argument("--sync-logging", action="store_true",
+                        help="Format and write log messages on the thread logging them, rather than a background one")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Log how long each start up stage took once ready for commands")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-dump", metavar="PATH", help="Write the metrics to PATH on SIGUSR1")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="Record the latency trace of commands carrying a trace id, appended to PATH on exit")
+    modes = parser.add_subparsers(dest="mode", required=True)
+
+    server = modes.add_parser("server", help="Serve commands from the UART onto the chair (Raspberry Pi)")
+    server.set_defaults(run=run_server)
+    server.add_argument("--bus", type=int, default=0, help="Can bus number")
+    server.add_argument("--device", default=PI_DEVICE,
+                        help="Serial device commands are received on, or tcp:HOST:PORT, unix:PATH or shm:NAME")
+    server.add_argument("--baud", type=int, default=BAUD_RATE, help="Baud rate of the serial device")
+    # Defaults of the controller written out rather than imported from it, so asking for help stays instant
+    server.add_argument("--frame-period", type=float, default=0.01, help="Seconds between repeated frames")
+    server.add_argument("--transport", default="raw", choices=("raw", "bcm", "process"),
+                        help="How repeated frames are sent")
+    server.add_argument("--transmit-cpu", type=int, help="CPU to pin the transmit process to")
+    server.add_argument("--fifo-priority", type=int, help="SCHED_FIFO priority of the transmit process")
+    server.add_argument("--watchdog-window", type=float, default=WATCHDOG_WINDOW,
+                        help="Seconds without a heartbeat or command before the chair is stopped")
+    server.add_argument("--no-watchdog", action="store_true", help="Never stop the chair for a silent link")
+    server.add_argument("--no-coalesce", action="store_true", help="Do not merge moves into the running motion")
+    server.add_argument("--record", metavar="PATH", help="Record every frame sent and command received")
+    server.add_argument("--record-received", action="store_true", help="Also record frames received from the bus")
+
+    client = modes.add_parser("client", help="Translate socket commands to the UART (Jetson Nano)")
+    client.set_defaults(run=run_client)
+    client.add_argument("--device", default=NANO_DEVICE,
+                        help="Serial device commands are written to, or tcp:HOST:PORT, unix:PATH or shm:NAME")
+    client.add_argument("--baud", type=int, default=BAUD_RATE, help="Baud rate of the serial device")
+    client.add_argument("--host", default=SOCKET_HOST, help="Address to accept producers on")
+    client.add_argument("--port", type=int, default=SOCKET_PORT, help="Port for producers")
+    client.add_argument("--override-port", type=int, default=SOCKET_OVERRIDE_PORT,
+                        help="Port for producers which override the others")
+    client.add_argument("--unix-path", default=SOCKET_UNIX_PATH, help="Unix socket for producers, empty for none")
+    client.add_argument("--no-coalesce", action="store_true", help="Do not merge moves into the current drive")
+
+    headtilt = modes.add_parser("headtilt", help="Drive the chair from the tilt of the head")
+    headtilt.set_defaults(run=run_headtilt)
+    headtilt.add_argument("--board-id", type=int, default=0,
+                          help="BrainFlow board id, 0 for the Cyton and -1 for the synthetic board")
+    headtilt.add_argument("--serial-port", default="COM3", help="Port of the board")
+    headtilt.add_argument("--rate", type=float, default=20, help="Decisions per second")
+    headtilt.add_argument("--host", default=SOCKET_HOST, help="Address of the client")
+    headtilt.add_argument("--port", type=int, default=SOCKET_PORT, help="Port of the client")
+
+    wasd = modes.add_parser("wasd", help="Drive the chair from the keyboard")
+    wasd.set_defaults(run=run_wasd)
+    wasd.add_argument("--bus", type=int, default=0, help="Can bus number")
+
+    runcmd = modes.add_parser("runcmd", help="Set the speed range of the chair and exit")
+    runcmd.set_defaults(run=run_command)
+    runcmd.add_argument("--bus", type=int, default=0, help="Can bus number")
+    runcmd.add_argument("--speed", type=int, default=10, help="Speed range (0-100)")
+
+    return parser
 
 
 def main():
-    logging.getLogger().setLevel(logging.DEBUG)
-    if "server" in sys.argv:
-        pi_server.main()
-    elif "client" in sys.argv:
-        nano_client.main()
-    elif "headtilt" in sys.argv:
-        headtilt.headTilt()
-    elif "runcmd" in sys.argv:
-        controller = RNetController(0)
-        controller.set_speed_range(10)
-        controller.close()
-    else:
-        logging.error("Unrecognized command line option. Enter \"server\" or \"client\"")
+    args = build_parser().parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    if not args.sync_logging:
+        from wheelchair_interface import eventlog
+        eventlog.start()
+    STARTUP.report_when_ready = args.startup_report
+    STARTUP.mark("arguments")
+
+    if args.metrics_port is not None or args.metrics_dump is not None:
+        from wheelchair_interface import metrics
+        metrics.start(args.metrics_port, args.metrics_dump)
+
+    if args.trace is not None:
+        from wheelchair_interface import tracing
+        tracing.enable(args.trace)
+
+    args.run(args)
 
 
 if __name__ == "__main__":
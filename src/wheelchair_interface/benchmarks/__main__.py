@@ -0,0 +1,120 @@
+"""
+file: __main__.py
+
+description: Runs every benchmark and saves the results as JSON so versions can be compared
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+from . import async_controller, coalescing, frame_build, frame_cadence, headtilt_latency, logging_overhead, \
+    metrics_overhead, multi_bus, pipeline, protocol_codec, recording_log, simulated_session, transmit_process, \
+    transports, tx_backpressure, watchdog_latency
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """
+    Flatten nested results into dotted names
+
+    :param results: Nested benchmark results
+    :param prefix: Name of the enclosing result
+    :return: {"a.b.c": value}
+    """
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{name}"] = value
+
+    return flat
+
+
+def git_revision() -> str:
+    """
+    :return: Commit the benchmarks were run against, or "unknown" outside a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(vcan: int = None) -> dict:
+    """
+    Run every benchmark
+
+    :param vcan: Bus number of a vcan interface to use instead of socketpair stand-ins
+    :return: Results keyed by benchmark, with run metadata
+    """
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "protocol_codec_msg_per_s": protocol_codec.run(),
+        "frame_build_ns": frame_build.run(),
+        "frame_cadence": frame_cadence.run(vcan=vcan),
+        "pipeline": pipeline.run(vcan=vcan),
+        "transports": transports.run(),
+        "recording": recording_log.run(),
+        "transmit_process": transmit_process.run(),
+        "tx_backpressure": tx_backpressure.run(),
+        "headtilt": headtilt_latency.run(),
+        "coalescing": coalescing.run(),
+        "async_controller": async_controller.run(),
+        "multi_bus": multi_bus.run(),
+        "simulated_session": simulated_session.run(),
+        "metrics_ns": metrics_overhead.run(),
+        "logging": logging_overhead.run(),
+        "watchdog_stop_latency_ms": {
+            "max": max(watchdog_latency.measure(repeats=3)) * 1000,
+        },
+    }
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """
+    Print every numeric result next to the same result from a baseline run
+
+    :param current: Results of this run
+    :param baseline: Results loaded from an earlier run
+    """
+    current = flatten({k: v for k, v in current.items() if k != "meta"})
+    baseline = flatten({k: v for k, v in baseline.items() if k != "meta"})
+
+    for name, value in current.items():
+        if name in baseline and baseline[name]:
+            change = (value - baseline[name]) / abs(baseline[name]) * 100
+            print(f"{name:>60}: {value:14.2f} (baseline {baseline[name]:14.2f}, {change:+7.1f}%)")
+        else:
+            print(f"{name:>60}: {value:14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--vcan", type=int, help="Use vcan<N> instead of socketpair stand-ins for the can bus")
+    args = parser.parse_args()
+
+    results = run(args.vcan)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    compare(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
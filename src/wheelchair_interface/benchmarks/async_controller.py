@@ -0,0 +1,105 @@
+"""
+file: async_controller.py
+
+description: Input processing lateness and frame jitter with chair control and input sharing one thread
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from .standins import SocketpairCan
+from ..protocol.resources import Direction
+from ..rnet_controller.AsyncRNetController import AsyncRNetController
+from ..rnet_controller.RNetController import RNetController
+
+
+INPUT_RATE = 250
+""" Samples per second of the simulated input, the rate of the Cyton board """
+
+
+def run_blocking(moves: int, move_seconds: float) -> dict:
+    """
+    One thread reading input and driving with the blocking API, as the examples do
+
+    :param moves: Moves to make
+    :param move_seconds: Duration of each move
+    :return: Lateness of input samples (ms)
+    """
+    can = SocketpairCan()
+    controller = RNetController(can_socket=can.controller_socket)
+    late = []
+
+    for _ in range(moves):
+        # The next sample is due a period after the decision, but is only read once the move returns
+        next_sample = time.monotonic() + 1 / INPUT_RATE
+        controller.drive_direction_seconds(Direction.FORWARD, move_seconds)
+        late.append(time.monotonic() - next_sample)
+    can.close()
+
+    return {"input_late_p99_ms": float(np.percentile(late, 99)) * 1000, "input_late_max_ms": max(late) * 1000}
+
+
+async def run_async(moves: int, move_seconds: float) -> dict:
+    """
+    One thread reading input and driving with the asyncio API
+
+    :param moves: Moves to make
+    :param move_seconds: Duration of each move
+    :return: Lateness of input samples (ms) and the send jitter of the frames
+    """
+    can = SocketpairCan()
+    controller = AsyncRNetController(can_socket=can.controller_socket)
+    period = 1 / INPUT_RATE
+    late = []
+    samples = 0
+
+    loop = asyncio.get_running_loop()
+    next_sample = loop.time()
+    end = next_sample + moves * move_seconds
+    while next_sample < end:
+        late.append(loop.time() - next_sample)
+        # A new decision every move's worth of samples, the previous motion carries on meanwhile
+        if samples % round(move_seconds * INPUT_RATE) == 0:
+            controller.drive(Direction.FORWARD, move_seconds)
+        samples += 1
+        next_sample += period
+        await asyncio.sleep(max(0.0, next_sample - loop.time()))
+
+    await controller.close()
+    can.close()
+
+    return {
+        "input_late_p99_ms": float(np.percentile(late, 99)) * 1000,
+        "input_late_max_ms": max(late) * 1000,
+        "frame_jitter_mean_us": controller.stats.mean_jitter * 1e6,
+        "frame_jitter_max_us": controller.stats.max_jitter * 1e6,
+    }
+
+
+def run(moves: int = 10, move_seconds: float = 0.2) -> dict:
+    """
+    Compare the blocking and asyncio controllers
+
+    :param moves: Moves to make
+    :param move_seconds: Duration of each move
+    :return: Results of each keyed by "blocking" and "async"
+    """
+    return {
+        "blocking": run_blocking(moves, move_seconds),
+        "async": asyncio.run(run_async(moves, move_seconds)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure input lateness with the blocking and asyncio controllers")
+    parser.add_argument("--moves", type=int, default=10, help="Moves to make")
+    args = parser.parse_args()
+
+    for name, results in run(args.moves).items():
+        print(f"{name:>9}: " + " ".join(f"{key}={value:.2f}" for key, value in results.items()))
+
+
+if __name__ == "__main__":
+    main()
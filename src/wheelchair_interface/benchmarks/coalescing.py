@@ -0,0 +1,78 @@
+"""
+file: coalescing.py
+
+description: UART writes and gaps between drive frames for a producer repeating short moves, with and without coalescing
+"""
+import argparse
+import time
+
+from .pipeline import BENCH_HOST, BENCH_PORT, Pipeline
+from ..clientserver.socket_client import SocketClient
+from ..protocol.resources import Direction
+from ..rnet_controller.RNetController import RNetController
+
+
+def run_mode(coalesce: bool, port: int, seconds: float, move_duration: float, period: float) -> dict:
+    """
+    Repeat a forward move the way headtilt does and look at what reaches the UART and the bus
+
+    :param coalesce: Whether the hub and pi_server merge moves
+    :param port: Port for the hub of this run
+    :param seconds: Time to keep sending moves for
+    :param move_duration: Duration of each move
+    :param period: Seconds between moves
+    :return: Moves sent, UART writes, drive frames and the longest gap between drive frames (ms)
+    """
+    pipeline = Pipeline(port=port, coalesce=coalesce)
+    client = SocketClient(BENCH_HOST, port)
+
+    sent = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        client.send_move_cmd(Direction.FORWARD, move_duration)
+        sent += 1
+        time.sleep(period)
+    time.sleep(move_duration + 0.1)
+    client.close()
+
+    forward = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.FORWARD])
+    arrivals = [arrived for arrived, frame in pipeline.can.frames if frame == forward]
+    gaps = [(second - first) * 1000 for first, second in zip(arrivals, arrivals[1:])]
+
+    return {
+        "moves": sent,
+        "uart_writes": pipeline.hub.written,
+        "drive_frames": len(arrivals),
+        "max_frame_gap_ms": max(gaps) if gaps else 0.0,
+    }
+
+
+def run(seconds: float = 2.0, move_duration: float = 0.25, period: float = 0.05) -> dict:
+    """
+    Compare the pipeline with coalescing off and on
+
+    :param seconds: Time to keep sending moves for
+    :param move_duration: Duration of each move
+    :param period: Seconds between moves
+    :return: Results of each mode keyed by "separate" and "coalesced"
+    """
+    # Each run gets its own port as the stages of a pipeline live until the process exits
+    return {
+        "separate": run_mode(False, BENCH_PORT + 1, seconds, move_duration, period),
+        "coalesced": run_mode(True, BENCH_PORT + 2, seconds, move_duration, period),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure command coalescing")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Time to keep sending moves for")
+    parser.add_argument("--period", type=float, default=0.05, help="Seconds between moves")
+    args = parser.parse_args()
+
+    for name, results in run(args.seconds, period=args.period).items():
+        print(f"{name:>10}: moves={results['moves']:<4} uart writes={results['uart_writes']:<4} "
+              f"drive frames={results['drive_frames']:<5} max frame gap={results['max_frame_gap_ms']:6.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+file: frame_build.py
+
+description: Micro-benchmark comparing building drive frames from cansend strings against the cached frame API
+"""
+import timeit
+
+from ..rnet_controller.RNetController import RNetController
+
+
+def run(number: int = 200_000) -> dict[str, float]:
+    """
+    Time the per-frame cost of each way of producing a drive frame
+
+    :param number: Frames to build for each measurement
+    :return: Nanoseconds per frame keyed by method
+    """
+    # The original path, string building with _dec2hex then parsing it again without the cache
+    build_uncached = RNetController._build_frame.__wrapped__
+
+    def string_frame():
+        build_uncached(RNetController.DRIVE_FRAME_START +
+                       RNetController._dec2hex(0, 2) + RNetController._dec2hex(RNetController.MAX_POSITIVE, 2))
+
+    def cached_string_frame():
+        RNetController._build_frame(RNetController.DRIVE_FRAME_START + "0064")
+
+    def cached_frame():
+        RNetController.drive_frame(0, RNetController.MAX_POSITIVE)
+
+    results = {}
+    for name, func in (("string", string_frame), ("cached_string", cached_string_frame), ("frame", cached_frame)):
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        results[name] = seconds / number * 1e9
+
+    return results
+
+
+def main():
+    for name, ns in run().items():
+        print(f"{name:>14}: {ns:8.1f} ns/frame")
+
+
+if __name__ == "__main__":
+    main()
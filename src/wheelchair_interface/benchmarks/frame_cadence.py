@@ -0,0 +1,67 @@
+"""
+file: frame_cadence.py
+
+description: Cadence jitter and CPU cost of repeating drive frames through a controller
+"""
+import argparse
+import time
+
+from .standins import open_can
+from ..rnet_controller.RNetController import RNetController
+from ..tracing import percentile
+
+
+def run(seconds: float = 2.0, frame_period: float = RNetController.FRAME_PERIOD, vcan: int = None) -> dict:
+    """
+    Drive forward for a while and measure the spacing of the frames on the bus stand-in
+
+    :param seconds: Time to drive for
+    :param frame_period: Frame period given to the controller
+    :param vcan: Bus number of a vcan interface to use instead of a socketpair
+    :return: Frame count, CPU time per frame and inter-frame gap statistics (microseconds)
+    """
+    can_socket, can = open_can(vcan)
+    controller = RNetController(frame_period=frame_period, can_socket=can_socket)
+
+    cpu_start = time.process_time()
+    controller.drive_forward_seconds(seconds)
+    cpu_used = time.process_time() - cpu_start
+
+    stats = controller.transmit_stats
+    results = {
+        "frames": stats.frames,
+        "cpu_us_per_frame": cpu_used / stats.frames * 1e6,
+        "send_jitter_mean_us": stats.mean_jitter * 1e6,
+        "send_jitter_max_us": stats.max_jitter * 1e6,
+        "missed_deadlines": stats.missed_deadlines,
+    }
+
+    if can is not None:
+        # Let the reader catch up before looking at when the frames arrived
+        time.sleep(frame_period)
+        arrivals = [arrived for arrived, _ in can.frames]
+        gaps = sorted(abs((second - first) - frame_period) * 1e6 for first, second in zip(arrivals, arrivals[1:]))
+        if gaps:
+            results["gap_error_p50_us"] = percentile(gaps, 0.50)
+            results["gap_error_p99_us"] = percentile(gaps, 0.99)
+            results["gap_error_max_us"] = gaps[-1]
+
+    controller.close()
+    if can is not None:
+        can.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure drive frame cadence")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Time to drive for")
+    parser.add_argument("--vcan", type=int, help="Use vcan<N> instead of a socketpair")
+    args = parser.parse_args()
+
+    for name, value in run(args.seconds, vcan=args.vcan).items():
+        print(f"{name:>20}: {value:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+file: headtilt_latency.py
+
+description: Decision latency and stability of the head tilt classifier on generated or recorded accelerometer data
+"""
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from ..input_receivers.tilt_classifier import NEUTRAL_POSE, classify
+from ..protocol.resources import Direction
+
+
+SAMPLE_RATE = 250
+""" Samples per second of the Cyton and synthetic boards """
+
+
+def generate(rest: float, tilt: float, noise: float = 0.03, seed: int = 0) -> np.ndarray:
+    """
+    Accelerometer samples of a head at rest which then tilts forward
+
+    :param rest: Seconds at rest
+    :param tilt: Seconds tilted forward
+    :param noise: Standard deviation (g) of the sensor noise
+    :param seed: Seed of the noise
+    :return: Array of shape (3, samples)
+    """
+    rng = np.random.default_rng(seed)
+    count = round((rest + tilt) * SAMPLE_RATE)
+    samples = np.tile(np.array(NEUTRAL_POSE)[:, None], count)
+    # A firm nod, well past the forward threshold
+    samples[1, round(rest * SAMPLE_RATE):] += 0.4
+
+    return samples + rng.normal(0, noise, samples.shape)
+
+
+def legacy(samples: np.ndarray, period: float = 0.5) -> list[tuple[float, Direction]]:
+    """
+    The decision made before the classifier: the first sample of each read against fixed thresholds, every half second
+
+    :param samples: Array of shape (3, samples)
+    :param period: Seconds between reads
+    :return: (seconds from the start, decision) for every decision
+    """
+    block = round(period * SAMPLE_RATE)
+    decisions = []
+    for start in range(0, samples.shape[1] - block + 1, block):
+        x, y, _ = samples[:, start]
+        if y >= -0.8:
+            direction = Direction.FORWARD
+        elif abs(x) > 0.05:
+            direction = Direction.LEFT if x < -0.05 else Direction.RIGHT
+        else:
+            direction = Direction.STOP
+        decisions.append(((start + block) / SAMPLE_RATE, direction))
+
+    return decisions
+
+
+def summarize(decisions: list[tuple[float, Direction]], step: float) -> dict[str, float]:
+    """
+    Measure the decisions made on generated data
+
+    :param decisions: (seconds from the start, decision) for every decision
+    :param step: Seconds from the start at which the head tilted
+    :return: Step latency (ms) and the number of wrong decisions while at rest
+    """
+    forward = [time for time, direction in decisions if time > step and direction == Direction.FORWARD]
+
+    return {
+        "step_latency_ms": (forward[0] - step) * 1000 if forward else float("nan"),
+        "false_decisions_at_rest": sum(1 for time, direction in decisions
+                                       if time <= step and direction != Direction.STOP),
+    }
+
+
+def run(decision_rate: float = 20, rest: float = 10.13, repeats: int = 20) -> dict:
+    """
+    Compare the classifier with the old per-read decision on a forward nod after a noisy rest
+
+    :param decision_rate: Decisions per second of the classifier
+    :param rest: Seconds at rest before each nod, the first two are used for calibration
+    :param repeats: Nods with different noise to average over
+    :return: Mean step latency (ms) and total false decisions for each approach
+    """
+    results = {}
+    for name in ("classifier", "legacy"):
+        latencies = []
+        false_decisions = 0
+        for seed in range(repeats):
+            samples = generate(rest, 1.0, seed=seed)
+            if name == "classifier":
+                decisions = classify(samples, SAMPLE_RATE, decision_rate, calibration=2.0)
+            else:
+                decisions = legacy(samples)
+            summary = summarize(decisions, rest)
+            latencies.append(summary["step_latency_ms"])
+            false_decisions += summary["false_decisions_at_rest"]
+
+        results[name] = {
+            "mean_step_latency_ms": float(np.nanmean(latencies)),
+            "max_step_latency_ms": float(np.nanmax(latencies)),
+            "false_decisions_at_rest": false_decisions,
+        }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure head tilt decision latency")
+    parser.add_argument("--rate", type=float, default=20, help="Decisions per second")
+    parser.add_argument("--file", help="Recorded BrainFlow data (DataFilter.write_file) to classify instead")
+    parser.add_argument("--channels", type=int, nargs=3, default=[9, 10, 11],
+                        help="Accelerometer rows of the recorded data")
+    args = parser.parse_args()
+
+    if args.file:
+        samples = np.loadtxt(args.file).T[args.channels]
+        decisions = classify(samples, SAMPLE_RATE, args.rate, calibration=2.0)
+        counts = Counter(direction.name for _, direction in decisions)
+        changes = sum(1 for first, second in zip(decisions, decisions[1:]) if first[1] != second[1])
+        print(f"{len(decisions)} decisions, {changes} changes: {dict(counts)}")
+        return
+
+    for name, results in run(args.rate).items():
+        print(f"{name:>10}: step latency mean={results['mean_step_latency_ms']:6.1f}ms "
+              f"max={results['max_step_latency_ms']:6.1f}ms, false decisions at rest={results['false_decisions_at_rest']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+file: logging_overhead.py
+
+description: Time the per-command log calls take on the calling thread, logged directly and through the event ring
+
+note:
+    - The handler stalls every so often as a console or journald write does under load, the worst call shows whether
+      that stall reaches the thread logging
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from ..eventlog import BURST, EVENTS
+from ..protocol.processor import encode_move_cmd
+from ..protocol.resources import *
+
+
+class StallingHandler(logging.StreamHandler):
+    """
+    Handler writing to a file which blocks for a while every so many records
+    """
+    def __init__(self, stream, stall_every: int, stall: float):
+        """
+        :param stream: File to write to
+        :param stall_every: Records between stalls
+        :param stall: Seconds each stall blocks for
+        """
+        super().__init__(stream)
+        self.stall_every = stall_every
+        self.stall = stall
+        self.records = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        self.records += 1
+        if self.records % self.stall_every == 0:
+            time.sleep(self.stall)
+
+
+def measure(log, commands: list[bytes], rate: float) -> dict:
+    """
+    :param log: Called with each command as the command path logs it
+    :param commands: Commands to log
+    :param rate: Commands per second of the paced run
+    :return: Nanoseconds per call logged back to back, and the worst call when paced at the command rate
+    """
+    # Back to back, the default number of commands fits in the ring between drains
+    start = time.perf_counter_ns()
+    for command in commands:
+        log(command)
+    per_call = (time.perf_counter_ns() - start) / len(commands)
+
+    worst = 0
+    deadline = time.perf_counter()
+    for command in commands:
+        deadline += 1 / rate
+        time.sleep(max(0.0, deadline - time.perf_counter()))
+        call_start = time.perf_counter_ns()
+        log(command)
+        worst = max(worst, time.perf_counter_ns() - call_start)
+
+    return {"per_call_ns": per_call, "paced_max_us": worst / 1000}
+
+
+def run(calls: int = 2000, rate: float = 1000, stall_every: int = 100, stall: float = 0.005) -> dict:
+    """
+    Log a command per call at INFO, and a decode per call at DEBUG which is filtered out, both directly and through
+    the event ring
+
+    :param calls: Commands to log in each paced run
+    :param rate: Commands per second of the paced runs
+    :param stall_every: Records written between handler stalls
+    :param stall: Seconds each handler stall blocks for
+    :return: Time per call and worst call of each way of logging, and what the ring did with the events
+    """
+    commands = [bytes(encode_move_cmd(Direction.FORWARD, 0.25 + i % 100 / 1000)) for i in range(calls)]
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+
+    results = {}
+    with open(os.path.join(tempfile.mkdtemp(), "log.txt"), "w") as f:
+        handler = StallingHandler(f, stall_every, stall)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        root.handlers = [handler]
+        root.setLevel(logging.INFO)
+
+        try:
+            results["direct"] = measure(lambda command: logging.info(f"Received command: {command}"), commands, rate)
+            results["direct_debug_off"] = measure(lambda command: logging.debug("Decoded command as %s", command),
+                                                  commands, rate)
+
+            for name, burst in (("ring", len(commands) * 2), ("ring_summarized", BURST)):
+                EVENTS.logged = EVENTS.suppressed = EVENTS.dropped = 0
+                EVENTS.open(burst=burst)
+                results[name] = measure(lambda command: EVENTS.info("Received command: %s", command), commands, rate)
+                if name == "ring_summarized":
+                    results["ring_debug_off"] = measure(lambda command: EVENTS.debug("Decoded command as %s", command),
+                                                        commands, rate)
+                EVENTS.close()
+                results[name].update(logged=EVENTS.logged, suppressed=EVENTS.suppressed, dropped=EVENTS.dropped)
+        finally:
+            EVENTS.close()
+            root.handlers = saved_handlers
+            root.setLevel(saved_level)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of logging on the command path")
+    parser.add_argument("--calls", type=int, default=2000, help="Commands to log in each paced run")
+    parser.add_argument("--rate", type=float, default=1000, help="Commands per second of the paced runs")
+    args = parser.parse_args()
+
+    for name, values in run(args.calls, args.rate).items():
+        print(f"{name:>18}: " + ", ".join(f"{key}={value:.1f}" for key, value in values.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+file: metrics_overhead.py
+
+description: Cost of updating metrics on the hot path, and of rendering, scraping and dumping them
+"""
+import argparse
+import os
+import signal
+import tempfile
+import time
+import urllib.request
+
+from .standins import RecordingSocket
+from .. import metrics
+from ..clientserver.pi_server import CommandDispatcher, register_metrics
+from ..metrics import METRICS, Counter, Histogram
+from ..protocol.parser import FrameParser
+from ..rnet_controller.RNetController import RNetController
+
+
+def per_call_ns(function, calls: int) -> float:
+    """
+    :param function: Function taking no arguments
+    :param calls: Times to call it
+    :return: Nanoseconds per call
+    """
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        function()
+
+    return (time.perf_counter_ns() - start) / calls
+
+
+def run(calls: int = 1_000_000, port: int = 19165) -> dict:
+    """
+    Time metric updates, a send_frame which counts its frame, and exposing every metric the server registers
+
+    :param calls: Updates to time
+    :param port: Localhost port to scrape the metrics from
+    :return: Nanoseconds per update and send, and milliseconds to render, scrape and dump
+    """
+    counter = Counter()
+    histogram = Histogram()
+    controller = RNetController(can_socket=RecordingSocket())
+    frame = RNetController.drive_frame(0, 100)
+
+    results = {
+        "empty_call_ns": per_call_ns(lambda: None, calls),
+        "counter_inc_ns": per_call_ns(counter.inc, calls),
+        "histogram_observe_ns": per_call_ns(lambda: histogram.observe(0.003), calls),
+        # RecordingSocket keeps every frame, fewer calls keep its memory down
+        "send_frame_ns": per_call_ns(lambda: controller.send_frame(frame), calls // 10),
+    }
+
+    register_metrics(controller, CommandDispatcher(controller), FrameParser())
+    start = time.perf_counter()
+    text = METRICS.render()
+    results["render_ms"] = (time.perf_counter() - start) * 1000
+    results["render_lines"] = text.count("\n")
+
+    server = metrics.serve(port)
+    start = time.perf_counter()
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        response.read()
+    results["scrape_ms"] = (time.perf_counter() - start) * 1000
+    server.shutdown()
+    server.server_close()
+
+    path = os.path.join(tempfile.mkdtemp(), "metrics.prom")
+    previous = signal.getsignal(signal.SIGUSR1)
+    metrics.dump_on_signal(path)
+    start = time.perf_counter()
+    os.kill(os.getpid(), signal.SIGUSR1)
+    while not os.path.exists(path):
+        time.sleep(0.0001)
+    results["signal_dump_ms"] = (time.perf_counter() - start) * 1000
+    signal.signal(signal.SIGUSR1, previous)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of metrics")
+    parser.add_argument("--calls", type=int, default=1_000_000, help="Updates to time")
+    args = parser.parse_args()
+
+    for name, value in run(args.calls).items():
+        print(f"{name:>22}: {value:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+file: multi_bus.py
+
+description: Per bus frame cadence when driving many buses at once, a thread per bus against one MultiBusController
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+import numpy as np
+
+from .standins import RecordingSocket
+from ..protocol.resources import Direction
+from ..rnet_controller.MultiBusController import MultiBusController
+from ..rnet_controller.RNetController import RNetController
+
+
+def gap_errors(sockets: list[RecordingSocket], frame_period: float) -> np.ndarray:
+    """
+    :param sockets: Stand-in socket of every bus
+    :param frame_period: Period the frames should be spaced by
+    :return: Distance of every gap between drive frames on a bus from the frame period (microseconds)
+    """
+    errors = []
+    for can_socket in sockets:
+        arrivals = [sent for sent, frame in can_socket.frames if frame != RNetController.STOP_FRAME_BYTES]
+        # The first gap of the controller is shorter by design, its first frame goes out ahead of the shared grid
+        errors.extend(abs((second - first) - frame_period) for first, second in zip(arrivals[1:], arrivals[2:]))
+
+    return np.array(errors) * 1e6
+
+
+def summary(sockets: list[RecordingSocket], frame_period: float, cpu_used: float) -> dict:
+    """
+    :param sockets: Stand-in socket of every bus
+    :param frame_period: Period the frames should be spaced by
+    :param cpu_used: CPU seconds the run took
+    :return: Gap error percentiles and CPU time per frame
+    """
+    errors = gap_errors(sockets, frame_period)
+    frames = sum(len(can_socket.frames) for can_socket in sockets)
+
+    return {
+        "gap_error_p50_us": float(np.percentile(errors, 50)),
+        "gap_error_p99_us": float(np.percentile(errors, 99)),
+        "gap_error_max_us": float(errors.max()),
+        "cpu_us_per_frame": cpu_used / frames * 1e6,
+    }
+
+
+def run_threads(buses: int, seconds: float, frame_period: float) -> dict:
+    """
+    One blocking RNetController on its own thread per bus, the closest a single process gets to a process per bus
+
+    :param buses: Number of buses
+    :param seconds: Time to drive each for
+    :param frame_period: Frame period of every bus
+    :return: Cadence of the frames
+    """
+    sockets = [RecordingSocket() for _ in range(buses)]
+    controllers = [RNetController(frame_period=frame_period, can_socket=can_socket) for can_socket in sockets]
+
+    def drive(controller: RNetController) -> None:
+        time.sleep(random.uniform(0, frame_period))
+        controller.drive_forward_seconds(seconds)
+
+    cpu_start = time.process_time()
+    threads = [threading.Thread(target=drive, args=(controller,)) for controller in controllers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = summary(sockets, frame_period, time.process_time() - cpu_start)
+
+    for controller in controllers:
+        controller.close()
+    results["missed_deadlines"] = sum(controller.transmit_stats.missed_deadlines for controller in controllers)
+
+    return results
+
+
+async def run_multi(buses: int, seconds: float, frame_period: float) -> dict:
+    """
+    Every bus on one MultiBusController
+
+    :param buses: Number of buses
+    :param seconds: Time to drive each for
+    :param frame_period: Frame period of every bus
+    :return: Cadence of the frames
+    """
+    controller = MultiBusController(frame_period)
+    sockets = [RecordingSocket() for _ in range(buses)]
+    for bus, can_socket in enumerate(sockets):
+        controller.add_bus(bus, can_socket)
+    controller.start()
+
+    cpu_start = time.process_time()
+    motions = []
+    for bus in range(buses):
+        await asyncio.sleep(random.uniform(0, frame_period / buses))
+        motions.append(controller.drive(bus, Direction.FORWARD, seconds))
+    await asyncio.gather(*motions)
+    results = summary(sockets, frame_period, time.process_time() - cpu_start)
+
+    results["missed_deadlines"] = controller.aggregate_stats()[0].missed_deadlines
+    await controller.close()
+
+    return results
+
+
+def run(bus_counts: tuple[int, ...] = (1, 12, 48), seconds: float = 2.0,
+        frame_period: float = RNetController.FRAME_PERIOD) -> dict:
+    """
+    Compare a thread per bus with one MultiBusController over several numbers of buses
+
+    :param bus_counts: Numbers of buses to drive at once
+    :param seconds: Time to drive each for
+    :param frame_period: Frame period of every bus
+    :return: Results keyed by "threads" or "multi" then by bus count
+    """
+    results = {"threads": {}, "multi": {}}
+    for buses in bus_counts:
+        results["threads"][str(buses)] = run_threads(buses, seconds, frame_period)
+        results["multi"][str(buses)] = asyncio.run(run_multi(buses, seconds, frame_period))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per bus frame cadence with many buses in one process")
+    parser.add_argument("--buses", type=int, nargs="+", default=[1, 12, 48], help="Numbers of buses to drive at once")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Time to drive for")
+    args = parser.parse_args()
+
+    for mode, counts in run(tuple(args.buses), args.seconds).items():
+        for buses, results in counts.items():
+            print(f"{mode:>7} x{buses:>3}: " + " ".join(f"{key}={value:.1f}" for key, value in results.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+file: pipeline.py
+
+description: End-to-end benchmark of socket -> nano_client -> UART -> pi_server -> can with local stand-ins
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+from .standins import PtyWriter, open_can, open_uart
+from .. import tracing
+from ..clientserver import pi_server
+from ..clientserver.nano_client import CommandHub
+from ..clientserver.socket_client import SocketClient
+from ..protocol.resources import Direction
+from ..rnet_controller.RNetController import RNetController
+
+
+BENCH_HOST = "127.0.0.1"
+BENCH_PORT = 18165
+""" Kept away from the real hub port so the benchmark can run next to it """
+
+
+class Pipeline:
+    """
+    The whole command path running in one process: a hub on a thread, a pty for the UART and pi_server on a thread
+    """
+    def __init__(self, vcan: int = None, port: int = BENCH_PORT, coalesce: bool = True):
+        """
+        Constructor which starts every stage
+
+        :param vcan: Bus number of a vcan interface to use instead of a socketpair
+        :param port: Port the hub listens on
+        :param coalesce: Whether the hub and pi_server merge moves continuing the drive in progress
+        """
+        self.port = port
+        can_socket, self.can = open_can(vcan)
+        self.controller = RNetController(can_socket=can_socket)
+
+        self._nano_end, self._pi_serial = open_uart()
+        threading.Thread(target=pi_server.serve, args=(self.controller, self._pi_serial, None, coalesce),
+                         daemon=True).start()
+
+        # The heartbeat only matters to the watchdog, which is not running here
+        self.hub = CommandHub(PtyWriter(self._nano_end), heartbeat_period=None, coalesce=coalesce)
+        ready = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self.__serve_hub(ready)), daemon=True).start()
+        ready.wait()
+
+    async def __serve_hub(self, ready: threading.Event) -> None:
+        """
+        Body of the hub thread
+
+        :param ready: Set once the hub is listening
+        """
+        await self.hub.listen_tcp(BENCH_HOST, self.port)
+        ready.set()
+        await self.hub.serve()
+
+
+def run(commands: int = 2000, latency_samples: int = 200, vcan: int = None) -> dict:
+    """
+    Measure command throughput and end-to-end latency through the pipeline
+
+    :param commands: Commands to flood through for the throughput measurement
+    :param latency_samples: Traced commands sent one at a time for the latency measurement
+    :param vcan: Bus number of a vcan interface to use instead of a socketpair
+    :return: Throughput (commands/s) and per-hop latency summaries (microseconds)
+    """
+    pipeline = Pipeline(vcan)
+    client = SocketClient(BENCH_HOST, pipeline.port)
+
+    # Throughput, every command is received by the hub even though only the newest are written on
+    start = time.perf_counter()
+    for i in range(commands):
+        client.send_move_cmd(Direction.LEFT if i % 2 else Direction.RIGHT, 0.05)
+    while pipeline.hub.received < commands and time.perf_counter() - start < 10:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "commands_per_second": pipeline.hub.received / elapsed,
+        "uart_writes": pipeline.hub.written,
+    }
+
+    # Latency, spaced out so every command makes it to the bus
+    tracer = tracing.enable()
+    for trace_id in range(latency_samples):
+        client.send_move_cmd(Direction.FORWARD if trace_id % 2 else Direction.BACKWARD, 0.01, trace_id=trace_id)
+        time.sleep(0.02)
+    time.sleep(0.05)
+
+    tracer.enabled = False
+    results["latency"] = tracing.summarize(tracing.group(tracer.take()))
+    client.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the full command pipeline")
+    parser.add_argument("--vcan", type=int, help="Use vcan<N> instead of a socketpair")
+    args = parser.parse_args()
+
+    results = run(vcan=args.vcan)
+    print(f"commands/s: {results['commands_per_second']:,.0f} ({results['uart_writes']} written to UART)")
+    for name, stats in results["latency"].items():
+        print(f"{name:>28}: p50={stats['p50_us']:8.1f}us p99={stats['p99_us']:8.1f}us max={stats['max_us']:8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+file: protocol_codec.py
+
+description: Throughput of encoding and decoding protocol messages
+"""
+import argparse
+import logging
+import time
+import timeit
+
+import numpy as np
+
+from ..protocol.processor import decode_many, decode_move_cmd, encode_many, encode_move_cmd
+from ..protocol.resources import *
+
+
+def legacy_encode_move_cmd(direction: Direction, duration: float) -> bytearray:
+    """
+    Move command encoder before the duration table: a list per call and a division loop per duration
+
+    :param direction: Direction to instruct
+    :param duration: Time to repeat that direction (seconds)
+    :return: Bytearray suitable for sending over the wire
+    """
+    ms = round(duration * 1000)
+    exponent = 0
+    mantissa = ms
+    while mantissa % 10 == 0 or mantissa >= 256:
+        mantissa //= 10
+        exponent += 1
+
+    cmd = [0 for _ in range(PROTOCOL_LENGTH)]
+    cmd[0] = STX
+    cmd[1] = int(direction)
+    cmd[2] = mantissa
+    cmd[3] = exponent
+    cmd[-1] = ETX
+    logging.debug(f"Encoded command as {cmd}")
+
+    return bytearray(cmd)
+
+
+def legacy_decode_move_cmd(raw_cmd: bytearray) -> tuple[Direction, float]:
+    """
+    Move command decoder before the struct path: two list conversions and an eagerly formatted log message
+
+    :param raw_cmd: Raw bytes received over the wire
+    :return: (Direction, duration in seconds)
+    """
+    cmd = list(raw_cmd)
+    if len(cmd) != PROTOCOL_LENGTH or cmd[0] != STX or cmd[-1] != ETX:
+        raise ValueError("Command received does not match protocol")
+
+    cmd = list(raw_cmd)
+    direction = Direction(cmd[1])
+    duration = cmd[2] * (10 ** cmd[3]) / 1000
+    logging.debug(f"Decoded command as ({direction}, {duration})")
+
+    return direction, duration
+
+
+def run(number: int = 1_000_000, batch: int = 2_000_000) -> dict[str, float]:
+    """
+    Time encoding and decoding move commands one at a time, before and after the table codec, and in batches
+
+    :param number: Messages to encode or decode for each single message measurement
+    :param batch: Messages in each batch measurement
+    :return: Messages per second keyed by operation
+    """
+    # Debug logging would dominate the measurement, make sure it is filtered out as early as possible
+    logger = logging.getLogger()
+    level = logger.level
+    logger.setLevel(logging.INFO)
+
+    try:
+        encoded = bytes(encode_move_cmd(Direction.FORWARD, 0.25))
+        operations = {
+            "legacy_encode_move_cmd": lambda: legacy_encode_move_cmd(Direction.FORWARD, 0.25),
+            "encode_move_cmd": lambda: encode_move_cmd(Direction.FORWARD, 0.25),
+            "legacy_decode_move_cmd": lambda: legacy_decode_move_cmd(encoded),
+            "decode_move_cmd": lambda: decode_move_cmd(encoded),
+        }
+
+        results = {}
+        for name, func in operations.items():
+            seconds = min(timeit.repeat(func, number=number, repeat=3))
+            results[name] = number / seconds
+
+        # A spread of durations as found in a log, not just the one that is cached
+        rng = np.random.default_rng(0)
+        directions = rng.integers(min(Direction), max(Direction) + 1, batch)
+        durations = rng.integers(1, 30_000, batch) / 1000
+
+        start = time.perf_counter()
+        cmds = encode_many(directions, durations).tobytes()
+        results["encode_many"] = batch / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decode_many(cmds)
+        results["decode_many"] = batch / (time.perf_counter() - start)
+
+    finally:
+        logger.setLevel(level)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure protocol codec throughput")
+    parser.add_argument("--number", type=int, default=1_000_000, help="Messages per single message measurement")
+    parser.add_argument("--batch", type=int, default=2_000_000, help="Messages per batch measurement")
+    args = parser.parse_args()
+
+    for name, rate in run(args.number, args.batch).items():
+        print(f"{name:>24}: {rate:14,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+file: recording_log.py
+
+description: Cost of recording a frame and speed of analysing a long recording
+"""
+import os
+import tempfile
+import time
+import timeit
+
+from ..recording import KIND_CAN_TX, Recorder
+from ..replay import analyse, load
+from ..rnet_controller.RNetController import RNetController
+
+
+def run(records: int = 1_000_000) -> dict[str, float]:
+    """
+    Time the recording hook and the analysis of a recording
+
+    :param records: Records in the recording that is analysed, a million is about 2.8 hours of frames at 100 Hz
+    :return: ns per recorded frame, MB of log and records/s analysed
+    """
+    frame = RNetController.drive_frame(0, 100)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.rec")
+        recorder = Recorder()
+        recorder.open(path)
+
+        number = 100_000
+        seconds = min(timeit.repeat(lambda: recorder.record_frame(KIND_CAN_TX, frame), number=number, repeat=3))
+        results = {"record_frame_ns": seconds / number * 1e9}
+
+        # Pad the recording out to size, the timing above already recorded 3 * number frames
+        for _ in range(records - 3 * number):
+            recorder.record_frame(KIND_CAN_TX, frame)
+        recorder.close()
+        results["log_mb"] = os.path.getsize(path) / 1e6
+
+        start = time.perf_counter()
+        analyse(load(path))
+        results["analysed_records_per_s"] = records / (time.perf_counter() - start)
+
+    return results
+
+
+def main():
+    for name, value in run().items():
+        print(f"{name:>24}: {value:14,.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+file: simulated_session.py
+
+description: A ten minute head tilt session through pi_server to a simulated chair on a virtual clock
+
+note:
+    - Virtual time does not include the time the code takes to run, so latencies are those of the timing logic
+      alone: the frame slots, preemption and watchdog. A change in them is a change in behaviour.
+"""
+import argparse
+import random
+import time
+
+from ..clock import VirtualClock
+from ..protocol.processor import encode_heartbeat_cmd, encode_move_cmd
+from ..protocol.resources import *
+from ..rnet_controller.RNetController import RNetController
+from ..simulation import SimulatedChair, run_session
+
+
+MOVE_DURATION = 0.25
+""" Duration of each move, as headtilt sends """
+
+REFRESH_PERIOD = MOVE_DURATION / 2
+""" Seconds between moves while the head stays tilted """
+
+
+def script(seconds: float, seed: int = 0) -> tuple[list[tuple[float, bytes]], list[tuple[float, Direction]]]:
+    """
+    Build what the Nano would send for a user alternating between rest and holding a tilt
+
+    :param seconds: Length of the session
+    :param seed: Seed of the random rest and tilt lengths
+    :return: (time, command) sent, and (time, direction) of every change of direction
+    """
+    rng = random.Random(seed)
+    directions = [Direction.FORWARD, Direction.BACKWARD, Direction.LEFT, Direction.RIGHT]
+    commands = []
+    changes = []
+    now = 0.0
+    last_write = -HEARTBEAT_PERIOD
+
+    def send(at: float, command: bytes) -> None:
+        nonlocal last_write
+        # Heartbeats fill any gap longer than the heartbeat period, as nano_client sends them
+        while at - last_write > HEARTBEAT_PERIOD:
+            last_write += HEARTBEAT_PERIOD
+            commands.append((last_write, bytes(encode_heartbeat_cmd())))
+        commands.append((at, bytes(command)))
+        last_write = at
+
+    while now < seconds:
+        now += rng.uniform(0.5, 3.0)
+        direction = rng.choice(directions)
+        changes.append((now, direction))
+        end = min(now + rng.uniform(0.3, 4.0), seconds)
+        while now < end:
+            send(now, encode_move_cmd(direction, MOVE_DURATION))
+            now += REFRESH_PERIOD
+        changes.append((now, Direction.STOP))
+        send(now, encode_move_cmd(Direction.STOP, MOVE_DURATION))
+    send(seconds, encode_heartbeat_cmd())
+
+    return [sent for sent in commands if sent[0] < seconds], [change for change in changes if change[0] < seconds]
+
+
+def change_latencies(chair: SimulatedChair, changes: list[tuple[float, Direction]]) -> list[float]:
+    """
+    :param chair: Chair at the end of the session
+    :param changes: (time, direction) of every change of direction sent
+    :return: Seconds from each change being sent to the joystick position the chair sees changing to it
+    """
+    latencies = []
+    for sent, direction in changes:
+        position = SimulatedChair.joystick_position(bytes(value & 0xff for value in
+                                                          RNetController.DIRECTION_POSITIONS[direction]))
+        seen = next((at for at, x, y in chair.segments if at >= sent and (x, y) == position), None)
+        if seen is not None:
+            latencies.append(seen - sent)
+
+    return latencies
+
+
+def run(seconds: float = 600.0, seed: int = 0) -> dict:
+    """
+    Run the session twice and check both runs match
+
+    :param seconds: Length of the session in virtual time
+    :param seed: Seed of the session script
+    :return: Wall time, speed up, what the chair did and whether the runs matched
+    """
+    commands, changes = script(seconds, seed)
+
+    wall_start = time.perf_counter()
+    clock = VirtualClock()
+    chair = run_session(commands, seconds, clock=clock)
+    wall = time.perf_counter() - wall_start
+    again = run_session(commands, seconds)
+
+    latencies = change_latencies(chair, changes)
+    return {
+        "virtual_s": seconds,
+        "wall_s": wall,
+        "speedup": seconds / wall,
+        "commands": len(commands),
+        "frames": chair.frames,
+        "wake_ups": clock.wake_ups,
+        "moving_s": chair.moving_time(),
+        "change_latency_max_ms": max(latencies) * 1000,
+        "changes_missed": len(changes) - len(latencies),
+        "deterministic": int(chair.segments == again.segments and chair.pose() == again.pose()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a long session to a simulated chair on a virtual clock")
+    parser.add_argument("--seconds", type=float, default=600.0, help="Length of the session in virtual time")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the session script")
+    args = parser.parse_args()
+
+    for name, value in run(args.seconds, args.seed).items():
+        print(f"{name:>22}: {value:.3f}")
+
+
+if __name__ == "__main__":
+    main()
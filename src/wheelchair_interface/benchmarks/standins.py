@@ -0,0 +1,107 @@
+"""
+file: standins.py
+
+description: Local stand-ins for the can bus and UART so the pipeline can be benchmarked without hardware
+"""
+import os
+import pty
+import socket
+import threading
+import time
+import tty
+
+import serial
+
+from ..protocol.resources import BAUD_RATE
+from ..rnet_controller.RNetController import RNetController
+
+
+class RecordingSocket:
+    """
+    Stand-in can socket that timestamps every frame sent to it
+    """
+    def __init__(self):
+        self.frames = []
+
+    def send(self, frame: bytes, flags: int = 0) -> int:
+        self.frames.append((time.monotonic(), frame))
+        return len(frame)
+
+    def setblocking(self, flag: bool) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SocketpairCan:
+    """
+    Can bus stand-in backed by a datagram socketpair, so sends go through a real kernel socket.
+
+    The controller writes to one end and a reader thread timestamps every frame arriving at the other.
+    """
+    def __init__(self):
+        self.controller_socket, self._bus_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.frames = []
+        self._reader = threading.Thread(target=self.__read, daemon=True)
+        self._reader.start()
+
+    def __read(self) -> None:
+        """
+        Body of the reader thread
+        """
+        frame_size = RNetController.CAN_FRAME.size
+        while True:
+            try:
+                frame = self._bus_socket.recv(frame_size)
+            except OSError:
+                return
+            if not frame:
+                return
+            self.frames.append((time.monotonic(), frame))
+
+    def close(self) -> None:
+        """
+        Close both ends of the stand-in
+        """
+        self.controller_socket.close()
+        self._bus_socket.close()
+
+
+def open_can(vcan: int = None):
+    """
+    Open a can stand-in for a controller
+
+    :param vcan: Bus number of a vcan interface to use instead of a socketpair, frames are then not recorded
+    :return: (socket to give the controller, stand-in or None for vcan)
+    """
+    if vcan is None:
+        can = SocketpairCan()
+        return can.controller_socket, can
+
+    return RNetController._open_connection(vcan), None
+
+
+def open_uart() -> tuple[int, serial.Serial]:
+    """
+    Open a pty pair standing in for the Nano to Pi UART
+
+    :return: (file descriptor of the Nano end, serial device of the Pi end)
+    """
+    nano_end, pi_end = pty.openpty()
+    # Raw mode so bytes such as 0x0a are passed through untouched
+    tty.setraw(nano_end)
+    tty.setraw(pi_end)
+
+    return nano_end, serial.Serial(os.ttyname(pi_end), BAUD_RATE)
+
+
+class PtyWriter:
+    """
+    Serial device stand-in for the Nano end of a pty pair
+    """
+    def __init__(self, fd: int):
+        self._fd = fd
+
+    def write(self, data: bytes) -> int:
+        return os.write(self._fd, data)
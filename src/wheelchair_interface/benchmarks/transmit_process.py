@@ -0,0 +1,100 @@
+"""
+file: transmit_process.py
+
+description: Send jitter of setpoint streaming in-process against a dedicated transmit process, with the GIL under load
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+
+from ..rnet_controller.RNetController import RNetController
+
+
+def busy(stop: threading.Event) -> None:
+    """
+    Pure python work standing in for the serial reader, logging and dispatcher competing for the GIL
+
+    :param stop: Set to end the work
+    """
+    message = {"direction": "forward", "duration": 0.25, "sequence": list(range(32))}
+    while not stop.is_set():
+        json.loads(json.dumps(message))
+
+
+def run_mode(transport: str, seconds: float, load_threads: int, cpu: int = None, fifo_priority: int = None) -> dict:
+    """
+    Stream setpoints for a while with busy threads running and collect the send jitter
+
+    :param transport: RNetController.TRANSPORT_RAW or RNetController.TRANSPORT_PROCESS
+    :param seconds: Time to stream for
+    :param load_threads: Busy threads to run next to the stream
+    :param cpu: CPU to pin the transmit process to
+    :param fifo_priority: SCHED_FIFO priority of the transmit process
+    :return: Frames, missed deadlines and jitter (microseconds) as measured by the sender
+    """
+    # Nobody reads the other end, its queue easily holds the few hundred frames of a run
+    can_socket, bus_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    bus_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    controller = RNetController(transport=transport, can_socket=can_socket, transmit_cpu=cpu,
+                                fifo_priority=fifo_priority)
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=busy, args=(stop,), daemon=True) for _ in range(load_threads)]
+    for thread in threads:
+        thread.start()
+
+    # Refresh the setpoint the way a producer would, well inside the hold timeout
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        controller.set_setpoint(0, 50)
+        time.sleep(0.05)
+
+    stats = controller.transmit_stats
+    stop.set()
+    for thread in threads:
+        thread.join()
+    controller.close()
+    bus_socket.close()
+
+    return {
+        "frames": stats.frames,
+        "missed_deadlines": stats.missed_deadlines,
+        "mean_jitter_us": stats.mean_jitter * 1e6,
+        "max_jitter_us": stats.max_jitter * 1e6,
+    }
+
+
+def run(seconds: float = 2.0, load_threads: int = 2, cpu: int = None, fifo_priority: int = None) -> dict:
+    """
+    Compare the in-process setpoint stream with the transmit process
+
+    :param seconds: Time to stream for in each mode
+    :param load_threads: Busy threads to run next to the stream
+    :param cpu: CPU to pin the transmit process to
+    :param fifo_priority: SCHED_FIFO priority of the transmit process
+    :return: Results of each mode keyed by transport
+    """
+    return {
+        RNetController.TRANSPORT_RAW: run_mode(RNetController.TRANSPORT_RAW, seconds, load_threads),
+        RNetController.TRANSPORT_PROCESS: run_mode(RNetController.TRANSPORT_PROCESS, seconds, load_threads, cpu,
+                                                   fifo_priority),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process and transmit process send jitter")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Time to stream for in each mode")
+    parser.add_argument("--load", type=int, default=2, help="Busy threads competing for the GIL")
+    parser.add_argument("--cpu", type=int, help="CPU to pin the transmit process to")
+    parser.add_argument("--fifo", type=int, help="SCHED_FIFO priority of the transmit process")
+    args = parser.parse_args()
+
+    for transport, results in run(args.seconds, args.load, args.cpu, args.fifo).items():
+        print(f"{transport:>8}: frames={results['frames']:<5} missed={results['missed_deadlines']:<4} "
+              f"mean={results['mean_jitter_us']:8.1f}us max={results['max_jitter_us']:8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+file: transports.py
+
+description: Latency of one command from the Nano end to the Pi end of each transport
+
+note:
+    - A pty stands in for the UART, it does not add the time the bytes take on the wire, which is printed alongside
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from .standins import PtyWriter, open_uart
+from ..clientserver.pi_server import read_commands
+from ..clientserver.transport import open_receiver, open_sender
+from ..protocol.parser import FrameParser
+from ..protocol.processor import encode_move_cmd
+from ..protocol.resources import *
+
+
+UART_WIRE_US = PROTOCOL_LENGTH * 10 / BAUD_RATE * 1e6
+""" Microseconds a command takes on the wire at BAUD_RATE, 8N1 framing is 10 bits a byte """
+
+
+def measure(sender, receiver, commands: int, period: float) -> np.ndarray:
+    """
+    Write commands one at a time and time each to the moment pi_server's reader would have it
+
+    :param sender: Nano end of the link
+    :param receiver: Pi end of the link
+    :param commands: Number of commands to time
+    :param period: Seconds between commands
+    :return: Latency of every command (microseconds)
+    """
+    arrivals = []
+    done = threading.Event()
+
+    def read() -> None:
+        parser = FrameParser()
+        while len(arrivals) < commands:
+            for _ in read_commands(receiver, parser):
+                arrivals.append(time.perf_counter())
+        done.set()
+
+    threading.Thread(target=read, daemon=True).start()
+
+    command = bytes(encode_move_cmd(Direction.FORWARD, 0.1))
+    sent = []
+    for _ in range(commands):
+        sent.append(time.perf_counter())
+        sender.write(command)
+        time.sleep(period)
+    done.wait(5)
+
+    return (np.array(arrivals[:len(sent)]) - np.array(sent[:len(arrivals)])) * 1e6
+
+
+def run(commands: int = 500, period: float = 0.002) -> dict:
+    """
+    Time commands over every transport
+
+    :param commands: Commands to time on each transport
+    :param period: Seconds between commands
+    :return: p50, p99 and max latency (microseconds) keyed by transport
+    """
+    directory = tempfile.mkdtemp()
+    links = {
+        "tcp": "tcp:127.0.0.1:18170",
+        "unix": f"unix:{os.path.join(directory, 'pi.sock')}",
+        "shm": f"shm:nxt_bench_{os.getpid()}",
+    }
+
+    results = {}
+    nano_end, pi_serial = open_uart()
+    latencies = measure(PtyWriter(nano_end), pi_serial, commands, period)
+    results["uart_pty"] = {"p50_us": float(np.percentile(latencies, 50)), "p99_us": float(np.percentile(latencies, 99)),
+                           "max_us": float(latencies.max()), "wire_us": UART_WIRE_US}
+
+    for name, spec in links.items():
+        receiver = open_receiver(spec)
+        sender = open_sender(spec)
+        latencies = measure(sender, receiver, commands, period)
+        sender.close()
+        results[name] = {"p50_us": float(np.percentile(latencies, 50)), "p99_us": float(np.percentile(latencies, 99)),
+                         "max_us": float(latencies.max())}
+        if name == "shm":
+            # The other transports are left to the reader threads, which block until the process exits
+            receiver.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the latency of each Nano to Pi transport")
+    parser.add_argument("--commands", type=int, default=500, help="Commands to time on each transport")
+    args = parser.parse_args()
+
+    for name, results in run(args.commands).items():
+        wire = f" + {results['wire_us']:.0f}us on the wire" if "wire_us" in results else ""
+        print(f"{name:>9}: p50={results['p50_us']:8.1f}us p99={results['p99_us']:8.1f}us "
+              f"max={results['max_us']:8.1f}us{wire}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+file: tx_backpressure.py
+
+description: Drive frames delivered through a congested transmit queue, dropping on a full queue against backing off
+"""
+import argparse
+import errno
+import threading
+import time
+
+from ..protocol.resources import Direction
+from ..rnet_controller.FrameSender import FrameSender
+from ..rnet_controller.PeriodicTransmitter import PeriodicTransmitter
+from ..rnet_controller.RNetController import RNetController
+
+
+class CongestedQueue:
+    """
+    Stand-in can socket with a bounded interface queue drained at the bus rate, full queues raise ENOBUFS like a can
+    interface does once txqueuelen frames are waiting
+    """
+    def __init__(self, capacity: int, drain_period: float):
+        """
+        Constructor for an empty queue
+
+        :param capacity: Frames the queue holds, as txqueuelen
+        :param drain_period: Seconds the bus takes to send one frame
+        """
+        self._capacity = capacity
+        self._drain_period = drain_period
+        self._waiting = 0
+        self._drained_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.frames = []
+        """ (time queued, frame) of every frame accepted """
+
+    def send(self, frame: bytes, flags: int = 0) -> int:
+        with self._lock:
+            now = time.monotonic()
+            drained = int((now - self._drained_at) / self._drain_period)
+            if drained:
+                self._waiting = max(0, self._waiting - drained)
+                self._drained_at += drained * self._drain_period
+            if self._waiting >= self._capacity:
+                raise OSError(errno.ENOBUFS, "No buffer space available")
+
+            self._waiting += 1
+            self.frames.append((now, frame))
+
+        return len(frame)
+
+
+def flood(queue: CongestedQueue, stop: threading.Event, burst: float, every: float) -> None:
+    """
+    Other traffic filling the queue for a while at regular intervals
+
+    :param queue: Queue to fill
+    :param stop: Set to end the flood
+    :param burst: Seconds each burst lasts
+    :param every: Seconds from the start of one burst to the next
+    """
+    other = RNetController.speed_frame(50)
+    while not stop.is_set():
+        end = time.monotonic() + burst
+        while time.monotonic() < end:
+            try:
+                queue.send(other)
+            except OSError:
+                time.sleep(0.0001)
+        stop.wait(every - burst)
+
+
+def run_mode(backoff: bool, seconds: float, period: float, capacity: int, drain_period: float) -> dict:
+    """
+    Drive forward through a flooded queue, then stop
+
+    :param backoff: Whether frames go through a FrameSender rather than being dropped on a full queue
+    :param seconds: Time to drive for
+    :param period: Seconds between drive frames
+    :param capacity: Frames the queue holds
+    :param drain_period: Seconds the bus takes to send one frame
+    :return: Drive frames delivered, the longest gap between them (ms), whether the stop frame was delivered and the
+        sender counters
+    """
+    queue = CongestedQueue(capacity, drain_period)
+    stop_flood = threading.Event()
+    flooder = threading.Thread(target=flood, args=(queue, stop_flood, 0.03, 0.1), daemon=True)
+    flooder.start()
+
+    sender = FrameSender(queue, period, RNetController.STOP_FRAME_BYTES)
+    dropped = 0
+
+    def drop_on_full(frame: bytes) -> bool:
+        nonlocal dropped
+        try:
+            queue.send(frame)
+            return True
+        except OSError:
+            dropped += 1
+            return False
+
+    send = sender.send if backoff else drop_on_full
+    forward = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.FORWARD])
+    PeriodicTransmitter(send, period).transmit_seconds(forward, seconds)
+    # The stop is sent in the middle of a burst, where it is most likely to be lost
+    time.sleep(0.01)
+    send(RNetController.STOP_FRAME_BYTES)
+    stop_flood.set()
+    flooder.join()
+
+    arrivals = [queued for queued, frame in queue.frames if frame == forward]
+    gaps = [(second - first) * 1000 for first, second in zip(arrivals, arrivals[1:])]
+
+    return {
+        "drive_frames": len(arrivals),
+        "max_frame_gap_ms": max(gaps) if gaps else 0.0,
+        "stop_delivered": int(any(frame == RNetController.STOP_FRAME_BYTES for _, frame in queue.frames)),
+        "dropped": sender.stats.dropped if backoff else dropped,
+        "retried": sender.stats.retried,
+        "blocked_ms": sender.stats.blocked_time * 1000,
+    }
+
+
+def run(seconds: float = 1.0, period: float = 0.01, capacity: int = 10, drain_period: float = 0.0005) -> dict:
+    """
+    Compare dropping frames on a full queue with backing off
+
+    :param seconds: Time to drive for
+    :param period: Seconds between drive frames
+    :param capacity: Frames the queue holds
+    :param drain_period: Seconds the bus takes to send one frame
+    :return: Results of each mode keyed by "drop" and "backoff"
+    """
+    return {
+        "drop": run_mode(False, seconds, period, capacity, drain_period),
+        "backoff": run_mode(True, seconds, period, capacity, drain_period),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure sending through a congested transmit queue")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Time to drive for")
+    parser.add_argument("--capacity", type=int, default=10, help="Frames the interface queue holds")
+    args = parser.parse_args()
+
+    for name, results in run(args.seconds, capacity=args.capacity).items():
+        print(f"{name:>8}: drive frames={results['drive_frames']:<4} max gap={results['max_frame_gap_ms']:6.1f}ms "
+              f"stop delivered={bool(results['stop_delivered'])} dropped={results['dropped']:<4} "
+              f"retried={results['retried']:<5} blocked={results['blocked_ms']:6.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
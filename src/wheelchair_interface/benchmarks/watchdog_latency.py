@@ -0,0 +1,64 @@
+"""
+file: watchdog_latency.py
+
+description: Measures the time from losing the Nano link to the first stop frame, using a pty as the UART
+"""
+import os
+import threading
+import time
+
+from .standins import RecordingSocket, open_uart
+from ..clientserver import pi_server
+from ..protocol.processor import encode_heartbeat_cmd, encode_move_cmd
+from ..protocol.resources import *
+from ..rnet_controller.RNetController import RNetController
+
+
+def measure(window: float = WATCHDOG_WINDOW, heartbeats: int = 20, repeats: int = 5) -> list[float]:
+    """
+    Drive forward, keep the link alive with heartbeats, then go silent and time the stop
+
+    :param window: Watchdog window given to the server
+    :param heartbeats: Heartbeats sent before each simulated link loss
+    :param repeats: Number of link losses to measure
+    :return: Seconds from the last heartbeat written to the first stop frame, one per repeat
+    """
+    controller_socket = RecordingSocket()
+    controller = RNetController(can_socket=controller_socket)
+
+    master, serial_device = open_uart()
+    threading.Thread(target=pi_server.serve, args=(controller, serial_device, window), daemon=True).start()
+
+    results = []
+    for _ in range(repeats):
+        os.write(master, encode_move_cmd(Direction.FORWARD, 60))
+        for sequence in range(heartbeats):
+            time.sleep(HEARTBEAT_PERIOD)
+            os.write(master, encode_heartbeat_cmd(sequence))
+        link_lost = time.monotonic()
+
+        # Wait for the watchdog to stop the chair
+        time.sleep(window * 3)
+        stop_times = [sent for sent, frame in controller_socket.frames
+                      if sent > link_lost and frame == RNetController.STOP_FRAME_BYTES]
+        if not stop_times:
+            raise RuntimeError("Watchdog did not stop the chair")
+
+        stop_time = min(stop_times)
+        results.append(stop_time - link_lost)
+        time.sleep(window)
+
+    # The pty is left open as the server thread keeps reading from it until the process exits
+    return results
+
+
+def main():
+    window = WATCHDOG_WINDOW
+    results = measure(window)
+    print(f"watchdog window: {window * 1000:.1f} ms, frame period: {RNetController.FRAME_PERIOD * 1000:.1f} ms")
+    for latency in results:
+        print(f"link loss to stop frame: {latency * 1000:7.2f} ms (window + {(latency - window) * 1000:5.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,67 +5,431 @@ description: This program is a socket server and uart client which translates so
 
 author: Matt London
 """
+import asyncio
+import os
 import serial
 import socket
-import pickle
 import logging
 
-from ..protocol.processor import encode_move_cmd
+from time import monotonic, perf_counter
+
+from ..eventlog import EVENTS
+from ..metrics import METRICS, COUNTER
+from ..protocol.coalescer import Coalescer
+from ..protocol.parser import FrameParser
+from ..protocol.processor import decode_move_cmd, decode_setpoint_cmd, decode_trace_cmd, encode_heartbeat_cmd, \
+    encode_move_cmd, encode_trace_cmd, is_setpoint_cmd, is_trace_cmd, InvalidCmdException
 from ..protocol.resources import *
+from ..startup import STARTUP
+from .transport import open_sender
+from ..tracing import TRACER, HOP_SOCKET_RECEIVE, HOP_UART_WRITE
+
+
+DECODE_FAILURES = METRICS.counter("nxt_nano_decode_failures_total", "Commands from producers which failed to decode")
+CONNECTIONS = METRICS.counter("nxt_nano_connections_total", "Producer connections accepted")
+WRITE_SECONDS = METRICS.histogram("nxt_nano_write_seconds", "Time each write of a command to the link took")
 
 
-def send_command(command: bytearray, serial_device: serial.Serial) -> None:
+def send_command(command: bytes, serial_device: serial.Serial) -> None:
     """
     Sends a command to the chair
 
     :param command: Bytes to send
     :param serial_device: Device to send the command to
     """
+    start = perf_counter()
     serial_device.write(command)
-    logging.info("Command sent successfully.")
+    WRITE_SECONDS.observe(perf_counter() - start)
+    EVENTS.info("Command sent successfully.")
 
 
-def process_data(data: bytes, serial_device: serial.Serial) -> None:
+class Producer:
     """
-    Process the data received over the socket
-
-    :param data: Bytes from the socket
-    :param serial_device: Serial device to send move command
+    State kept for one connected producer
     """
-    direction, duration = pickle.loads(data)
+    def __init__(self, priority: int):
+        """
+        Constructor for a newly connected producer
 
-    # Convert back from an int
-    direction = Direction(direction)
-    logging.info(f"Received data: {data}")
-    cmd = encode_move_cmd(direction, duration)
-    cmd.append(ord('\n'))
-    logging.info(f"Sending command: {cmd}...")
-    send_command(cmd, serial_device)
+        :param priority: Priority of the listener the producer connected to
+        """
+        self.priority = priority
+        self.parser = FrameParser()
+        self.trace_id = None
+        """ Trace id tagging the next command from this producer """
 
 
-def main():
+class CommandHub:
     """
-    Main function responsible for sending the move commands to the wheelchair
+    Accepts commands from any number of producers at once and arbitrates which reach the chair.
+
+    A command holds the chair for its duration at the priority of the connection it came from, commands from lower
+    priority connections are dropped until it expires. STOP is always accepted and holds the chair at override
+    priority. A single writer task sends to the serial device, accepted commands that arrive while it is busy
+    replace the one waiting to be written, so the UART only carries the newest. When nothing has been written for a
+    heartbeat period a heartbeat is written instead, which keeps the watchdog on the Pi from stopping the chair. If
+    the producer whose command holds the chair disconnects, a stop is written straight away rather than the
+    heartbeats keeping the chair driving until the command runs out.
+
+    Moves in the same direction as the drive in progress are merged into it rather than written. Shortly before the
+    written drive runs out a single move covering the rest of the merged drive is written, which the Pi merges into
+    its running drive in turn.
     """
-    with serial.Serial(NANO_DEVICE, BAUD_RATE, timeout=1) as serial_device, \
-            socket.socket(socket.AF_INET, socket.SOCK_STREAM) as socket_device:
-        logging.info(f"Opening socket connection on: {SOCKET_HOST}:{SOCKET_PORT}")
-        socket_device.bind((SOCKET_HOST, SOCKET_PORT))
-        socket_device.listen(1)
+    def __init__(self, serial_device: serial.Serial, heartbeat_period: float = HEARTBEAT_PERIOD,
+                 coalesce: bool = True):
+        """
+        Constructor for a hub
+
+        :param serial_device: Device to write accepted commands to
+        :param heartbeat_period: Seconds of silence on the UART before a heartbeat is written, None to disable
+        :param coalesce: Whether to merge moves continuing the drive in progress
+        """
+        self._serial_device = serial_device
+        self._servers = []
+        self._pending = None
+        self._wakeup = asyncio.Event()
+        self._heartbeat_period = heartbeat_period
+        self._heartbeat_due = False
+        self._last_write = 0.0
+
+        self._coalescer = Coalescer() if coalesce else None
+        self._extension = asyncio.Event()
+        self._written_direction = None
+        self._written_until = 0.0
+
+        self._owner_priority = PRIORITY_NORMAL
+        self._owner_until = 0.0
+        self._owner = None
+        """ Producer whose command holds the chair, None if it was a stop or came from no producer """
+
+        self.received = 0
+        """ Number of valid commands received from producers """
+
+        self.rejected = 0
+        """ Number of commands dropped because a higher priority command held the chair """
+
+        self.coalesced = 0
+        """ Number of accepted commands replaced by a newer one before being written """
+
+        self.written = 0
+        """ Number of commands written to the serial device """
+
+        self.extensions = 0
+        """ Number of moves written to carry on a drive other moves were merged into """
+
+        self.heartbeats = 0
+        """ Number of heartbeats written to the serial device """
+
+        self.releases = 0
+        """ Number of stops written because the producer whose command held the chair disconnected """
+
+    def submit(self, command: bytes, duration: float, priority: int, stop: bool = False, trace_id: int = None,
+               direction: Direction = None, producer: Producer = None) -> bool:
+        """
+        Arbitrate a decoded command and queue it for the writer if accepted
+
+        :param command: Encoded command
+        :param duration: Seconds the command holds the chair for
+        :param priority: Priority of the producer
+        :param stop: Whether the command stops the chair
+        :param trace_id: Optional trace id the command is tagged with
+        :param direction: Direction of a move, None for other commands
+        :param producer: Producer the command came from, stopped for if it disconnects while the command holds
+        :return: Whether the command was accepted
+        """
+        now = monotonic()
+        self.received += 1
+
+        if stop:
+            priority = max(priority, PRIORITY_OVERRIDE)
+        elif priority < self._owner_priority and now < self._owner_until:
+            self.rejected += 1
+            return False
+
+        self._owner_priority = priority
+        self._owner_until = now + duration
+        self._owner = None if stop else producer
+
+        if self._coalescer is not None:
+            if direction is None:
+                self._coalescer.reset()
+            elif self._coalescer.offer(direction, duration):
+                # The extension is written shortly before the drive already written runs out
+                self._extension.set()
+                return True
+
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = (command, trace_id, direction, now + duration)
+        self._wakeup.set()
+
+        return True
+
+    def release(self, producer: Producer) -> bool:
+        """
+        Stop the chair for a producer which disconnected, if its command still holds the chair. Heartbeats would
+        otherwise keep the Pi's watchdog fed and the chair driving until the command runs out.
+
+        :param producer: Producer which disconnected
+        :return: Whether a stop was queued
+        """
+        now = monotonic()
+        if self._owner is not producer or now >= self._owner_until:
+            return False
+
+        # Other producers can take over straight away, unlike after a stop they sent
+        self._owner = None
+        self._owner_priority = PRIORITY_NORMAL
+        self._owner_until = 0.0
+        if self._coalescer is not None:
+            self._coalescer.reset()
+
+        if self._pending is not None:
+            self.coalesced += 1
+        # Held for a watchdog window, as the Pi holds its own stop, so the chair settles
+        self._pending = (bytes(encode_move_cmd(Direction.STOP, WATCHDOG_WINDOW)), None, Direction.STOP,
+                         now + WATCHDOG_WINDOW)
+        self.releases += 1
+        self._wakeup.set()
+
+        return True
+
+    def process_data(self, data: bytes, producer: Producer) -> int:
+        """
+        Process the data received over a socket, which may hold any number of commands or part of one
+
+        :param data: Bytes from the socket
+        :param producer: Producer the data came from, holding any partial command from earlier data
+        :return: Number of commands accepted
+        """
+        accepted = 0
+        for cmd in producer.parser.feed(data):
+            try:
+                if is_trace_cmd(cmd):
+                    producer.trace_id = decode_trace_cmd(cmd)
+                    TRACER.mark(producer.trace_id, HOP_SOCKET_RECEIVE)
+                    continue
+
+                trace_id, producer.trace_id = producer.trace_id, None
+                if is_setpoint_cmd(cmd):
+                    x, y = decode_setpoint_cmd(cmd)
+                    # A stream holds the chair for as long as the Pi holds a setpoint without an update
+                    accepted += self.submit(cmd, SETPOINT_HOLD_TIMEOUT, producer.priority, (x, y) == (0, 0), trace_id,
+                                            producer=producer)
+                else:
+                    direction, duration = decode_move_cmd(cmd)
+                    accepted += self.submit(cmd, duration, producer.priority, direction == Direction.STOP, trace_id,
+                                            direction, producer)
+
+            except InvalidCmdException as e:
+                EVENTS.error("%s", e.message)
+                DECODE_FAILURES.inc()
+
+        return accepted
+
+    def register_metrics(self) -> None:
+        """
+        Expose the hub's counters, they are read when the metrics are rendered
+        """
+        for name, help_text in (("received", "Valid commands received from producers"),
+                                ("rejected", "Commands dropped as a higher priority command held the chair"),
+                                ("coalesced", "Accepted commands replaced by a newer one before being written"),
+                                ("written", "Commands written to the link"),
+                                ("extensions", "Moves written to carry on a drive other moves were merged into"),
+                                ("heartbeats", "Heartbeats written to the link"),
+                                ("releases", "Stops written as the producer holding the chair disconnected")):
+            METRICS.function(f"nxt_nano_{name}_total", help_text, lambda name=name: getattr(self, name), COUNTER)
+
+    async def _writer(self) -> None:
+        """
+        Write the newest accepted command to the serial device whenever there is one, or a heartbeat when due
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            pending, self._pending = self._pending, None
+            trace_id = None
+            if pending is None:
+                if not self._heartbeat_due:
+                    continue
+                command = encode_heartbeat_cmd(self.heartbeats)
+                self.heartbeats += 1
+            else:
+                command, trace_id, self._written_direction, self._written_until = pending
+                if trace_id is not None:
+                    # Pass the tag on so the Pi can carry on the trace
+                    command = encode_trace_cmd(trace_id) + command
+                self.written += 1
+            self._heartbeat_due = False
+
+            if trace_id is not None:
+                TRACER.mark(trace_id, HOP_UART_WRITE)
 
+            # The serial write blocks, keep the loop free to accept commands in the meantime
+            await loop.run_in_executor(None, send_command, command, self._serial_device)
+            self._last_write = monotonic()
+
+    async def _extend(self) -> None:
+        """
+        Write a move carrying on the drive in progress shortly before the written part of it runs out
+        """
         while True:
-            logging.info("Waiting for connection...")
-            conn, addr = socket_device.accept()
-            logging.info(f"Connection from {addr}.")
-
-            with conn:
-                while True:
-                    logging.info("Listening for command...")
-                    data = conn.recv(1024)
-                    if not data:
-                        break
-
-                    process_data(data, serial_device)
+            await self._extension.wait()
+
+            wait = self._written_until - COALESCE_REFRESH_LEAD - monotonic()
+            if wait > 0:
+                # Checked again afterwards, a newer command may have been written in the meantime
+                await asyncio.sleep(wait)
+                continue
+            self._extension.clear()
+
+            direction = self._coalescer.direction
+            remaining = self._coalescer.remaining()
+            if self._pending is None and direction == self._written_direction and \
+                    remaining * 1000 >= MIN_MILLISECONDS:
+                command = bytes(encode_move_cmd(direction, remaining))
+                # The encoding may round the duration down, the Pi drives for what it decodes
+                _, duration = decode_move_cmd(command)
+                self._pending = (command, None, direction, monotonic() + duration)
+                self.extensions += 1
+                self._wakeup.set()
+
+    async def _heartbeat(self) -> None:
+        """
+        Ask the writer for a heartbeat whenever the UART has been quiet for a heartbeat period
+        """
+        while True:
+            remaining = self._last_write + self._heartbeat_period - monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+                continue
+
+            self._heartbeat_due = True
+            self._wakeup.set()
+            await asyncio.sleep(self._heartbeat_period)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 priority: int) -> None:
+        """
+        Read commands from a single producer until it disconnects
+
+        :param reader: Stream from the producer
+        :param writer: Stream to the producer, only used to close the connection
+        :param priority: Priority of the listener the producer connected to
+        """
+        peer = writer.get_extra_info("peername") or "unix socket"
+        logging.info(f"Connection from {peer} at priority {priority}.")
+        CONNECTIONS.inc()
+
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        producer = Producer(priority)
+        try:
+            while data := await reader.read(4096):
+                self.process_data(data, producer)
+
+        except ConnectionError:
+            pass
+
+        finally:
+            if self.release(producer):
+                logging.info(f"Connection from {peer} closed while its command held the chair, stopping.")
+            else:
+                logging.info(f"Connection from {peer} closed.")
+            writer.close()
+
+    def _handler(self, priority: int):
+        """
+        :param priority: Priority given to producers on a listener
+        :return: Connection callback for asyncio servers
+        """
+        async def handle(reader, writer):
+            await self._handle_connection(reader, writer, priority)
+
+        return handle
+
+    async def listen_tcp(self, host: str, port: int, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        Accept producers on a TCP address
+
+        :param host: Host to bind to
+        :param port: Port to bind to
+        :param priority: Priority given to producers connecting here
+        """
+        logging.info(f"Opening socket connection on: {host}:{port}")
+        self._servers.append(await asyncio.start_server(self._handler(priority), host, port))
+
+    async def listen_unix(self, path: str, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        Accept producers on a Unix domain socket
+
+        :param path: Filesystem path of the socket, a stale one is replaced
+        :param priority: Priority given to producers connecting here
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+
+        logging.info(f"Opening unix socket on: {path}")
+        self._servers.append(await asyncio.start_unix_server(self._handler(priority), path))
+
+    async def serve(self) -> None:
+        """
+        Run the writer and every listener until cancelled
+        """
+        tasks = [asyncio.create_task(self._writer())]
+        if self._heartbeat_period is not None:
+            tasks.append(asyncio.create_task(self._heartbeat()))
+        if self._coalescer is not None:
+            tasks.append(asyncio.create_task(self._extend()))
+
+        try:
+            await asyncio.gather(*tasks, *(server.serve_forever() for server in self._servers))
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            for server in self._servers:
+                server.close()
+
+
+async def serve(serial_device: serial.Serial, host: str = SOCKET_HOST, port: int = SOCKET_PORT,
+                override_port: int = SOCKET_OVERRIDE_PORT, unix_path: str = SOCKET_UNIX_PATH,
+                coalesce: bool = True) -> None:
+    """
+    Run the command hub on the given listeners
+
+    :param serial_device: Device to write commands to
+    :param host: Address to accept producers on
+    :param port: Port for producers of normal priority
+    :param override_port: Port for producers which override the others
+    :param unix_path: Unix domain socket for producers of normal priority, None to not listen on one
+    :param coalesce: Whether moves continuing the current drive are merged into it
+    """
+    hub = CommandHub(serial_device, coalesce=coalesce)
+    hub.register_metrics()
+    await hub.listen_tcp(host, port, PRIORITY_NORMAL)
+    await hub.listen_tcp(host, override_port, PRIORITY_OVERRIDE)
+    if unix_path is not None:
+        await hub.listen_unix(unix_path, PRIORITY_NORMAL)
+    STARTUP.ready()
+    await hub.serve()
+
+
+def main(device: str = NANO_DEVICE, baud_rate: int = BAUD_RATE, **kwargs):
+    """
+    Main function responsible for sending the move commands to the wheelchair
+
+    :param device: Serial device to write commands to, or a transport spec such as "unix:/tmp/nxt_pi.sock"
+    :param baud_rate: Baud rate of the serial device
+    :param kwargs: Passed on to serve
+    """
+    with open_sender(device, baud_rate) as serial_device:
+        STARTUP.mark("link_open")
+        asyncio.run(serve(serial_device, **kwargs))
 
 
 if __name__ == "__main__":
@@ -10,55 +10,330 @@ import serial
 import threading
 import logging
 import queue
+
+from time import perf_counter
+
+from ..clock import Clock, SYSTEM_CLOCK
 from ..rnet_controller.RNetController import RNetController
-from ..protocol.processor import decode_move_cmd, InvalidCmdException
+from ..protocol.coalescer import Coalescer
+from ..protocol.parser import FrameParser
+from .transport import open_receiver
+from .watchdog import Watchdog
+from ..protocol.processor import decode_move_cmd, decode_setpoint_cmd, decode_trace_cmd, encode_move_cmd, \
+    is_heartbeat_cmd, is_setpoint_cmd, is_trace_cmd, InvalidCmdException
 from ..protocol.resources import *
+from .. import recording
+from ..eventlog import EVENTS
+from ..metrics import METRICS, COUNTER
+from ..recording import RECORDER, KIND_UART
+from ..startup import STARTUP
+from ..tracing import TRACER, HOP_DEQUEUE, HOP_UART_DECODE
+
 
+COMMANDS_RECEIVED = METRICS.counter("nxt_pi_commands_total", "Commands received from the Nano", kind="command")
+HEARTBEATS_RECEIVED = METRICS.counter("nxt_pi_commands_total", "Commands received from the Nano", kind="heartbeat")
+TRACES_RECEIVED = METRICS.counter("nxt_pi_commands_total", "Commands received from the Nano", kind="trace")
+DECODE_FAILURES = METRICS.counter("nxt_pi_decode_failures_total", "Commands which failed to decode")
+SERIAL_READ_SECONDS = METRICS.histogram("nxt_pi_serial_read_seconds",
+                                        "Time each read of the link blocked for, the gaps between bursts of bytes")
+CONNECT_ATTEMPTS = METRICS.counter("nxt_pi_connect_attempts_total", "Attempts to connect to the can bus")
 
-def process_command(controller: RNetController, command: bytearray) -> bool:
+
+def process_command(controller: RNetController, command: bytearray, cancel: threading.Event = None) -> bool:
     """
     This will decide what needs to be run and send it to the correct function to send to the chair
 
     :param controller: Interface to the wheelchair
     :param command: The command to be processed by the wheelchair
+    :param cancel: Event which preempts the resulting motion as soon as it is set
     :return: If it could be processed and ran successfully
     """
     try:
+        if is_setpoint_cmd(command):
+            # Setpoints only update what the stream sends, so they return straight away
+            x, y = decode_setpoint_cmd(command)
+            controller.set_setpoint(x, y)
+            return True
+
         direction, duration = decode_move_cmd(command)
-        controller.drive_direction_seconds(direction, duration)
+        # A move takes over from any setpoint stream
+        controller.stop_setpoint_stream()
+        controller.drive_direction_seconds(direction, duration, cancel)
         return True
 
     except InvalidCmdException as e:
-        logging.error(e.message)
+        EVENTS.error("%s", e.message)
+        DECODE_FAILURES.inc()
         return False
 
 
-def process_commands(controller: RNetController, command_queue: queue.Queue):
+class CommandDispatcher:
     """
-    Threaded function to pop commands and process them
+    Runs received commands on the controller from a single thread.
+
+    The thread blocks on the queue while idle. Submitting a command preempts the motion currently running
+    within one frame period, and only the latest of any commands queued behind it is run (latest wins). A move in
+    the same direction as the running motion extends it instead, so the frames carry on without a gap and nothing
+    is handed to the thread.
+    """
+    def __init__(self, controller: RNetController, coalesce: bool = True, clock: Clock = SYSTEM_CLOCK):
+        """
+        Constructor for a dispatcher
+
+        :param controller: Interface to the wheelchair
+        :param coalesce: Whether to merge moves continuing the running motion into it
+        :param clock: Clock the controller runs on
+        """
+        self._controller = controller
+        self._clock = clock
+        self._coalescer = Coalescer(clock) if coalesce else None
+        self._queue = queue.Queue()
+        # Set by every submission, so waiting on it is waiting for the queue to fill
+        self._preempt = clock.event()
+        # Keeps a submission's put and preempt together so the dispatcher can not clear a preempt it has not seen
+        self._lock = threading.Lock()
+
+        self.dropped = 0
+        """ Number of stale commands discarded because a newer one arrived """
+
+        self.merged = 0
+        """ Number of moves merged into the running motion """
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        :return: Number of commands waiting for the dispatcher thread
+        """
+        return self._queue.qsize()
+
+    def submit(self, command: bytearray, trace_id: int = None) -> None:
+        """
+        Queue a command and preempt whatever is running, unless it only extends the running motion
+
+        :param command: Raw command received over the wire
+        :param trace_id: Optional trace id the command is tagged with
+        """
+        if self._coalescer is not None and self._merge(command):
+            return
+
+        with self._lock:
+            self._queue.put((command, trace_id))
+            self._preempt.set()
+
+    def _merge(self, command: bytearray) -> bool:
+        """
+        Extend the running motion with a move in the same direction
+
+        :param command: Raw command received over the wire
+        :return: Whether the command was merged, if not it has to be queued
+        """
+        if is_setpoint_cmd(command):
+            self._coalescer.reset()
+            return False
+
+        try:
+            direction, duration = decode_move_cmd(command)
+        except InvalidCmdException:
+            # Reported when the dispatcher runs it
+            return False
+
+        # The coalescer may think the motion is running when it has only been queued or has just ended
+        if self._coalescer.offer(direction, duration) and self._controller.extend_motion(direction, duration):
+            self.merged += 1
+            return True
+
+        return False
+
+    def _latest(self, command: tuple) -> tuple:
+        """
+        Drain the queue keeping only the newest command
+
+        :param command: (command, trace id) already taken from the queue
+        :return: The newest (command, trace id)
+        """
+        while True:
+            try:
+                newer = self._queue.get_nowait()
+            except queue.Empty:
+                return command
+
+            self.dropped += 1
+            command = newer
+
+    def run(self) -> None:
+        """
+        Process commands forever, blocking while there are none
+        """
+        while True:
+            # Waits on the clock rather than blocking in the queue, so a virtual clock can run the dispatcher
+            self._preempt.wait()
+            with self._lock:
+                self._preempt.clear()
+                try:
+                    command = self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                command, trace_id = self._latest(command)
+
+            if trace_id is not None:
+                TRACER.mark(trace_id, HOP_DEQUEUE)
+                TRACER.arm(trace_id)
+
+            process_command(self._controller, command, self._preempt)
+
+    def start(self) -> threading.Thread:
+        """
+        Run the dispatcher on a daemon thread
+
+        :return: The started thread
+        """
+        thread = self._clock.thread(self.run)
+        thread.start()
+
+        return thread
+
+
+def read_commands(serial_device: serial.Serial, parser: FrameParser) -> list[bytes]:
+    """
+    Block until bytes arrive on the serial device and return every complete command
+
+    :param serial_device: Device commands are received on
+    :param parser: Parser holding any partial frame from previous reads
+    :return: Complete commands, may be empty if only part of a frame arrived
+    """
+    # Take everything already waiting in one call, or block for the next byte
+    data = serial_device.read(serial_device.in_waiting or 1)
+
+    return parser.feed(data)
+
+
+def register_metrics(controller: RNetController, dispatcher: CommandDispatcher, parser: FrameParser,
+                     watchdog: Watchdog = None) -> None:
+    """
+    Expose the counters the server's parts already keep, they are read when the metrics are rendered
+
+    :param controller: Interface to the wheelchair
+    :param dispatcher: Dispatcher running the commands
+    :param parser: Parser of the link
+    :param watchdog: Watchdog of the link, None if it is disabled
+    """
+    METRICS.function("nxt_pi_queue_depth", "Commands waiting for the dispatcher", lambda: dispatcher.queue_depth)
+    METRICS.function("nxt_pi_commands_dropped_total", "Stale commands discarded for a newer one",
+                     lambda: dispatcher.dropped, COUNTER)
+    METRICS.function("nxt_pi_commands_merged_total", "Moves merged into the running motion",
+                     lambda: dispatcher.merged, COUNTER)
+    METRICS.function("nxt_pi_parser_frames_total", "Frames parsed from the link", lambda: parser.frames, COUNTER)
+    METRICS.function("nxt_pi_parser_resyncs_total", "Times the parser resynchronised after corrupted bytes",
+                     lambda: parser.resyncs, COUNTER)
+    METRICS.function("nxt_pi_parser_dropped_bytes_total", "Bytes discarded while resynchronising",
+                     lambda: parser.dropped_bytes, COUNTER)
+    if watchdog is not None:
+        METRICS.function("nxt_pi_watchdog_trips_total", "Times the link went quiet and the chair was stopped",
+                         lambda: watchdog.trips, COUNTER)
+
+    METRICS.function("nxt_can_send_retries_total", "Sends retried while the transmit queue was full",
+                     lambda: controller.send_stats.retried, COUNTER)
+    METRICS.function("nxt_can_send_blocked_seconds_total", "Time spent waiting on a full transmit queue",
+                     lambda: controller.send_stats.blocked_time, COUNTER)
+    METRICS.function("nxt_can_missed_deadlines_total", "Frame slots skipped because a send ran late",
+                     lambda: controller.transmit_stats.missed_deadlines, COUNTER)
+    METRICS.function("nxt_can_send_jitter_max_seconds", "Latest a repeated frame has been sent after its deadline",
+                     lambda: controller.transmit_stats.max_jitter)
+
+
+def serve(controller: RNetController, serial_device: serial.Serial, watchdog_window: float = WATCHDOG_WINDOW,
+          coalesce: bool = True, clock: Clock = SYSTEM_CLOCK) -> None:
+    """
+    Pass commands from the serial device to the chair forever
 
     :param controller: Interface to the wheelchair
-    :param command_queue: The queue to get the commands from
+    :param serial_device: Device commands are received on
+    :param watchdog_window: Seconds without a heartbeat or command before the chair is stopped, None to disable
+    :param coalesce: Whether moves continuing the running motion are merged into it
+    :param clock: Clock the controller runs on, reading the serial device has to wait on it as well
     """
-    while True:
-        if not command_queue.empty():
-            command = command_queue.get()
-            process_command(controller, command)
-            # process_commands.current_command = command
-            command_queue.task_done()
-        # elif process_commands.current_command is not None:
-        #     process_command(controller, process_commands.current_command)
+    # Start the thread for processing commands
+    dispatcher = CommandDispatcher(controller, coalesce, clock)
+    dispatcher.start()
+
+    watchdog = None
+    if watchdog_window is not None:
+        # Hold the stop frame for a window so the chair settles even if the link stays down
+        stop_command = bytes(encode_move_cmd(Direction.STOP, watchdog_window))
+        watchdog = Watchdog(lambda: dispatcher.submit(stop_command), watchdog_window, clock)
+        watchdog.start()
 
+    parser = FrameParser()
+    register_metrics(controller, dispatcher, parser, watchdog)
+    trace_id = None
+    STARTUP.ready()
+    try:
+        while True:
+            # Grab the commands
+            start = perf_counter()
+            received_commands = read_commands(serial_device, parser)
+            SERIAL_READ_SECONDS.observe(perf_counter() - start)
+
+            for received_command in received_commands:
+                if watchdog is not None:
+                    watchdog.feed()
+                if RECORDER.enabled:
+                    RECORDER.record(KIND_UART, 0, received_command)
+
+                if is_heartbeat_cmd(received_command):
+                    HEARTBEATS_RECEIVED.inc()
+                    continue
+
+                if is_trace_cmd(received_command):
+                    # Tags the command which follows it
+                    TRACES_RECEIVED.inc()
+                    trace_id = decode_trace_cmd(received_command)
+                    continue
+
+                COMMANDS_RECEIVED.inc()
+
+                if trace_id is not None:
+                    TRACER.mark(trace_id, HOP_UART_DECODE)
+
+                EVENTS.info("Received command: %s", received_command)
+                # Hand the command over, preempting the current one
+                dispatcher.submit(received_command, trace_id)
+                trace_id = None
 
-# process_commands.current_command = None
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
 
 
-def main():
+def main(record_path: str = None, record_received: bool = False, bus_num: int = 0, device: str = PI_DEVICE,
+         baud_rate: int = BAUD_RATE, frame_period: float = RNetController.FRAME_PERIOD,
+         transport: str = RNetController.TRANSPORT_RAW, transmit_cpu: int = None, fifo_priority: int = None,
+         watchdog_window: float = WATCHDOG_WINDOW, coalesce: bool = True):
+    """
+    Connect to the chair and serve commands from the UART
+
+    :param record_path: If given, every frame sent and command received is recorded to this file
+    :param record_received: Also record the joystick and speed frames received from the bus
+    :param bus_num: Can bus number the chair is on
+    :param device: Serial device commands are received on, or a transport spec such as "unix:/tmp/nxt_pi.sock"
+    :param baud_rate: Baud rate of the serial device
+    :param frame_period: Seconds between repeated frames while driving
+    :param transport: TRANSPORT_RAW, TRANSPORT_BCM or TRANSPORT_PROCESS
+    :param transmit_cpu: CPU to pin the transmit process to (TRANSPORT_PROCESS only)
+    :param fifo_priority: SCHED_FIFO priority of the transmit process (TRANSPORT_PROCESS only)
+    :param watchdog_window: Seconds without a heartbeat or command before the chair is stopped, None to disable
+    :param coalesce: Whether moves continuing the running motion are merged into it
+    """
+    if record_path is not None:
+        recording.start(record_path)
+
     # Establish an RNET controller interface
     rnet_controller = None
     for _ in range(RECONNECTION_ATTEMPTS):
         logging.info("Attempting connection to wheelchair...")
-        rnet_controller = RNetController()
+        CONNECT_ATTEMPTS.inc()
+        rnet_controller = RNetController(bus_num, frame_period, transport, transmit_cpu=transmit_cpu,
+                                         fifo_priority=fifo_priority)
         if rnet_controller.is_connected():
             logging.info("Wheelchair connected successfully.")
             break
@@ -69,24 +344,18 @@ def main():
     if not rnet_controller.is_connected():
         logging.error(f"Failed to connect after {RECONNECTION_ATTEMPTS} attempts. Exiting..")
         return
+    STARTUP.mark("controller_connected")
 
-    # Create a queue to store commands
-    command_queue = queue.Queue()
-
-    # Start the thread for processing commands
-    thread = threading.Thread(target=process_commands, args=[rnet_controller, command_queue])
-    thread.daemon = True
-    thread.start()
-
-    with serial.Serial(PI_DEVICE, BAUD_RATE) as serial_device:
-        while True:
-            # Grab the command
-            received_command = serial_device.readline().strip()
+    if record_path is not None and record_received:
+        # Only imported when used, it pulls in asyncio. A socket of its own, so receiving never holds up sending
+        from ..rnet_controller.CanReceiver import CanReceiver
+        receiver = CanReceiver.open(bus_num, can_ids=CanReceiver.RNET_FRAME_IDS)
+        RECORDER.attach(receiver)
+        receiver.start()
 
-            if received_command:
-                logging.info(f"Received command: {received_command}")
-                # Add command to the queue
-                command_queue.put(received_command)
+    with open_receiver(device, baud_rate) as serial_device:
+        STARTUP.mark("link_open")
+        serve(rnet_controller, serial_device, watchdog_window, coalesce)
 
 
 if __name__ == "__main__":
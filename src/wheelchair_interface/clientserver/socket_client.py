@@ -1,17 +1,155 @@
 """
 file: socket_client.py
 
-description: An implementation of a function to send move commands over socket
+description: An implementation of a client to send move commands over socket
 
 author: Matt London
 """
 import logging
 import socket
-import pickle
 
+from ..protocol.processor import encode_move_cmd, encode_setpoint_cmd, encode_trace_cmd
+from ..tracing import TRACER, HOP_CLIENT_SEND
 from ..protocol.resources import *
 
 
+class SocketClient:
+    """
+    Long-lived connection to the nano interface which sends protocol encoded commands.
+
+    Messages are the same fixed size STX ... ETX frames sent over UART, so the receiver can split any number of
+    them out of a single recv. The connection is opened on first use and reopened if it drops.
+    """
+    def __init__(self, host: str = SOCKET_HOST, port: int = SOCKET_PORT,
+                 reconnection_attempts: int = RECONNECTION_ATTEMPTS, unix_path: str = None):
+        """
+        Constructor for a client, does not connect until the first send
+
+        :param host: Socket host address
+        :param port: Socket port
+        :param reconnection_attempts: Times to try reconnecting before giving up on a send
+        :param unix_path: Path of a Unix domain socket to connect to instead of host and port
+        """
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.reconnection_attempts = reconnection_attempts
+        self._socket = None
+
+    @property
+    def address(self) -> str:
+        """
+        :return: Printable address the client sends to
+        """
+        return self.unix_path if self.unix_path is not None else f"{self.host}:{self.port}"
+
+    def is_connected(self) -> bool:
+        """
+        Check if there is an open connection
+
+        :return: If the connection is currently open
+        """
+        return self._socket is not None
+
+    def connect(self) -> None:
+        """
+        Open the connection if it is not already open
+        """
+        if self._socket is not None:
+            return
+
+        if self.unix_path is not None:
+            client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                client_socket.connect(self.unix_path)
+            except OSError:
+                client_socket.close()
+                raise
+        else:
+            client_socket = socket.create_connection((self.host, self.port))
+            # Commands are tiny and latency sensitive, do not wait to coalesce them
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self._socket = client_socket
+        logging.info(f"Connected to {self.address}")
+
+    def close(self) -> None:
+        """
+        Close the connection if it is open
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def send(self, message: bytes) -> None:
+        """
+        Send an encoded message, reconnecting if the connection has dropped
+
+        :param message: Encoded protocol message
+        """
+        for attempt in range(self.reconnection_attempts):
+            try:
+                self.connect()
+                self._socket.sendall(message)
+                return
+
+            except OSError as e:
+                logging.error(f"Failed to send to {self.address} (attempt {attempt + 1}): {e}")
+                self.close()
+
+        raise ConnectionError(f"Could not send to {self.address} after {self.reconnection_attempts} attempts")
+
+    def send_move_cmd(self, direction: Direction, duration: float, trace_id: int = None) -> None:
+        """
+        Send a move command
+
+        :param direction: Direction to move
+        :param duration: Time to move
+        :param trace_id: Optional id to follow the command through to the can bus with tracing
+        """
+        cmd = encode_move_cmd(direction, duration)
+        if trace_id is not None:
+            # The tag travels immediately before the command it belongs to
+            cmd = encode_trace_cmd(trace_id) + cmd
+            TRACER.mark(trace_id, HOP_CLIENT_SEND)
+
+        self.send(cmd)
+
+    def send_setpoint(self, x: int, y: int) -> None:
+        """
+        Send a joystick setpoint, producers stream these at 50-100Hz
+
+        :param x: Joystick x position [MIN_SETPOINT, MAX_SETPOINT], positive is right
+        :param y: Joystick y position [MIN_SETPOINT, MAX_SETPOINT], positive is forward
+        """
+        self.send(encode_setpoint_cmd(x, y))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+__clients = {}
+""" Connections shared by send_move_cmd, keyed by (host, port) """
+
+
+def get_client(host: str = SOCKET_HOST, port: int = SOCKET_PORT) -> SocketClient:
+    """
+    Get the shared client for an address, creating it on first use
+
+    :param host: Socket host address
+    :param port: Socket port
+    :return: Client which keeps its connection open between commands
+    """
+    client = __clients.get((host, port))
+    if client is None:
+        client = __clients[(host, port)] = SocketClient(host, port)
+
+    return client
+
+
 def send_move_cmd(direction: Direction, duration: float, host=SOCKET_HOST, port=SOCKET_PORT) -> None:
     """
     Send a move command to the nano interface over socket
@@ -21,14 +159,19 @@ def send_move_cmd(direction: Direction, duration: float, host=SOCKET_HOST, port=
     :param host: Socket host address (set default)
     :param port: Socket port (set default)
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-        client_socket.connect((host, port))
+    get_client(host, port).send_move_cmd(direction, duration)
 
-        # Encode it into data
-        data = pickle.dumps((int(direction), duration))
 
-        # Send over the socket
-        client_socket.sendall(data)
+def send_setpoint(x: int, y: int, host=SOCKET_HOST, port=SOCKET_PORT) -> None:
+    """
+    Send a joystick setpoint to the nano interface over socket
+
+    :param x: Joystick x position, positive is right
+    :param y: Joystick y position, positive is forward
+    :param host: Socket host address (set default)
+    :param port: Socket port (set default)
+    """
+    get_client(host, port).send_setpoint(x, y)
 
 
 if __name__ == "__main__":
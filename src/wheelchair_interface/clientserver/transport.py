@@ -0,0 +1,507 @@
+"""
+file: transport.py
+
+description: Interchangeable links between the Nano and the Pi: UART, TCP, Unix domain socket or a shared memory ring
+
+note:
+    - Every transport carries the same encoded protocol bytes and looks like a serial.Serial to its user: the Pi reads
+      with read(size) and in_waiting, the Nano writes with write(data). pi_server and nano_client take any of them.
+    - A transport is named by a spec: "uart:/dev/ttyS0" (or just the device path), "tcp:host:port",
+      "unix:/path/to/socket" or "shm:name". The Pi end listens or creates, the Nano end connects or attaches.
+    - The shared memory ring is for a producer and controller running on the same board, it has no wake up so the
+      reader polls it while it is empty, backing off from RING_POLL to RING_POLL_MAX seconds between looks
+    - Python has no memory barriers, and on a weakly ordered CPU such as the Pi's ARM cores the published head of the
+      ring may be seen before the bytes it covers. Every slot of the ring carries its position and a CRC of its
+      bytes, so the reader only takes a slot once all of it is visible.
+    - multiprocessing is only imported once a ring is opened, the other links do not load it
+"""
+import fcntl
+import logging
+import os
+import socket
+import struct
+import termios
+import zlib
+
+from time import monotonic, sleep
+
+from ..eventlog import EVENTS
+from ..metrics import METRICS
+from ..protocol.resources import *
+
+
+UART = "uart"
+TCP = "tcp"
+UNIX = "unix"
+SHM = "shm"
+
+RING_SIZE = 4096
+""" Bytes of slots in a shared memory ring """
+
+RING_POLL = 0.0002
+""" Seconds the reader of a shared memory ring first sleeps between looks once it has spun without finding bytes """
+
+RING_POLL_MAX = 0.001
+""" Seconds the reader's sleep between looks doubles up to while the ring stays empty, the most an idle link adds to
+the latency of the next command """
+
+RING_SPIN = 0.001
+""" Seconds the reader of a shared memory ring only yields between looks after it empties, commands come in bursts """
+
+RING_WRITE_TIMEOUT = 0.05
+""" Seconds a write waits for room in a full shared memory ring before the command is dropped """
+
+
+_created_rings = set()
+""" Names of the rings created by this process, both ends of a ring may live in one process on a bench """
+
+ACCEPTS = METRICS.counter("nxt_link_connects_total", "Connections made over a tcp or unix link", end="pi")
+CONNECTS = METRICS.counter("nxt_link_connects_total", "Connections made over a tcp or unix link", end="nano")
+WRITE_FAILURES = METRICS.counter("nxt_link_write_failures_total", "Writes to the Pi dropped as it could not be reached")
+
+
+class TransportException(Exception):
+    """
+    Used to express that a transport spec can not be opened
+    """
+    def __init__(self, message):
+        self.message = message
+        super(TransportException, self).__init__(message)
+
+
+def parse_spec(spec: str) -> tuple[str, str]:
+    """
+    Split a transport spec into its kind and address
+
+    :param spec: Transport spec, a bare device path is a UART
+    :return: (UART, TCP, UNIX or SHM, address)
+    """
+    kind, separator, address = spec.partition(":")
+    if separator and kind in (UART, TCP, UNIX, SHM):
+        return kind, address
+
+    return UART, spec
+
+
+def _tcp_address(address: str) -> tuple[str, int]:
+    """
+    :param address: "host:port"
+    :return: (host, port)
+    """
+    host, _, port = address.rpartition(":")
+    try:
+        return host or SOCKET_HOST, int(port)
+    except ValueError:
+        raise TransportException(f"TCP transport needs host:port, got {address}")
+
+
+class StreamReceiver:
+    """
+    Pi end of a TCP or Unix domain socket link, accepts the Nano and reads its bytes like a serial device.
+
+    One connection is served at a time; when it drops the next read waits for the Nano to connect again.
+    """
+    def __init__(self, listener: socket.socket, address: str):
+        """
+        Constructor for a receiver on a listening socket
+
+        :param listener: Bound and listening socket
+        :param address: Printable address for logging
+        """
+        self._listener = listener
+        self._connection = None
+        self._count = bytearray(struct.calcsize("i"))
+        self.address = address
+
+    @classmethod
+    def listen(cls, kind: str, address: str) -> "StreamReceiver":
+        """
+        Listen for the Nano on an address
+
+        :param kind: TCP or UNIX
+        :param address: "host:port" for TCP, the socket path for UNIX
+        :return: Receiver, the Nano is accepted on the first read
+        """
+        if kind == UNIX:
+            if os.path.exists(address):
+                # A socket file left over from an earlier run refuses the bind
+                os.unlink(address)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(address)
+        else:
+            listener = socket.create_server(_tcp_address(address))
+        listener.listen(1)
+        logging.info(f"Waiting for commands on {kind}:{address}")
+
+        return cls(listener, address)
+
+    def __accept(self) -> socket.socket:
+        """
+        :return: The connection to the Nano, waiting for it to connect if there is none
+        """
+        if self._connection is None:
+            self._connection, _ = self._listener.accept()
+            if self._connection.family != socket.AF_UNIX:
+                self._connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            logging.info(f"Nano connected on {self.address}")
+            ACCEPTS.inc()
+
+        return self._connection
+
+    @property
+    def in_waiting(self) -> int:
+        """
+        :return: Bytes received and not yet read
+        """
+        if self._connection is None:
+            return 0
+
+        fcntl.ioctl(self._connection, termios.FIONREAD, self._count)
+        return struct.unpack("i", self._count)[0]
+
+    def read(self, size: int = 1) -> bytes:
+        """
+        Block until bytes arrive
+
+        :param size: Most bytes to return
+        :return: Bytes received, empty if the Nano disconnected
+        """
+        connection = self.__accept()
+        try:
+            data = connection.recv(size)
+        except OSError:
+            data = b""
+
+        if not data:
+            logging.error(f"Nano disconnected from {self.address}")
+            connection.close()
+            self._connection = None
+
+        return data
+
+    def close(self) -> None:
+        """
+        Close the connection and stop listening
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        self._listener.close()
+
+    def __enter__(self) -> "StreamReceiver":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class StreamSender:
+    """
+    Nano end of a TCP or Unix domain socket link, writes commands like a serial device and reconnects when the Pi
+    comes back
+    """
+    def __init__(self, kind: str, address: str):
+        """
+        Constructor for a sender, does not connect until the first write
+
+        :param kind: TCP or UNIX
+        :param address: "host:port" for TCP, the socket path for UNIX
+        """
+        self._kind = kind
+        self._address = address
+        self._socket = None
+        self._failing = False
+
+    def __connect(self) -> socket.socket:
+        """
+        :return: The connection to the Pi, opening it if there is none
+        """
+        if self._socket is None:
+            if self._kind == UNIX:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    connection.connect(self._address)
+                except OSError:
+                    connection.close()
+                    raise
+            else:
+                connection = socket.create_connection(_tcp_address(self._address))
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._socket = connection
+            CONNECTS.inc()
+
+        return self._socket
+
+    def write(self, data: bytes) -> int:
+        """
+        Send bytes to the Pi
+
+        :param data: Encoded commands
+        :return: Bytes sent, 0 if the Pi could not be reached
+        """
+        try:
+            self.__connect().sendall(data)
+            self._failing = False
+            return len(data)
+
+        except OSError:
+            # The heartbeat or next command tries again, the watchdog on the Pi stops the chair meanwhile
+            if not self._failing:
+                logging.error(f"Failed to send to the Pi on {self._kind}:{self._address}")
+                self._failing = True
+            WRITE_FAILURES.inc()
+            self.close()
+            return 0
+
+    def close(self) -> None:
+        """
+        Close the connection if it is open
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self) -> "StreamSender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SharedMemoryRing:
+    """
+    Single producer, single consumer ring of byte slots in named shared memory.
+
+    The head (slots written in total) and tail (slots read in total) are only ever advanced by their own side, so no
+    lock is needed. A write fills one slot per SLOT_DATA bytes and the reader checks each slot's position and CRC before
+    taking it, as the head may become visible before the slot on ARM. The Pi creates the ring and the Nano attaches to
+    it by name.
+    """
+    HEADER = struct.Struct("<QQ")
+    """ Head then tail, at the start of the shared memory """
+
+    SLOT = struct.Struct("<QII")
+    """ Position the slot was written at, CRC of the position and data, data length, at the start of every slot """
+
+    SLOT_SIZE = 64
+    """ Bytes of a slot, a cache line """
+
+    SLOT_DATA = SLOT_SIZE - SLOT.size
+    """ Bytes of data a slot holds """
+
+    UNWRITTEN = 2 ** 64 - 1
+    """ Position of a slot which has never been written """
+
+    def __init__(self, name: str, create: bool, size: int = RING_SIZE):
+        """
+        Constructor which creates or attaches to a ring
+
+        :param name: Name of the shared memory
+        :param create: Whether to create the ring (Pi) rather than attach to an existing one (Nano)
+        :param size: Bytes of slots the ring holds, when creating
+        """
+        # Only imported for a ring, loading multiprocessing would slow the start of every other link
+        from multiprocessing import resource_tracker, shared_memory
+
+        if create:
+            try:
+                # Left over from an earlier run which did not exit cleanly
+                shared_memory.SharedMemory(name).unlink()
+            except FileNotFoundError:
+                pass
+            slots = max(1, size // self.SLOT_SIZE)
+            self._shm = shared_memory.SharedMemory(name, create=True, size=self.HEADER.size + slots * self.SLOT_SIZE)
+            _created_rings.add(name)
+            self.HEADER.pack_into(self._shm.buf, 0, 0, 0)
+            for slot in range(slots):
+                self.SLOT.pack_into(self._shm.buf, self.HEADER.size + slot * self.SLOT_SIZE, self.UNWRITTEN, 0, 0)
+        else:
+            try:
+                self._shm = shared_memory.SharedMemory(name)
+            except FileNotFoundError:
+                raise TransportException(f"No shared memory ring {name}, start the Pi end first")
+            if name not in _created_rings:
+                # Otherwise the resource tracker of this process removes the Pi's ring when this process exits
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        self._owner = create
+        self._buffer = self._shm.buf
+        self._slots = (len(self._buffer) - self.HEADER.size) // self.SLOT_SIZE
+        self._unread = b""
+        """ Bytes of slots already taken by the reader which a read has not returned yet """
+
+        self.name = name
+        logging.info(f"{'Created' if create else 'Attached to'} shared memory ring {name}")
+
+    @property
+    def in_waiting(self) -> int:
+        """
+        :return: Bytes written and not yet read, counting slots the reader has not checked yet
+        """
+        head, tail = self.HEADER.unpack_from(self._buffer)
+        waiting = len(self._unread)
+        for position in range(tail, head):
+            waiting += min(self.SLOT.unpack_from(self._buffer, self.__start(position))[2], self.SLOT_DATA)
+
+        return waiting
+
+    def read(self, size: int = 1) -> bytes:
+        """
+        Block until bytes are written
+
+        :param size: Most bytes to return
+        :return: Bytes written by the Nano
+        """
+        spin_until = monotonic() + RING_SPIN
+        poll = RING_POLL
+        while not self._unread:
+            head, tail = self.HEADER.unpack_from(self._buffer)
+            chunks = []
+            while tail + len(chunks) < head:
+                chunk = self.__take(tail + len(chunks))
+                if chunk is None:
+                    # Published, but not all of it is visible to this core yet
+                    break
+                chunks.append(chunk)
+
+            if chunks:
+                self._unread = b"".join(chunks)
+                # Only the tail is written, the head belongs to the Nano. The store depends on the checks above, so
+                # the Nano never sees the slots freed before they are read.
+                struct.pack_into("<Q", self._buffer, 8, tail + len(chunks))
+            elif monotonic() < spin_until:
+                sleep(0)
+            else:
+                # Back off while the link is idle so a quiet ring does not keep the CPU waking up
+                sleep(poll)
+                poll = min(poll * 2, RING_POLL_MAX)
+
+        data = self._unread[:size]
+        self._unread = self._unread[size:]
+
+        return data
+
+    def write(self, data: bytes) -> int:
+        """
+        Add bytes for the Pi, waiting up to RING_WRITE_TIMEOUT for room
+
+        :param data: Encoded commands
+        :return: Bytes written, 0 if the ring stayed full and the commands were dropped
+        """
+        chunks = [data[i:i + self.SLOT_DATA] for i in range(0, len(data), self.SLOT_DATA)]
+        give_up = monotonic() + RING_WRITE_TIMEOUT
+        head, tail = self.HEADER.unpack_from(self._buffer)
+        while self._slots - (head - tail) < len(chunks):
+            if monotonic() > give_up or len(chunks) > self._slots:
+                EVENTS.error("Shared memory ring %s is full, dropped %d bytes", self.name, len(data))
+                WRITE_FAILURES.inc()
+                return 0
+            sleep(RING_POLL)
+            head, tail = self.HEADER.unpack_from(self._buffer)
+
+        for offset, chunk in enumerate(chunks):
+            self.__fill(head + offset, chunk)
+        # Published after the slots, though the Pi may still see it first and checks every slot itself
+        struct.pack_into("<Q", self._buffer, 0, head + len(chunks))
+
+        return len(data)
+
+    def __start(self, position: int) -> int:
+        """
+        :param position: Total slot position
+        :return: Offset of the slot in the shared memory
+        """
+        return self.HEADER.size + position % self._slots * self.SLOT_SIZE
+
+    @staticmethod
+    def __checksum(position: int, chunk: bytes) -> int:
+        """
+        :return: CRC of a slot's data seeded with its position, so a slot left from the previous lap never matches
+        """
+        return zlib.crc32(chunk, position & 0xffffffff)
+
+    def __take(self, position: int) -> bytes | None:
+        """
+        Copy the data out of a slot once it is completely visible
+
+        :param position: Total slot position
+        :return: The data, None if the slot does not hold what the writer published for the position yet
+        """
+        start = self.__start(position)
+        written, checksum, length = self.SLOT.unpack_from(self._buffer, start)
+        if written != position or length > self.SLOT_DATA:
+            return None
+
+        chunk = bytes(self._buffer[start + self.SLOT.size:start + self.SLOT.size + length])
+        if self.__checksum(position, chunk) != checksum:
+            return None
+
+        return chunk
+
+    def __fill(self, position: int, chunk: bytes) -> None:
+        """
+        Write data into a slot
+
+        :param position: Total slot position
+        :param chunk: Up to SLOT_DATA bytes
+        """
+        start = self.__start(position)
+        self._buffer[start + self.SLOT.size:start + self.SLOT.size + len(chunk)] = chunk
+        self.SLOT.pack_into(self._buffer, start, position, self.__checksum(position, chunk), len(chunk))
+
+    def close(self) -> None:
+        """
+        Detach from the ring, the Pi end also removes it
+        """
+        if self._buffer is None:
+            return
+
+        self._buffer.release()
+        self._buffer = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            _created_rings.discard(self.name)
+
+    def __enter__(self) -> "SharedMemoryRing":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_receiver(spec: str, baud_rate: int = BAUD_RATE):
+    """
+    Open the Pi end of a link
+
+    :param spec: Transport spec
+    :param baud_rate: Baud rate, for a UART
+    :return: Object with read(size), in_waiting and close(), usable as a context manager
+    """
+    kind, address = parse_spec(spec)
+    if kind == UART:
+        # Only the UART needs pyserial
+        import serial
+        return serial.Serial(address, baud_rate)
+    if kind == SHM:
+        return SharedMemoryRing(address, create=True)
+
+    return StreamReceiver.listen(kind, address)
+
+
+def open_sender(spec: str, baud_rate: int = BAUD_RATE):
+    """
+    Open the Nano end of a link
+
+    :param spec: Transport spec
+    :param baud_rate: Baud rate, for a UART
+    :return: Object with write(data) and close(), usable as a context manager
+    """
+    kind, address = parse_spec(spec)
+    if kind == UART:
+        import serial
+        return serial.Serial(address, baud_rate, timeout=1)
+    if kind == SHM:
+        return SharedMemoryRing(address, create=False)
+
+    return StreamSender(kind, address)
@@ -0,0 +1,94 @@
+"""
+file: watchdog.py
+
+description: Deadman watchdog which fires when the link to the Nano goes quiet
+"""
+import logging
+
+from threading import Thread
+from typing import Callable
+
+from ..clock import Clock, SYSTEM_CLOCK
+
+
+class Watchdog:
+    """
+    Calls a function once when it has not been fed for a whole window.
+
+    Feeding only stores a timestamp, the watchdog thread sleeps until the current deadline instead of polling so
+    the receive path pays nothing extra.
+    """
+    def __init__(self, on_expire: Callable[[], None], window: float, clock: Clock = SYSTEM_CLOCK):
+        """
+        Constructor for a watchdog, it does not run until started
+
+        :param on_expire: Called from the watchdog thread when the window passes without a feed
+        :param window: Seconds allowed between feeds
+        :param clock: Clock the window is timed on
+        """
+        if window <= 0:
+            raise ValueError("Watchdog window must be positive")
+
+        self._on_expire = on_expire
+        self._clock = clock
+        self._stop = clock.event()
+        self._thread = None
+        self._last_feed = clock()
+        self._expired = False
+        self.window = window
+
+        self.trips = 0
+        """ Number of times the watchdog has fired """
+
+        self.last_trip_delay = None
+        """ Seconds between the last feed and the watchdog firing, the last time it fired """
+
+    def feed(self) -> None:
+        """
+        Mark the link as alive
+        """
+        self._last_feed = self._clock()
+        self._expired = False
+
+    def start(self) -> Thread:
+        """
+        Start watching on a daemon thread, the window starts now
+
+        :return: The started thread
+        """
+        self.feed()
+        self._stop.clear()
+        self._thread = self._clock.thread(self.__run)
+        self._thread.start()
+
+        return self._thread
+
+    def stop(self) -> None:
+        """
+        Stop watching
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __run(self) -> None:
+        """
+        Body of the watchdog thread
+        """
+        while not self._stop.is_set():
+            last_feed = self._last_feed
+            remaining = last_feed + self.window - self._clock()
+            if remaining > 0:
+                self._stop.wait(remaining)
+                continue
+
+            if not self._expired:
+                self._expired = True
+                self.trips += 1
+                self.last_trip_delay = self._clock() - last_feed
+                logging.error(f"No heartbeat for {self.last_trip_delay * 1000:.1f}ms, stopping the chair")
+                self._on_expire()
+
+            # The link is down, there is no deadline to sleep to until it is fed again
+            self._stop.wait(self.window)
@@ -0,0 +1,267 @@
+"""
+file: clock.py
+
+description: Injectable clock for the timing code, the wall clock or a deterministic virtual clock
+
+note:
+    - A clock is called for the monotonic time in seconds, so it can be passed wherever a clock function is taken
+    - Code which sleeps, waits on events or starts threads does so through its clock so a virtual clock can run it
+"""
+
+import heapq
+import logging
+import math
+
+from collections import deque
+from threading import Condition, Event, Thread
+from time import monotonic, sleep
+from typing import Callable
+
+
+class Clock:
+    """
+    The wall clock
+    """
+    def __call__(self) -> float:
+        """
+        :return: Monotonic time in seconds
+        """
+        return monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Sleep for a number of seconds
+
+        :param seconds: Time to sleep for
+        """
+        if seconds > 0:
+            sleep(seconds)
+
+    def event(self) -> Event:
+        """
+        :return: New event whose wait runs on this clock
+        """
+        return Event()
+
+    def thread(self, target: Callable, *args, name: str = None) -> Thread:
+        """
+        Create a daemon thread whose time runs on this clock, for the caller to start
+
+        :param target: Function the thread runs
+        :param args: Arguments to call it with
+        :param name: Name of the thread
+        :return: The thread, not yet started
+        """
+        return Thread(target=target, args=args, name=name, daemon=True)
+
+
+SYSTEM_CLOCK = Clock()
+""" The wall clock, default of everything taking a clock """
+
+
+class _Turn:
+    """
+    A thread's place in line to run on a virtual clock
+    """
+    def __init__(self):
+        self.granted = False
+        """ Whether the thread has been given the turn to run """
+
+        self.woken = False
+        """ Whether the thread has been woken, by its timer or an event, so later wake ups are ignored """
+
+
+class VirtualEvent:
+    """
+    Event whose waits run on a virtual clock, the same interface as threading.Event
+    """
+    def __init__(self, clock: "VirtualClock"):
+        """
+        Constructor for a cleared event
+
+        :param clock: Clock waits run on
+        """
+        self._clock = clock
+        self._flag = False
+        self._turns = []
+
+    def is_set(self) -> bool:
+        """
+        :return: Whether the event is set
+        """
+        return self._flag
+
+    def set(self) -> None:
+        """
+        Set the event, waiting threads run in turn once the setting thread next waits
+        """
+        with self._clock._condition:
+            self._flag = True
+            for turn in self._turns:
+                self._clock._wake(turn)
+            self._turns.clear()
+
+    def clear(self) -> None:
+        """
+        Clear the event
+        """
+        self._flag = False
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until the event is set or a virtual timeout passes
+
+        :param timeout: Virtual seconds to wait for at most, None to wait until set
+        :return: Whether the event is set
+        """
+        with self._clock._condition:
+            if self._flag:
+                return True
+
+            turn = _Turn()
+            self._turns.append(turn)
+            self._clock._block(turn, math.inf if timeout is None else self._clock.now + max(0.0, timeout))
+            if turn in self._turns:
+                self._turns.remove(turn)
+
+            return self._flag
+
+
+class VirtualThread(Thread):
+    """
+    Thread started from a virtual clock, joining it waits on the clock
+    """
+    def __init__(self, clock: "VirtualClock", *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.finished = VirtualEvent(clock)
+        """ Set when the thread has run its target """
+
+    def join(self, timeout: float = None) -> None:
+        """
+        Wait for the thread to finish
+
+        :param timeout: Virtual seconds to wait for at most, None to wait until it finishes
+        """
+        if self.finished.wait(timeout):
+            super().join()
+
+
+class VirtualClock(Clock):
+    """
+    Clock whose time only moves when every thread running on it is waiting, then jumps to the earliest wake up.
+
+    One thread runs at a time: the thread which created the clock and the threads started from it take turns, each
+    running until it next sleeps or waits, so a run gives the same result every time however long it simulates. The
+    threads must only block through the clock, its events and threads. Blocking on anything else, such as a queue or
+    a lock held across a wait, while holding the turn stops the clock.
+    """
+    def __init__(self, start: float = 0.0):
+        """
+        Constructor for a clock, the calling thread holds the turn
+
+        :param start: Time to start at
+        """
+        self.now = start
+        """ Current virtual time in seconds """
+
+        self.wake_ups = 0
+        """ Number of times a thread has been woken, a measure of the work simulated """
+
+        self._condition = Condition()
+        self._timers = []
+        """ Heap of (wake time, sequence, turn) """
+        self._ready = deque()
+        """ Turns woken by an event or a new thread, run in the order they were woken """
+        self._sequence = 0
+
+    def __call__(self) -> float:
+        """
+        :return: Current virtual time in seconds
+        """
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Let the other threads run and carry on once the virtual time has moved on a number of seconds
+
+        :param seconds: Virtual time to sleep for
+        """
+        with self._condition:
+            self._block(_Turn(), self.now + max(0.0, seconds))
+
+    def event(self) -> VirtualEvent:
+        """
+        :return: New event whose wait runs on this clock
+        """
+        return VirtualEvent(self)
+
+    def thread(self, target: Callable, *args, name: str = None) -> VirtualThread:
+        """
+        Create a daemon thread which waits for its turn before running, for the caller to start
+
+        :param target: Function the thread runs
+        :param args: Arguments to call it with
+        :param name: Name of the thread
+        :return: The thread, not yet started
+        """
+        turn = _Turn()
+        with self._condition:
+            # Queued now rather than when the thread starts so its turn does not depend on when the OS runs it
+            self._wake(turn)
+
+        def run() -> None:
+            with self._condition:
+                while not turn.granted:
+                    self._condition.wait()
+            try:
+                target(*args)
+            finally:
+                thread.finished.set()
+                with self._condition:
+                    self._pass_on()
+
+        thread = VirtualThread(self, target=run, name=name, daemon=True)
+        return thread
+
+    def _block(self, turn: _Turn, wake: float) -> None:
+        """
+        Give up the turn and wait for it to come back. Call with the condition held.
+
+        :param turn: Turn of the calling thread
+        :param wake: Virtual time to be woken at, infinite to only be woken by an event
+        """
+        if wake != math.inf:
+            self._sequence += 1
+            heapq.heappush(self._timers, (wake, self._sequence, turn))
+        self._pass_on()
+        while not turn.granted:
+            self._condition.wait()
+
+    def _wake(self, turn: _Turn) -> None:
+        """
+        Queue a turn to run. Call with the condition held.
+
+        :param turn: Turn to wake, ignored if it was already woken
+        """
+        if not turn.woken:
+            turn.woken = True
+            self._ready.append(turn)
+
+    def _pass_on(self) -> None:
+        """
+        Give the turn to the next thread: one woken by an event, otherwise the earliest timer. Call with the
+        condition held.
+        """
+        while not self._ready and self._timers:
+            wake, _, turn = heapq.heappop(self._timers)
+            if not turn.woken:
+                self.now = max(self.now, wake)
+                self._wake(turn)
+
+        if not self._ready:
+            logging.error(f"Every thread on the virtual clock is waiting with nothing to wake it at {self.now:.3f}s")
+            return
+
+        self._ready.popleft().granted = True
+        self.wake_ups += 1
+        self._condition.notify_all()
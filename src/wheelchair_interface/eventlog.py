@@ -0,0 +1,292 @@
+"""
+file: eventlog.py
+
+description: Log for the command and frame paths which keeps formatting and handler I/O off the calling thread
+
+note:
+    - While started, an event is a tuple of its arguments stored in a preallocated ring. A background thread
+      formats nothing itself, it turns the events into log records and passes them through a QueueHandler to a
+      QueueListener, whose thread formats and writes them with the handlers the root logger had.
+    - Arguments are formatted later on, so only pass values which are not changed after logging, such as bytes
+    - Past the first BURST lines of a message in a SUMMARY_PERIOD, the rest are counted and logged as one summary
+      line instead. The ring overwrites the oldest events if it fills between drains, these are counted as dropped.
+    - Lines from the ring carry the time of their event but are written a drain later, so they can follow lines
+      logged directly after them
+    - While not started every call goes straight to logging, as it did before. So is a forked child, such as the
+      transmit process, since the drain and listener threads are not copied into it.
+"""
+import atexit
+import itertools
+import logging
+import os
+import threading
+
+from functools import partial
+from time import time
+
+from .metrics import COUNTER, METRICS
+
+
+BURST = 10
+""" Lines of one message logged in a summary period before the rest are summarized """
+
+SUMMARY_PERIOD = 1.0
+""" Seconds each message's lines are counted over """
+
+
+class EventLog:
+    """
+    Ring of log events written by any thread and drained from a background thread, calls go straight to logging
+    while it is not started
+    """
+    def __init__(self, capacity: int = 4096):
+        """
+        Constructor for a log which is not started
+
+        :param capacity: Events the ring holds, a power of two
+        """
+        if capacity & (capacity - 1):
+            raise ValueError(f"Capacity must be a power of two, not {capacity}")
+
+        self.enabled = False
+        """ Whether events go into the ring, checked first by every call """
+
+        self.level = logging.NOTSET
+        """ Events below this level are discarded without being stored, the root logger's level when started """
+
+        self.logged = 0
+        """ Number of events handed to the handlers """
+
+        self.suppressed = 0
+        """ Number of events counted in a summary rather than logged """
+
+        self.dropped = 0
+        """ Number of events overwritten in the ring before they were drained """
+
+        # Bound rather than defined as methods, which would forward the arguments through a second Python call
+        self.debug = partial(self.log, logging.DEBUG)
+        self.info = partial(self.log, logging.INFO)
+        self.warning = partial(self.log, logging.WARNING)
+        self.error = partial(self.log, logging.ERROR)
+        """ Store an event at the level, called with (template, *args) """
+
+        self._slots = [None] * capacity
+        """ (sequence, time, level, template, args) of the last capacity events """
+        self._mask = capacity - 1
+        self._sequence = itertools.count()
+        """ Next sequence number, taken atomically by the writers """
+        self._tail = 0
+        """ Sequence number of the next event to drain """
+        self._windows = {}
+        """ [period start, lines logged, suppressed, last suppressed event] of every (level, template) """
+
+        self._burst = BURST
+        self._period = SUMMARY_PERIOD
+        self._logger = logging.getLogger()
+        self._handlers = []
+        self._queue_handler = None
+        self._listener = None
+        self._stop = threading.Event()
+        self._thread = None
+        os.register_at_fork(after_in_child=self.__forked)
+
+    def log(self, level: int, template: str, *args) -> None:
+        """
+        Store an event to be logged later
+
+        :param level: Level of the event
+        :param template: Message with %-style placeholders, formatted with the arguments on the listener thread
+        :param args: Arguments of the message
+        """
+        if not self.enabled:
+            logging.log(level, template, *args)
+        elif level >= self.level:
+            sequence = next(self._sequence)
+            # A single store, so the drain never sees half an event
+            self._slots[sequence & self._mask] = (sequence, time(), level, template, args)
+
+    def open(self, flush_interval: float = 0.1, burst: int = BURST, period: float = SUMMARY_PERIOD) -> None:
+        """
+        Start storing events in the ring, and move the root logger's handlers behind a queue so every other log
+        call is written from the listener thread too. Call once logging is configured.
+
+        :param flush_interval: Seconds between drains of the ring
+        :param burst: Lines of one message logged in a summary period before the rest are summarized
+        :param period: Seconds each message's lines are counted over
+        """
+        # Only imported when used, the log goes straight to logging otherwise
+        from logging.handlers import QueueHandler, QueueListener
+        from queue import SimpleQueue
+
+        class DeferredQueueHandler(QueueHandler):
+            def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+                # The listener is in this process, so the record is formatted there rather than here
+                return record
+
+        if self._thread is not None:
+            self.close()
+
+        self._burst = burst
+        self._period = period
+        self.level = self._logger.getEffectiveLevel()
+
+        queue = SimpleQueue()
+        self._handlers = self._logger.handlers[:]
+        for handler in self._handlers:
+            self._logger.removeHandler(handler)
+        self._queue_handler = DeferredQueueHandler(queue)
+        self._logger.addHandler(self._queue_handler)
+        self._listener = QueueListener(queue, *self._handlers, respect_handler_level=True)
+        self._listener.start()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.__run, args=(flush_interval,), name="eventlog", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def close(self) -> None:
+        """
+        Log everything still in the ring and the pending summaries, and give the root logger its handlers back
+        """
+        self.enabled = False
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.__drain()
+        self.__summarize(None)
+
+        self._listener.stop()
+        self._logger.removeHandler(self._queue_handler)
+        for handler in self._handlers:
+            self._logger.addHandler(handler)
+        self._listener = None
+        self._queue_handler = None
+
+    def __forked(self) -> None:
+        """
+        Log straight to the root logger's own handlers in a forked child, nothing there would drain the ring or queue
+        """
+        if self._thread is None:
+            return
+
+        self.enabled = False
+        self._thread = None
+        self._listener = None
+        self._logger.removeHandler(self._queue_handler)
+        self._queue_handler = None
+        for handler in self._handlers:
+            self._logger.addHandler(handler)
+
+    def __drain(self) -> None:
+        """
+        Hand every event written since the last drain to the logger, in order
+        """
+        slots, mask, tail = self._slots, self._mask, self._tail
+        while True:
+            event = slots[tail & mask]
+            # Not written yet: the slot still holds an event from the last time round, or nothing
+            if event is None or event[0] < tail:
+                break
+            # Lapped: every event from the tail up to this one was overwritten
+            if event[0] > tail:
+                self.dropped += event[0] - tail
+                tail = event[0]
+
+            self.__emit(event)
+            tail += 1
+
+        self._tail = tail
+
+    def __emit(self, event: tuple) -> None:
+        """
+        Log an event, or count it towards its message's summary if it is past the burst
+
+        :param event: (sequence, time, level, template, args)
+        """
+        _, created, level, template, args = event
+        window = self._windows.get((level, template))
+        if window is None or created - window[0] >= self._period:
+            if window is not None and window[2]:
+                self.__log_summary(level, template, window)
+            window = self._windows[(level, template)] = [created, 0, 0, None]
+
+        if window[1] < self._burst:
+            window[1] += 1
+            self.__log(created, level, template, args)
+        else:
+            window[2] += 1
+            window[3] = event
+            self.suppressed += 1
+
+    def __summarize(self, now: float = None) -> None:
+        """
+        Log the summary of every message whose period has ended
+
+        :param now: Current time, None to log every pending summary
+        """
+        for (level, template), window in list(self._windows.items()):
+            if now is None or now - window[0] >= self._period:
+                if window[2]:
+                    self.__log_summary(level, template, window)
+                del self._windows[(level, template)]
+
+    def __log_summary(self, level: int, template: str, window: list) -> None:
+        """
+        :param level: Level of the summarized message
+        :param template: Template of the summarized message
+        :param window: [period start, lines logged, suppressed, last suppressed event] of the message
+        """
+        _, created, _, _, args = window[3]
+        self.__log(created, level, "%d more like %r in %.1fs, the last: " + template,
+                   (window[2], template, created - window[0]) + args)
+
+    def __log(self, created: float, level: int, template: str, args: tuple) -> None:
+        """
+        Hand a log record to the root logger's handlers, stamped with the time of the event
+
+        :param created: Wall clock time of the event
+        :param level: Level of the record
+        :param template: Message with %-style placeholders
+        :param args: Arguments of the message
+        """
+        record = self._logger.makeRecord(self._logger.name, level, "", 0, template, args, None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        self._logger.handle(record)
+        self.logged += 1
+
+    def __run(self, flush_interval: float) -> None:
+        """
+        Body of the drain thread
+
+        :param flush_interval: Seconds between drains of the ring
+        """
+        while not self._stop.wait(flush_interval):
+            self.__drain()
+            self.__summarize(time())
+
+
+EVENTS = EventLog()
+""" Event log shared by the whole process """
+
+for result in ("logged", "suppressed", "dropped"):
+    METRICS.function("nxt_log_events_total", "Hot path log events logged, summarized or overwritten in the ring",
+                     lambda result=result: getattr(EVENTS, result), COUNTER, result=result)
+
+
+def start(flush_interval: float = 0.1, burst: int = BURST, period: float = SUMMARY_PERIOD) -> EventLog:
+    """
+    Log the command and frame paths through the ring in this process, everything pending is logged at exit
+
+    :param flush_interval: Seconds between drains of the ring
+    :param burst: Lines of one message logged in a summary period before the rest are summarized
+    :param period: Seconds each message's lines are counted over
+    :return: The process event log
+    """
+    EVENTS.open(flush_interval, burst, period)
+    atexit.register(EVENTS.close)
+
+    return EVENTS
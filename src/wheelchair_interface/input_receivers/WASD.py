@@ -46,11 +46,13 @@ def terminate(key, controller: RNetController) -> None:
     sys.exit(0)
 
 
-def main():
+def main(bus_num: int = 0):
     """
     Main program to take keyboard input
+
+    :param bus_num: Can bus number the chair is on
     """
-    controller = RNetController(0)
+    controller = RNetController(bus_num)
 
     key_functions = {
         'w': action,
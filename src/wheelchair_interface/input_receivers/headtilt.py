@@ -1,79 +1,120 @@
-import brainflow
+"""
+file: headtilt.py
+
+description: Drives the chair from the head tilt measured by the accelerometer of a BrainFlow board
+
+author: Matt London
+"""
+
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 import time
 
 
 import logging
-import socket
-import pickle
 
+from collections import deque
+from typing import Callable
+
+from wheelchair_interface.clientserver.socket_client import send_move_cmd
+from wheelchair_interface.clock import Clock, SYSTEM_CLOCK
+from wheelchair_interface.input_receivers.tilt_classifier import TiltClassifier
 from wheelchair_interface.protocol.resources import *
+from wheelchair_interface.startup import STARTUP
+from wheelchair_interface.tracing import percentile
 
 
 HEADTILT_MOVE_DURATION = 0.25
+""" Duration of each move command, refreshed while the head stays tilted """
 
-def send_move_cmd(direction: Direction, duration: float, host=SOCKET_HOST, port=SOCKET_PORT) -> None:
-    """
-    Send a move command to the nano interface over socket
+DECISION_RATE = 20
+""" Decisions per second """
 
-    :param direction: Direction to move
-    :param duration: Time to move
-    :param host: Socket host address (set default)
-    :param port: Socket port (set default)
-    """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-        client_socket.connect((host, port))
+CALIBRATION_SECONDS = 2.0
+""" Seconds of the head held at rest at the start to take the neutral pose from """
 
-        # Encode it into data
-        data = pickle.dumps((int(direction), duration))
+LATENCY_WINDOW = 12_000
+""" Decisions the latency percentiles are taken over, the last ten minutes at the default rate """
 
-        # Send over the socket
-        client_socket.sendall(data)
+SERIAL_PORT = 'COM3'
+""" Port of the board, change to the actual port """
 
 
+def headTilt(board_id: int = BoardIds.CYTON_BOARD.value, serial_port: str = SERIAL_PORT,
+		decision_rate: float = DECISION_RATE, send: Callable[[Direction, float], None] = send_move_cmd,
+		clock: Clock = SYSTEM_CLOCK) -> None:
+	"""
+	Stream the board's accelerometer and send a move command for the direction the head is tilted in
 
-def headTilt():
+	:param board_id: BrainFlow board, BoardIds.SYNTHETIC_BOARD.value runs without hardware
+	:param serial_port: Port of the board
+	:param decision_rate: Decisions per second
+	:param send: Called with (direction, duration) to move the chair
+	:param clock: Clock the calibration and decisions are timed on
+	"""
 	params = BrainFlowInputParams()
-	params.serial_port = 'COM3'  # Change to the actual port
-	board = BoardShim(BoardIds.CYTON_BOARD.value, params)
+	params.serial_port = serial_port
+	board = BoardShim(board_id, params)
 	board.prepare_session()
 	board.start_stream()
+	STARTUP.mark("board_streaming")
+
+	accel_channels = BoardShim.get_accel_channels(board_id)
+	timestamp_channel = BoardShim.get_timestamp_channel(board_id)
+	classifier = TiltClassifier(BoardShim.get_sampling_rate(board_id))
+	# Age of the newest sample at each of the last decisions
+	latencies = deque(maxlen=LATENCY_WINDOW)
 
 	try:
+		logging.info(f"Hold your head at rest for {CALIBRATION_SECONDS} seconds to calibrate")
+		clock.sleep(CALIBRATION_SECONDS)
+		classifier.calibrate(board.get_board_data()[accel_channels])
+		logging.info(f"Calibrated neutral pose: {classifier.neutral}")
+		STARTUP.ready()
+
+		period = 1 / decision_rate
+		deadline = clock()
+		sent = Direction.STOP
+		last_send = 0.0
+
 		while True:
+			# Decide on a fixed cadence, skipping ahead rather than bursting if a decision ran late
+			deadline = max(deadline + period, clock())
+			clock.sleep(deadline - clock())
+
 			data = board.get_board_data()
-			if len(data[0])==0:
-				print("CONTINUING")
+			if data.shape[1] == 0:
 				continue
 
-			# Accelerometer data is on channels (X:9, Y:10, Z:11)
-			accel_x = data[9][0]
-			accel_y = data[10][0]
-			accel_z = data[11][0]
-
-			#print(f'Accelerometer X: {accel_x[0]}, Y: {accel_y[0]}, Z: {accel_z[0]}')
-
-			if accel_y>=-.8:
-				print("FORWARD")
-				send_move_cmd(Direction.FORWARD, HEADTILT_MOVE_DURATION)
-			elif abs(accel_x)>.05:
-				if accel_x<-.05:
-					print('LEFT')
-					send_move_cmd(Direction.LEFT, HEADTILT_MOVE_DURATION)
-				else:
-					print("RIGHT")
-					send_move_cmd(Direction.RIGHT, HEADTILT_MOVE_DURATION)
-			else:
-				print("REST")
-				#send_move_cmd(Direction., .5)
-
-			time.sleep(.5)
+			classifier.update(data[accel_channels])
+			direction = classifier.decide()
+			latencies.append(time.time() - data[timestamp_channel, -1])
+
+			now = clock()
+			if direction != Direction.STOP:
+				# Refresh well before the previous command runs out so the chair does not stutter
+				if direction != sent or now - last_send >= HEADTILT_MOVE_DURATION / 2:
+					send(direction, HEADTILT_MOVE_DURATION)
+					last_send = now
+			elif sent != Direction.STOP:
+				# Stop straight away rather than waiting for the last command to run out
+				send(Direction.STOP, HEADTILT_MOVE_DURATION)
+
+			if direction != sent:
+				logging.info(direction.name)
+			sent = direction
 
 	except KeyboardInterrupt:
-		print("Stopping the data stream...")
+		logging.info("Stopping the data stream...")
 
 	finally:
 		board.stop_stream()
 		board.release_session()
+
+		if latencies:
+			latencies = sorted(latencies)
+			logging.info(f"Decision latency after the newest sample: p50={percentile(latencies, 0.5) * 1000:.1f}ms "
+					f"p99={percentile(latencies, 0.99) * 1000:.1f}ms over the last {len(latencies)} decisions")
+
+
 if __name__ == "__main__":
-	headTilt()
\ No newline at end of file
+	headTilt()
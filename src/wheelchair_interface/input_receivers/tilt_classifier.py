@@ -0,0 +1,194 @@
+"""
+file: tilt_classifier.py
+
+description: Windowed classifier turning accelerometer samples of a head-mounted board into drive directions
+
+note:
+    - Kept apart from headtilt.py so it can be run on recorded or generated samples without BrainFlow installed
+"""
+
+import math
+
+import numpy as np
+
+from ..protocol.resources import Direction
+
+
+FILTER_CUTOFF = 2.0
+""" Cutoff frequency (Hz) of the low-pass filter, head movements are slower than this and sensor noise is faster """
+
+WINDOW_SECONDS = 1.0
+""" Seconds of samples kept, long enough for the filter weights to have decayed to nothing """
+
+NEUTRAL_POSE = (0.0, -1.0, 0.0)
+""" Accelerometer reading (g) of an upright head, used until the classifier is calibrated """
+
+FORWARD_THRESHOLDS = (0.2, 0.12)
+""" Rise of y (g) from the neutral pose to start driving forward, and below which to stop """
+
+TURN_THRESHOLDS = (0.05, 0.03)
+""" Change of x (g) from the neutral pose to start turning, and below which to stop """
+
+
+class AccelRing:
+    """
+    Fixed size ring buffer of multichannel samples, written a block at a time
+    """
+    def __init__(self, capacity: int, channels: int = 3):
+        """
+        Constructor for an empty ring
+
+        :param capacity: Samples kept per channel
+        :param channels: Number of channels
+        """
+        self._data = np.zeros((channels, capacity))
+        self._index = 0
+
+        self.count = 0
+        """ Number of samples written in total """
+
+    @property
+    def capacity(self) -> int:
+        """
+        :return: Samples kept per channel
+        """
+        return self._data.shape[1]
+
+    def extend(self, samples: np.ndarray) -> None:
+        """
+        Append a block of samples, overwriting the oldest
+
+        :param samples: Array of shape (channels, samples)
+        """
+        capacity = self.capacity
+        if samples.shape[1] > capacity:
+            samples = samples[:, -capacity:]
+
+        count = samples.shape[1]
+        first = min(count, capacity - self._index)
+        self._data[:, self._index:self._index + first] = samples[:, :first]
+        self._data[:, :count - first] = samples[:, first:]
+
+        self._index = (self._index + count) % capacity
+        self.count += count
+
+    def window(self) -> np.ndarray:
+        """
+        :return: The samples held, oldest first, of shape (channels, min(count, capacity))
+        """
+        ordered = np.hstack((self._data[:, self._index:], self._data[:, :self._index]))
+
+        return ordered[:, -min(self.count, self.capacity):]
+
+
+class TiltClassifier:
+    """
+    Low-pass filters accelerometer samples and maps the tilt from a calibrated neutral pose to a direction.
+
+    The filter is a single pole low-pass evaluated for the newest sample only, as one weighted sum over the window
+    of every channel at once. Each direction has an entry and a lower exit threshold so noise around a threshold does
+    not flip the decision back and forth.
+    """
+    def __init__(self, sample_rate: float, cutoff: float = FILTER_CUTOFF, window: float = WINDOW_SECONDS,
+                 forward: tuple[float, float] = FORWARD_THRESHOLDS, turn: tuple[float, float] = TURN_THRESHOLDS):
+        """
+        Constructor for an uncalibrated classifier
+
+        :param sample_rate: Samples per second of the accelerometer
+        :param cutoff: Cutoff frequency (Hz) of the low-pass filter
+        :param window: Seconds of samples to keep
+        :param forward: (enter, exit) thresholds for driving forward
+        :param turn: (enter, exit) thresholds for turning
+        """
+        self._ring = AccelRing(max(1, round(sample_rate * window)))
+        self._forward = forward
+        self._turn = turn
+        self.neutral = np.array(NEUTRAL_POSE)
+        """ Accelerometer reading of the neutral pose """
+
+        self.state = Direction.STOP
+        """ Latest decision, STOP while the head is at rest """
+
+        # Weight of each sample by age, newest last
+        alpha = 1 - math.exp(-2 * math.pi * cutoff / sample_rate)
+        ages = np.arange(self._ring.capacity - 1, -1, -1)
+        self._weights = alpha * (1 - alpha) ** ages
+
+    def calibrate(self, samples: np.ndarray) -> None:
+        """
+        Take the neutral pose from samples of the head at rest
+
+        :param samples: Array of shape (3, samples)
+        """
+        self.neutral = samples.mean(axis=1)
+        self._ring.extend(samples)
+
+    def update(self, samples: np.ndarray) -> None:
+        """
+        Add newly read samples
+
+        :param samples: Array of shape (3, samples), may be empty
+        """
+        if samples.shape[1]:
+            self._ring.extend(samples)
+
+    def tilt(self) -> np.ndarray:
+        """
+        :return: Filtered reading of each axis relative to the neutral pose
+        """
+        window = self._ring.window()
+        if window.shape[1] == 0:
+            return np.zeros(len(self.neutral))
+
+        weights = self._weights[-window.shape[1]:]
+
+        return window @ weights / weights.sum() - self.neutral
+
+    def decide(self) -> Direction:
+        """
+        Decide the direction from the samples so far
+
+        :return: FORWARD, LEFT, RIGHT or STOP while at rest
+        """
+        x, y, _ = self.tilt()
+        forward_enter, forward_exit = self._forward
+        turn_enter, turn_exit = self._turn
+
+        if y >= (forward_exit if self.state == Direction.FORWARD else forward_enter):
+            self.state = Direction.FORWARD
+        else:
+            limit = turn_exit if self.state in (Direction.LEFT, Direction.RIGHT) else turn_enter
+            if x <= -limit:
+                self.state = Direction.LEFT
+            elif x >= limit:
+                self.state = Direction.RIGHT
+            else:
+                self.state = Direction.STOP
+
+        return self.state
+
+
+def classify(samples: np.ndarray, sample_rate: float, decision_rate: float, calibration: float = 0.0,
+             **kwargs) -> list[tuple[float, Direction]]:
+    """
+    Run the classifier over recorded samples as if they were arriving live
+
+    :param samples: Array of shape (3, samples)
+    :param sample_rate: Samples per second
+    :param decision_rate: Decisions per second
+    :param calibration: Seconds at the start of the samples to calibrate the neutral pose from
+    :param kwargs: Passed on to TiltClassifier
+    :return: (seconds from the start of the samples, decision) for every decision
+    """
+    classifier = TiltClassifier(sample_rate, **kwargs)
+    start = round(calibration * sample_rate)
+    if start:
+        classifier.calibrate(samples[:, :start])
+
+    block = max(1, round(sample_rate / decision_rate))
+    decisions = []
+    for end in range(start + block, samples.shape[1] + 1, block):
+        classifier.update(samples[:, end - block:end])
+        decisions.append((end / sample_rate, classifier.decide()))
+
+    return decisions
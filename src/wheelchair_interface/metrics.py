@@ -0,0 +1,293 @@
+"""
+file: metrics.py
+
+description: In-process metrics registry with Prometheus text exposition over localhost HTTP and on SIGUSR1
+
+note:
+    - Counters and histograms are plain attribute updates with no lock, so updating one costs well under a
+      microsecond. Most are only updated from one thread. An update can only be lost if two threads update the same
+      metric at the same moment, which is rare enough for monitoring. A render may be one update behind.
+    - Values which are already counted elsewhere, such as the dispatcher's dropped commands, are registered as
+      functions read when rendering, so they cost nothing on the hot path
+"""
+import bisect
+import logging
+import os
+import signal
+import threading
+
+from typing import Callable
+
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+""" Upper bounds in seconds of the default histogram buckets, 100 us to 1 s """
+
+
+class Counter:
+    """
+    Count which only goes up
+    """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        """
+        :param amount: Amount to add
+        """
+        self.value += amount
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets
+    """
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Constructor for an empty histogram
+
+        :param bounds: Sorted upper bounds of the buckets, a last bucket without a bound is added
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        """ Observations in each bucket, not cumulative """
+
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        :param value: Value to add, it is counted in the first bucket whose bound is at least the value
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        """
+        :return: Number of observations
+        """
+        return sum(self.counts)
+
+
+class _Function:
+    """
+    Metric whose value is read from a function when rendering
+    """
+    __slots__ = ("function",)
+
+    def __init__(self, function: Callable[[], float]):
+        self.function = function
+
+
+class Registry:
+    """
+    Named metrics and their rendering in the Prometheus text format
+    """
+    def __init__(self):
+        self._families = {}
+        """ (type, help, {labels: metric}) of every metric name, in the order they were registered """
+
+        self._lock = threading.Lock()
+        """ Held while metrics are added and while render copies them, so a scrape never sees a dict resize """
+
+    def counter(self, name: str, help_text: str, **labels: str) -> Counter:
+        """
+        Get a counter, creating it on first use
+
+        :param name: Metric name, ending in _total by convention
+        :param help_text: Description shown with the metric
+        :param labels: Labels telling this counter apart from others of the same name
+        :return: The counter
+        """
+        return self.__metric(name, COUNTER, help_text, labels, Counter)
+
+    def histogram(self, name: str, help_text: str, bounds: tuple[float, ...] = LATENCY_BUCKETS,
+                  **labels: str) -> Histogram:
+        """
+        Get a histogram, creating it on first use
+
+        :param name: Metric name, ending in the unit by convention
+        :param help_text: Description shown with the metric
+        :param bounds: Upper bounds of the buckets, used when it is created
+        :param labels: Labels telling this histogram apart from others of the same name
+        :return: The histogram
+        """
+        return self.__metric(name, HISTOGRAM, help_text, labels, lambda: Histogram(bounds))
+
+    def function(self, name: str, help_text: str, function: Callable[[], float], kind: str = GAUGE,
+                 **labels: str) -> None:
+        """
+        Register a value read from a function when rendering, replacing any function registered under the same
+        name and labels
+
+        :param name: Metric name
+        :param help_text: Description shown with the metric
+        :param function: Returns the current value
+        :param kind: GAUGE, or COUNTER if the value only goes up
+        :param labels: Labels telling this value apart from others of the same name
+        """
+        self.__metric(name, kind, help_text, labels, lambda: _Function(function)).function = function
+
+    def __metric(self, name: str, kind: str, help_text: str, labels: dict, create: Callable):
+        """
+        :return: The metric of a name and labels, created if it does not exist
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, help_text, {})
+            elif family[0] != kind:
+                raise ValueError(f"Metric {name} is a {family[0]}, not a {kind}")
+
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = create()
+
+        return metric
+
+    @staticmethod
+    def __labels(key: tuple, extra: str = None) -> str:
+        """
+        :param key: Sorted (label, value) pairs
+        :param extra: Label already formatted as name="value" to add
+        :return: The labels in braces, empty if there are none
+        """
+        pairs = [f'{label}="{value}"' for label, value in key]
+        if extra is not None:
+            pairs.append(extra)
+
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        """
+        :return: Every metric in the Prometheus text exposition format
+        """
+        # Values are read from a copy outside the lock, a function metric may itself register one
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.items()))
+                        for name, (kind, help_text, metrics) in self._families.items()]
+
+        lines = []
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in metrics:
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.bounds + ("+Inf",), metric.counts):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{name}_bucket{self.__labels(key, le)} {cumulative}")
+                    lines.append(f"{name}_sum{self.__labels(key)} {metric.sum}")
+                    lines.append(f"{name}_count{self.__labels(key)} {cumulative}")
+                    continue
+
+                if isinstance(metric, _Function):
+                    try:
+                        value = metric.function()
+                    except Exception as e:
+                        logging.error(f"Failed to read metric {name}: {e}")
+                        continue
+                else:
+                    value = metric.value
+                lines.append(f"{name}{self.__labels(key)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """
+        Write every metric to a file, replacing it in one step so a reader never sees half a dump
+
+        :param path: File to write
+        """
+        partial = f"{path}.partial"
+        with open(partial, "w") as f:
+            f.write(self.render())
+        os.replace(partial, path)
+
+
+METRICS = Registry()
+""" Registry of the process, the metrics of every module are registered here """
+
+
+def serve(port: int, host: str = "127.0.0.1"):
+    """
+    Expose METRICS on http://host:port/metrics from a daemon thread
+
+    :param port: Port to listen on
+    :param host: Address to listen on, localhost unless scraped from another machine
+    :return: The HTTP server
+    """
+    # Only imported when used, it is not needed by every mode
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+
+            body = METRICS.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    return server
+
+
+def dump_on_signal(path: str, signum: int = signal.SIGUSR1) -> None:
+    """
+    Write METRICS to a file whenever the process receives a signal, call from the main thread
+
+    :param path: File to write
+    :param signum: Signal to dump on
+    """
+    # The handler may interrupt the main thread while it holds the registry lock registering a metric, so it only
+    # wakes a thread which renders once that lock is free
+    requested = threading.Event()
+
+    def dump() -> None:
+        while True:
+            requested.wait()
+            requested.clear()
+            try:
+                METRICS.dump(path)
+            except OSError as e:
+                logging.error(f"Failed to dump metrics to {path}: {e}")
+
+    threading.Thread(target=dump, name="metrics-dump", daemon=True).start()
+    signal.signal(signum, lambda *_: requested.set())
+
+
+def start(port: int = None, dump_path: str = None) -> Registry:
+    """
+    Expose METRICS, counting goes on whether or not they are exposed
+
+    :param port: Serve them over HTTP on localhost on this port, None to not serve them
+    :param dump_path: Write them to this file on SIGUSR1, None to not dump them
+    :return: METRICS
+    """
+    if port is not None:
+        serve(port)
+    if dump_path is not None:
+        dump_on_signal(dump_path)
+
+    return METRICS
@@ -0,0 +1,71 @@
+"""
+file: coalescer.py
+
+description: Merges consecutive move commands in the same direction into one continuous drive
+"""
+from time import monotonic
+from typing import Callable
+
+from .resources import *
+
+
+class Coalescer:
+    """
+    Tracks the drive in progress and decides whether a move continues it.
+
+    A move in the same direction as a drive which has not run out yet is merged into it: the deadline of the drive is
+    pushed out to the end of the new move instead of a new drive being started. STOP and changes of direction are
+    never merged, they supersede the drive.
+    """
+    def __init__(self, clock: Callable[[], float] = monotonic):
+        """
+        Constructor for a coalescer with no drive in progress
+
+        :param clock: Monotonic clock returning seconds
+        """
+        self._clock = clock
+
+        self.direction = None
+        """ Direction of the drive in progress, None if there is none """
+
+        self.deadline = 0.0
+        """ Time the drive in progress runs out """
+
+        self.merged = 0
+        """ Number of moves merged into a drive in progress """
+
+    def offer(self, direction: Direction, duration: float) -> bool:
+        """
+        Merge a move into the drive in progress, or make it the drive in progress
+
+        :param direction: Direction of the move
+        :param duration: Seconds the move lasts
+        :return: Whether the move was merged, if not it has to be sent on as a new drive
+        """
+        now = self._clock()
+        deadline = now + duration
+
+        if direction != Direction.STOP and direction == self.direction and now < self.deadline:
+            self.deadline = max(self.deadline, deadline)
+            self.merged += 1
+            return True
+
+        self.direction = direction
+        self.deadline = deadline
+        return False
+
+    def remaining(self) -> float:
+        """
+        :return: Seconds until the drive in progress runs out, 0 if there is none
+        """
+        if self.direction is None:
+            return 0.0
+
+        return max(0.0, self.deadline - self._clock())
+
+    def reset(self) -> None:
+        """
+        Forget the drive in progress, for when something other than a move supersedes it
+        """
+        self.direction = None
+        self.deadline = 0.0
@@ -0,0 +1,124 @@
+"""
+file: parser.py
+
+description: Incremental parser which splits a byte stream into protocol frames and resynchronizes after corruption
+"""
+from .resources import *
+from ..eventlog import EVENTS
+
+
+class FrameParser:
+    """
+    Finds STX ... ETX frames of PROTOCOL_LENGTH bytes in a stream fed in arbitrary chunks.
+
+    Bytes are kept in a reusable buffer, frames are only copied out once they are complete and valid.
+    Payload bytes never take the STX or ETX values, so after garbage the parser skips to the next STX.
+    """
+    def __init__(self, buffer_size: int = 4096):
+        """
+        Constructor for a parser
+
+        :param buffer_size: Bytes the internal buffer can hold before the oldest pending bytes are dropped
+        """
+        if buffer_size < PROTOCOL_LENGTH:
+            raise ValueError(f"Buffer must hold at least {PROTOCOL_LENGTH} bytes")
+
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+        self.frames = 0
+        """ Number of complete frames found """
+
+        self.resyncs = 0
+        """ Number of times the parser had to search for the next start byte """
+
+        self.dropped_bytes = 0
+        """ Number of bytes discarded as they were not part of a valid frame """
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """
+        Add bytes from the stream and take out every complete frame
+
+        :param data: Bytes read from the stream
+        :return: Complete frames in the order they were received
+        """
+        frames = []
+        data = memoryview(data)
+
+        while data:
+            self._compact()
+            count = min(len(data), len(self._buffer) - self._end)
+            if count == 0:
+                # The buffer is full of bytes that never formed a frame
+                self._drop(self._end - self._start)
+                continue
+
+            self._view[self._end:self._end + count] = data[:count]
+            self._end += count
+            data = data[count:]
+
+            self._extract(frames)
+
+        return frames
+
+    def _extract(self, frames: list[bytes]) -> None:
+        """
+        Pull every complete frame out of the buffered bytes
+
+        :param frames: List to append the frames to
+        """
+        buffer = self._buffer
+
+        while self._end - self._start >= PROTOCOL_LENGTH:
+            if buffer[self._start] != STX:
+                self._resync()
+                continue
+
+            if buffer[self._start + PROTOCOL_LENGTH - 1] != ETX:
+                # Looked like a frame start but is not, skip it and search again
+                self._drop(1)
+                self._resync()
+                continue
+
+            frames.append(bytes(self._view[self._start:self._start + PROTOCOL_LENGTH]))
+            self._start += PROTOCOL_LENGTH
+            self.frames += 1
+
+    def _resync(self) -> None:
+        """
+        Discard bytes up to the next start byte
+        """
+        self.resyncs += 1
+        position = self._buffer.find(STX, self._start, self._end)
+        if position < 0:
+            position = self._end
+
+        self._drop(position - self._start)
+
+    def _drop(self, count: int) -> None:
+        """
+        Discard bytes from the front of the buffer
+
+        :param count: Number of bytes to drop
+        """
+        if count:
+            EVENTS.debug("Dropped %d bytes not matching the protocol", count)
+
+        self.dropped_bytes += count
+        self._start += count
+
+    def _compact(self) -> None:
+        """
+        Move pending bytes to the front of the buffer so there is room at the end
+        """
+        if self._start == 0:
+            return
+
+        pending = self._end - self._start
+        if pending:
+            self._view[:pending] = self._view[self._start:self._end]
+
+        self._start = 0
+        self._end = pending
@@ -6,8 +6,10 @@ description: Implementation of encoders and decoders for the protocol
 author: Matt London
 """
 import logging
+import struct
 
 from .resources import *
+from ..eventlog import EVENTS
 
 
 class InvalidTimeException(Exception):
@@ -28,6 +30,49 @@ class InvalidCmdException(Exception):
         super(InvalidCmdException, self).__init__(message)
 
 
+class InvalidSetpointException(Exception):
+    """
+    Used to express that a joystick setpoint is not valid for the protocol
+    """
+    def __init__(self, message):
+        self.message = message
+        super(InvalidSetpointException, self).__init__(message)
+
+
+MOVE_CMD = struct.Struct("5B")
+""" STX, direction, mantissa, exponent, ETX """
+
+DURATION_TABLE_MILLISECONDS = 10_000
+""" Durations up to this many milliseconds are encoded from a table """
+
+_DIRECTIONS = {int(direction): direction for direction in Direction}
+""" Direction of each valid direction byte """
+
+_POWERS = tuple(10 ** exponent for exponent in range(256))
+""" Power of ten of each exponent byte """
+
+_duration_table = None
+""" Mantissa and exponent of every millisecond up to DURATION_TABLE_MILLISECONDS, interleaved, built on first use """
+
+
+def __build_duration_table() -> bytes:
+    """
+    Encode every duration up to DURATION_TABLE_MILLISECONDS, each from the one a tenth of it
+
+    :return: Mantissa of each millisecond at 2 * ms and its exponent at 2 * ms + 1
+    """
+    table = bytearray(2 * (DURATION_TABLE_MILLISECONDS + 1))
+    for ms in range(MIN_MILLISECONDS, DURATION_TABLE_MILLISECONDS + 1):
+        if ms % 10 == 0 or ms > MAX_MANTISSA:
+            tenth = 2 * (ms // 10)
+            table[2 * ms] = table[tenth]
+            table[2 * ms + 1] = table[tenth + 1] + 1
+        else:
+            table[2 * ms] = ms
+
+    return bytes(table)
+
+
 def __encode_time(seconds: float) -> tuple[int, int]:
     """
     Take a value of seconds and encode it to the mantissa, exponent form
@@ -35,18 +80,26 @@ def __encode_time(seconds: float) -> tuple[int, int]:
     :param seconds: Duration to encode in seconds
     :return: (mantissa, exponent)
     """
+    global _duration_table
+
     # Convert to milliseconds
     ms = round(seconds * 1000)
 
+    # Most durations are short enough to look up
+    if MIN_MILLISECONDS <= ms <= DURATION_TABLE_MILLISECONDS:
+        if _duration_table is None:
+            _duration_table = __build_duration_table()
+        return _duration_table[2 * ms], _duration_table[2 * ms + 1]
+
     # Make sure it is valid
     if ms < MIN_MILLISECONDS or ms > MAX_MILLISECONDS:
         raise InvalidTimeException(f"Milliseconds must be [{MIN_MILLISECONDS}, {MAX_MILLISECONDS:.2E}]")
 
-    # Now get the exponent and mantissa
+    # Now get the exponent and mantissa, the mantissa must not take the STX or ETX values
     exponent = 0
     mantissa = ms
 
-    while mantissa % 10 == 0 or mantissa >= 256:
+    while mantissa % 10 == 0 or mantissa > MAX_MANTISSA:
         mantissa //= 10
         exponent += 1
 
@@ -61,7 +114,7 @@ def __decode_time(mantissa: int, exponent: int) -> float:
     :param exponent: Power of ten of the number
     :return: Conversion to seconds
     """
-    ms = mantissa * (10 ** exponent)
+    ms = mantissa * _POWERS[exponent]
     seconds = ms / 1000
 
     return seconds
@@ -74,18 +127,7 @@ def __is_valid_cmd(raw_cmd: bytearray) -> bool:
     :param raw_cmd: Command received over the wire
     :return: Whether it matches the protocol
     """
-    cmd = list(raw_cmd)
-
-    if len(cmd) != PROTOCOL_LENGTH:
-        return False
-
-    if cmd[0] != STX:
-        return False
-
-    if cmd[-1] != ETX:
-        return False
-
-    return True
+    return len(raw_cmd) == PROTOCOL_LENGTH and raw_cmd[0] == STX and raw_cmd[-1] == ETX
 
 
 def encode_move_cmd(direction: Direction, duration: float) -> bytearray:
@@ -96,26 +138,13 @@ def encode_move_cmd(direction: Direction, duration: float) -> bytearray:
     :param duration: Time to repeat that direction (seconds)
     :return: Bytearray suitable for sending over the wire
     """
-    cmd = [0 for _ in range(PROTOCOL_LENGTH)]
-
-    # Set start
-    cmd[0] = STX
-
-    # Set direction
-    cmd[1] = int(direction)
-
-    # Encode time
     mantissa, exponent = __encode_time(duration)
-    cmd[2] = mantissa
-    cmd[3] = exponent
-
-    # Set end
-    cmd[-1] = ETX
 
-    logging.debug(f"Encoded command as {cmd}")
+    # Built straight from a tuple, this is quicker than packing a struct for five bytes
+    cmd = bytearray((STX, direction, mantissa, exponent, ETX))
+    EVENTS.debug("Encoded command as %s", cmd)
 
-    # Return the result converted to a byte array
-    return bytearray(cmd)
+    return cmd
 
 
 def decode_move_cmd(raw_cmd: bytearray) -> tuple[Direction, float]:
@@ -126,24 +155,196 @@ def decode_move_cmd(raw_cmd: bytearray) -> tuple[Direction, float]:
     :return: (Direction, duration in seconds)
     """
     # Make sure it is valid
-    if not __is_valid_cmd(raw_cmd):
+    if len(raw_cmd) != PROTOCOL_LENGTH:
+        raise InvalidCmdException("Command received does not match protocol")
+    start, direction_byte, mantissa, exponent, end = MOVE_CMD.unpack(raw_cmd)
+    if start != STX or end != ETX:
         raise InvalidCmdException("Command received does not match protocol")
-
-    cmd = list(raw_cmd)
 
     # Grab the direction
-    direction = Direction(cmd[1])
+    direction = _DIRECTIONS.get(direction_byte)
+    if direction is None:
+        raise InvalidCmdException(f"Unknown direction {direction_byte:#04x}")
 
     # Convert the time
-    mantissa = cmd[2]
-    exponent = cmd[3]
     duration = __decode_time(mantissa, exponent)
 
-    # Now we can return
-    logging.debug(f"Decoded command as ({direction}, {duration})")
+    # Formatted only if debug logging is on, and then off this thread
+    EVENTS.debug("Decoded command as (%s, %s)", direction, duration)
 
     return direction, duration
 
 
+def encode_many(directions, durations):
+    """
+    Encode many move instructions at once, for building logs and replays
+
+    :param directions: Direction of each move, any sequence or array of ints
+    :param durations: Duration (seconds) of each move
+    :return: NumPy uint8 array of shape (moves, PROTOCOL_LENGTH), .tobytes() gives the contiguous wire format
+    """
+    # Only the batch functions need NumPy, the Nano and Pi processes do not pay for importing it
+    import numpy as np
+    global _duration_table
+
+    directions = np.asarray(directions, dtype=np.int64)
+    ms = np.rint(np.asarray(durations, dtype=np.float64) * 1000)
+    if directions.shape != ms.shape:
+        raise ValueError("directions and durations must have the same length")
+    if len(directions) and (directions.min() < min(Direction) or directions.max() > max(Direction)):
+        raise InvalidCmdException("Unknown direction to encode")
+    if len(ms) and (ms.min() < MIN_MILLISECONDS or ms.max() > MAX_MILLISECONDS):
+        raise InvalidTimeException(f"Milliseconds must be [{MIN_MILLISECONDS}, {MAX_MILLISECONDS:.2E}]")
+
+    cmds = np.empty((len(directions), PROTOCOL_LENGTH), dtype=np.uint8)
+    cmds[:, 0] = STX
+    cmds[:, 1] = directions
+    cmds[:, 4] = ETX
+
+    # Durations within the table are looked up, any others are reduced a decade at a time
+    if _duration_table is None:
+        _duration_table = __build_duration_table()
+    table = np.frombuffer(_duration_table, dtype=np.uint8).reshape(-1, 2)
+    short = ms <= DURATION_TABLE_MILLISECONDS
+    cmds[short, 2:4] = table[ms[short].astype(np.int64)]
+
+    mantissa = ms[~short]
+    exponent = np.zeros(len(mantissa), dtype=np.uint8)
+    reduce = (np.fmod(mantissa, 10) == 0) | (mantissa > MAX_MANTISSA)
+    while reduce.any():
+        mantissa[reduce] = np.floor(mantissa[reduce] / 10)
+        exponent[reduce] += 1
+        reduce = (np.fmod(mantissa, 10) == 0) | (mantissa > MAX_MANTISSA)
+    cmds[~short, 2] = mantissa
+    cmds[~short, 3] = exponent
+
+    return cmds
+
+
+def decode_many(raw_cmds):
+    """
+    Decode many raw move commands at once, for analysing logs and replays
+
+    :param raw_cmds: Contiguous bytes of whole commands, or a uint8 array of shape (commands, PROTOCOL_LENGTH)
+    :return: (NumPy array of direction bytes, NumPy array of durations in seconds)
+    """
+    import numpy as np
+
+    if isinstance(raw_cmds, np.ndarray):
+        cmds = raw_cmds.astype(np.uint8, copy=False)
+    else:
+        cmds = np.frombuffer(raw_cmds, dtype=np.uint8)
+    if cmds.size % PROTOCOL_LENGTH:
+        raise InvalidCmdException("Commands received are not a whole number of commands")
+    cmds = cmds.reshape(-1, PROTOCOL_LENGTH)
+
+    directions = cmds[:, 1]
+    invalid = (cmds[:, 0] != STX) | (cmds[:, 4] != ETX) | (directions < min(Direction)) | \
+        (directions > max(Direction))
+    if invalid.any():
+        raise InvalidCmdException(f"Command {int(np.argmax(invalid))} received does not match protocol")
+
+    durations = cmds[:, 2] * np.power(10.0, cmds[:, 3]) / 1000
+
+    return directions.copy(), durations
+
+
+def is_setpoint_cmd(raw_cmd: bytearray) -> bool:
+    """
+    Check whether a raw command carries a joystick setpoint rather than a move
+
+    :param raw_cmd: Raw bytes received over the wire
+    :return: Whether the command is a setpoint
+    """
+    return len(raw_cmd) == PROTOCOL_LENGTH and raw_cmd[1] == SETPOINT
+
+
+def encode_setpoint_cmd(x: int, y: int) -> bytearray:
+    """
+    Encode a joystick setpoint to raw protocol for sending
+
+    :param x: Joystick x position [MIN_SETPOINT, MAX_SETPOINT], positive is right
+    :param y: Joystick y position [MIN_SETPOINT, MAX_SETPOINT], positive is forward
+    :return: Bytearray suitable for sending over the wire
+    """
+    if not (MIN_SETPOINT <= x <= MAX_SETPOINT and MIN_SETPOINT <= y <= MAX_SETPOINT):
+        raise InvalidSetpointException(f"Setpoint must be within [{MIN_SETPOINT}, {MAX_SETPOINT}]")
+
+    # Offset so the bytes never take the STX or ETX values
+    return bytearray((STX, SETPOINT, int(x) + SETPOINT_OFFSET, int(y) + SETPOINT_OFFSET, ETX))
+
+
+def decode_setpoint_cmd(raw_cmd: bytearray) -> tuple[int, int]:
+    """
+    Decode a raw setpoint command into a joystick position
+
+    :param raw_cmd: Raw bytes received over the wire
+    :return: (x, y)
+    """
+    if not __is_valid_cmd(raw_cmd) or raw_cmd[1] != SETPOINT:
+        raise InvalidCmdException("Command received is not a setpoint")
+
+    x = raw_cmd[2] - SETPOINT_OFFSET
+    y = raw_cmd[3] - SETPOINT_OFFSET
+    if not (MIN_SETPOINT <= x <= MAX_SETPOINT and MIN_SETPOINT <= y <= MAX_SETPOINT):
+        raise InvalidCmdException(f"Setpoint ({x}, {y}) out of range")
+
+    return x, y
+
+
+def is_heartbeat_cmd(raw_cmd: bytearray) -> bool:
+    """
+    Check whether a raw command is a heartbeat
+
+    :param raw_cmd: Raw bytes received over the wire
+    :return: Whether the command is a heartbeat
+    """
+    return len(raw_cmd) == PROTOCOL_LENGTH and raw_cmd[1] == HEARTBEAT
+
+
+def encode_heartbeat_cmd(sequence: int = 0) -> bytearray:
+    """
+    Encode a heartbeat to raw protocol for sending
+
+    :param sequence: Rolling counter to tell heartbeats apart, wrapped to [0x00, 0xfd]
+    :return: Bytearray suitable for sending over the wire
+    """
+    return bytearray((STX, HEARTBEAT, sequence % STX, 0x00, ETX))
+
+
+def is_trace_cmd(raw_cmd: bytearray) -> bool:
+    """
+    Check whether a raw command is a trace tag for the command after it
+
+    :param raw_cmd: Raw bytes received over the wire
+    :return: Whether the command is a trace tag
+    """
+    return len(raw_cmd) == PROTOCOL_LENGTH and raw_cmd[1] == TRACE
+
+
+def encode_trace_cmd(trace_id: int) -> bytearray:
+    """
+    Encode a trace tag to raw protocol for sending immediately before the command it tags
+
+    :param trace_id: Id of the trace, wrapped to [0, MAX_TRACE_ID]
+    :return: Bytearray suitable for sending over the wire
+    """
+    trace_id &= MAX_TRACE_ID
+    return bytearray((STX, TRACE, trace_id >> 7, trace_id & 0x7f, ETX))
+
+
+def decode_trace_cmd(raw_cmd: bytearray) -> int:
+    """
+    Decode a raw trace tag
+
+    :param raw_cmd: Raw bytes received over the wire
+    :return: Trace id
+    """
+    if not __is_valid_cmd(raw_cmd) or raw_cmd[1] != TRACE:
+        raise InvalidCmdException("Command received is not a trace tag")
+
+    return (raw_cmd[2] & 0x7f) << 7 | (raw_cmd[3] & 0x7f)
+
+
 if __name__ == "__main__":
     logging.error("Should not be run directly. Import its functionality.")
@@ -28,6 +28,29 @@ MAX_EXPONENT = 0xfd
 MIN_MILLISECONDS = MIN_MANTISSA * (10 ** MIN_EXPONENT)
 MAX_MILLISECONDS = MAX_MANTISSA * (10 ** MAX_EXPONENT)
 
+SETPOINT = 0x06
+""" Message type of a joystick setpoint, sent in place of a direction """
+SETPOINT_OFFSET = 0x80
+MIN_SETPOINT = -100
+MAX_SETPOINT = 100
+SETPOINT_HOLD_TIMEOUT = 0.2
+""" Seconds the Pi holds a streamed setpoint without an update before stopping """
+
+HEARTBEAT = 0x07
+""" Message type of a heartbeat, sent in place of a direction """
+HEARTBEAT_PERIOD = 0.03
+""" Seconds between heartbeats from the Nano when it has no command to send """
+WATCHDOG_WINDOW = 0.1
+""" Seconds the Pi waits for a heartbeat or command before stopping the chair """
+
+TRACE = 0x08
+""" Message type tagging the next command with a trace id, sent in place of a direction """
+MAX_TRACE_ID = 0x3fff
+""" Trace ids are sent as two 7 bit halves """
+
+COALESCE_REFRESH_LEAD = 0.05
+""" Seconds before a written drive runs out that the Nano writes the extension merged into it """
+
 # ========================================
 
 
@@ -41,4 +64,9 @@ RECONNECTION_ATTEMPTS = 5
 
 SOCKET_HOST = "127.0.0.1"
 SOCKET_PORT = 1165
+SOCKET_OVERRIDE_PORT = 1166
+SOCKET_UNIX_PATH = "/tmp/nxt_wheelchair.sock"
+
+PRIORITY_NORMAL = 0
+PRIORITY_OVERRIDE = 1
 # ========================================
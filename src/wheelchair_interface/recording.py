@@ -0,0 +1,177 @@
+"""
+file: recording.py
+
+description: Optional recorder writing every can frame and UART command to a compact fixed-width binary log
+
+note:
+    - Every record is RECORD.size (24) bytes so a log can be memory-mapped and read as an array, see replay.py
+    - The first record of a log is a KIND_HEADER record holding the wall clock time the log was opened, the other
+      records carry monotonic timestamps
+"""
+import atexit
+import logging
+import struct
+import threading
+
+from collections import deque
+from time import monotonic_ns, time_ns
+
+
+RECORD = struct.Struct("<QBB2xI8s")
+""" Layout of a record: monotonic ns, kind, data length, padding, can id (0 for UART), data """
+
+CAN_FRAME = struct.Struct("IB3x8s")
+""" Layout of a classic struct can_frame, the same as RNetController.CAN_FRAME """
+
+HEADER_MAGIC = 0x5254584e
+""" Can id of the header record, "NXTR" in little endian """
+
+KIND_HEADER = 0
+""" First record of a log, its data is the wall clock ns the log was opened at """
+
+KIND_CAN_TX = 1
+""" Frame sent on the can bus """
+
+KIND_CAN_JOB = 2
+""" Frame handed to a BCM transmit job, the kernel repeats it until the next job update """
+
+KIND_CAN_RX = 3
+""" Frame received from the can bus """
+
+KIND_UART = 4
+""" Command decoded from the UART, the data is the whole 5 byte command """
+
+KINDS = {KIND_HEADER: "header", KIND_CAN_TX: "can_tx", KIND_CAN_JOB: "can_job", KIND_CAN_RX: "can_rx",
+         KIND_UART: "uart"}
+""" Name of every kind of record """
+
+
+class Recorder:
+    """
+    Packs records on the calling thread and writes them to the log from a background thread, recording is a no-op
+    while disabled
+    """
+    def __init__(self):
+        """
+        Constructor for a disabled recorder
+        """
+        self.enabled = False
+        """ Checked by the hooks before recording so they cost nothing while off """
+
+        self.records = 0
+        """ Number of records written to the log """
+
+        self._pending = deque()
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self, path: str, flush_interval: float = 0.5) -> None:
+        """
+        Start appending records to a log
+
+        :param path: File to append to
+        :param flush_interval: Seconds between writes of the pending records
+        """
+        if self._file is not None:
+            self.close()
+
+        self._file = open(path, "ab", buffering=1 << 16)
+        self._stop.clear()
+        self.record(KIND_HEADER, HEADER_MAGIC, time_ns().to_bytes(8, "little"), force=True)
+        self._thread = threading.Thread(target=self.__write, args=(flush_interval,), daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def record(self, kind: int, can_id: int, data: bytes, force: bool = False) -> None:
+        """
+        Queue a record for the writer
+
+        :param kind: One of KINDS
+        :param can_id: Can id including flags, 0 for UART commands
+        :param data: Up to 8 bytes of data
+        :param force: Record even while disabled
+        """
+        if self.enabled or force:
+            self._pending.append(RECORD.pack(monotonic_ns(), kind, len(data), can_id, data))
+
+    def record_frame(self, kind: int, frame: bytes) -> None:
+        """
+        Queue a record of a built can frame
+
+        :param kind: KIND_CAN_TX or KIND_CAN_JOB
+        :param frame: Frame in the can_frame layout
+        """
+        if self.enabled:
+            can_id, dlc, data = CAN_FRAME.unpack(frame)
+            self._pending.append(RECORD.pack(monotonic_ns(), kind, dlc, can_id, data))
+
+    def attach(self, receiver) -> None:
+        """
+        Record every frame a CanReceiver receives
+
+        :param receiver: Receiver to subscribe to
+        """
+        receiver.subscribe(lambda can_id, data: self.record(KIND_CAN_RX, can_id, bytes(data)))
+
+    def close(self) -> None:
+        """
+        Stop recording and write out everything still pending
+        """
+        self.enabled = False
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self.__drain()
+            self._file.close()
+            self._file = None
+
+    def __drain(self) -> None:
+        """
+        Write every pending record to the log
+        """
+        chunk = []
+        try:
+            while True:
+                chunk.append(self._pending.popleft())
+        except IndexError:
+            pass
+
+        if chunk:
+            self._file.write(b"".join(chunk))
+            self._file.flush()
+            self.records += len(chunk)
+
+    def __write(self, flush_interval: float) -> None:
+        """
+        Body of the writer thread
+
+        :param flush_interval: Seconds between writes of the pending records
+        """
+        while not self._stop.wait(flush_interval):
+            try:
+                self.__drain()
+            except OSError:
+                logging.error("Failed to write to the recording, stopping the recorder")
+                self.enabled = False
+                return
+
+
+RECORDER = Recorder()
+""" Recorder shared by the whole process """
+
+
+def start(path: str, flush_interval: float = 0.5) -> Recorder:
+    """
+    Start recording in this process, the log is completed when the process exits
+
+    :param path: File to append records to
+    :param flush_interval: Seconds between writes of the pending records
+    :return: The process recorder
+    """
+    RECORDER.open(path, flush_interval)
+    atexit.register(RECORDER.close)
+
+    return RECORDER
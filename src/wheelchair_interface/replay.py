@@ -0,0 +1,232 @@
+"""
+file: replay.py
+
+description: Analysis and replay of binary logs written by recording.py
+
+note:
+    - Logs are memory-mapped, so a log of a multi-hour session is not read into memory before it is analysed
+"""
+import argparse
+import json
+import logging
+import mmap
+import socket
+
+import numpy as np
+
+from time import monotonic, sleep
+
+from .protocol.processor import decode_many
+from .protocol.resources import Direction, PROTOCOL_LENGTH
+from .recording import RECORD, KINDS, KIND_CAN_JOB, KIND_CAN_RX, KIND_CAN_TX, KIND_HEADER, KIND_UART
+from .rnet_controller.RNetController import RNetController
+
+
+RECORD_DTYPE = np.dtype([
+    ("ns", "<u8"),
+    ("kind", "u1"),
+    ("length", "u1"),
+    ("pad", "V2"),
+    ("can_id", "<u4"),
+    ("data", "u1", (8,)),
+])
+""" recording.RECORD as a NumPy structured type """
+
+CAN_FRAME_DTYPE = np.dtype([
+    ("can_id", "<u4"),
+    ("dlc", "u1"),
+    ("pad", "V3"),
+    ("data", "u1", (8,)),
+])
+""" RNetController.CAN_FRAME as a NumPy structured type """
+
+assert RECORD_DTYPE.itemsize == RECORD.size
+assert CAN_FRAME_DTYPE.itemsize == RNetController.CAN_FRAME.size
+
+
+def load(path: str) -> np.ndarray:
+    """
+    Memory-map a log as an array of records
+
+    :param path: Log written by recording.Recorder
+    :return: Read only array of RECORD_DTYPE, a partly written final record is left out
+    """
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can not be mapped
+            return np.empty(0, RECORD_DTYPE)
+
+    # The array keeps the mapping open after the file is closed
+    return np.frombuffer(mapped, RECORD_DTYPE, count=len(mapped) // RECORD_DTYPE.itemsize)
+
+
+def drive_directions(records: np.ndarray) -> np.ndarray:
+    """
+    Classify drive frames by the direction their joystick position points in
+
+    :param records: Drive frame records
+    :return: Direction value of every record
+    """
+    x = records["data"][:, 0].view(np.int8).astype(np.int16)
+    y = records["data"][:, 1].view(np.int8).astype(np.int16)
+
+    return np.where((x == 0) & (y == 0), Direction.STOP,
+                    np.where(np.abs(y) >= np.abs(x),
+                             np.where(y > 0, Direction.FORWARD, Direction.BACKWARD),
+                             np.where(x > 0, Direction.RIGHT, Direction.LEFT)))
+
+
+def histogram(values: np.ndarray) -> dict[str, int]:
+    """
+    Count direction values
+
+    :param values: Direction values
+    :return: Count keyed by direction name, directions which do not appear are left out
+    """
+    counts = np.bincount(values, minlength=len(Direction) + 1)
+
+    return {direction.name: int(counts[direction]) for direction in Direction if counts[direction]}
+
+
+def gap_summary(ns: np.ndarray) -> dict[str, float]:
+    """
+    Summarize the spacing of timestamps
+
+    :param ns: Sorted monotonic ns timestamps
+    :return: {"count", "mean_ms", "p50_ms", "p99_ms", "max_ms"}, only the count if there are fewer than 2
+    """
+    if len(ns) < 2:
+        return {"count": int(len(ns))}
+
+    gaps = np.diff(ns) / 1e6
+
+    return {
+        "count": int(len(ns)),
+        "mean_ms": float(gaps.mean()),
+        "p50_ms": float(np.percentile(gaps, 50)),
+        "p99_ms": float(np.percentile(gaps, 99)),
+        "max_ms": float(gaps.max()),
+    }
+
+
+def analyse(records: np.ndarray) -> dict:
+    """
+    Summarize a log
+
+    :param records: Output of load
+    :return: Record counts, duration, drive frame spacing, command rate and direction histograms
+    """
+    kinds = records["kind"]
+    body = records[kinds != KIND_HEADER]
+    if len(body) == 0:
+        return {"records": 0}
+
+    duration = (body["ns"][-1] - body["ns"][0]) / 1e9
+    counts = np.bincount(body["kind"], minlength=len(KINDS))
+    summary = {
+        "records": int(len(body)),
+        "duration_s": float(duration),
+        "kinds": {name: int(counts[kind]) for kind, name in KINDS.items() if kind != KIND_HEADER},
+    }
+
+    drive_ids = body["can_id"] == RNetController.DRIVE_FRAME_ID
+    for kind in (KIND_CAN_TX, KIND_CAN_JOB, KIND_CAN_RX):
+        drive = body[drive_ids & (body["kind"] == kind)]
+        if len(drive):
+            summary[f"{KINDS[kind]}_drive_gaps"] = gap_summary(drive["ns"])
+            summary[f"{KINDS[kind]}_directions"] = histogram(drive_directions(drive))
+
+    uart = body[body["kind"] == KIND_UART]
+    if len(uart):
+        # Byte 1 of a UART command is its type, which is the direction for a move
+        types = uart["data"][:, 1]
+        is_move = (types >= min(Direction)) & (types <= max(Direction))
+        moves, move_seconds = decode_many(uart["data"][is_move, :PROTOCOL_LENGTH])
+        summary["uart_commands_per_s"] = float(len(moves) / duration) if duration else 0.0
+        summary["uart_directions"] = histogram(moves)
+        if len(moves):
+            summary["uart_move_seconds"] = {"mean": float(move_seconds.mean()), "max": float(move_seconds.max())}
+
+    return summary
+
+
+def frames(records: np.ndarray) -> list[bytes]:
+    """
+    Rebuild the can frames of records
+
+    :param records: Can records
+    :return: Frames ready to send, in the order of the records
+    """
+    built = np.zeros(len(records), CAN_FRAME_DTYPE)
+    built["can_id"] = records["can_id"]
+    built["dlc"] = records["length"]
+    built["data"] = records["data"]
+
+    raw = built.tobytes()
+    size = CAN_FRAME_DTYPE.itemsize
+
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+def replay(records: np.ndarray, can_socket: socket.socket, speed: float = 1.0,
+           kinds: tuple[int, ...] = (KIND_CAN_TX, KIND_CAN_JOB)) -> int:
+    """
+    Send the can frames of a log again with their original spacing
+
+    :param records: Output of load
+    :param can_socket: Raw can socket to send on
+    :param speed: Playback speed, 2.0 replays twice as fast and 0 sends as fast as possible
+    :param kinds: Record kinds to send
+    :return: Number of frames sent
+    """
+    selected = records[np.isin(records["kind"], kinds)]
+    if len(selected) == 0:
+        return 0
+
+    # Offsets are computed up front so the send loop only has to wait and send
+    offsets = (selected["ns"] - selected["ns"][0]) / 1e9
+    offsets = offsets / speed if speed else np.zeros(len(selected))
+
+    start = monotonic()
+    sent = 0
+    for offset, frame in zip(offsets.tolist(), frames(selected)):
+        delay = start + offset - monotonic()
+        if delay > 0:
+            sleep(delay)
+        try:
+            can_socket.send(frame)
+            sent += 1
+        except socket.error:
+            logging.error(f"Failed to replay can frame {frame.hex()}")
+
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a recording and optionally replay it onto a can bus")
+    parser.add_argument("path", help="Log written by recording.Recorder")
+    parser.add_argument("--json", help="Also write the analysis to this file")
+    parser.add_argument("--vcan", type=int, help="Replay the sent frames onto vcan<N>")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    records = load(args.path)
+    summary = analyse(records)
+    print(json.dumps(summary, indent=2))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.vcan is not None:
+        can_socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        can_socket.bind((f"vcan{args.vcan}",))
+        sent = replay(records, can_socket, args.speed)
+        can_socket.close()
+        logging.info(f"Replayed {sent} frames onto vcan{args.vcan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+file: AsyncRNetController.py
+
+description: Non-blocking asyncio counterpart of RNetController, motions run as tasks on the caller's event loop
+
+note:
+    - Frames are written through loop.sock_sendall on a non-blocking raw socket, so waiting for room in the socket
+      buffer parks the task on the loop instead of blocking it. ENOBUFS, which the loop does not wait out, is retried
+      with the same backoff as FrameSender.
+    - Only one motion runs at a time, starting a motion replaces the one running
+"""
+
+import asyncio
+import errno
+import logging
+import socket
+
+from .FrameSender import FrameSender, SendStats
+from .PeriodicTransmitter import TransmitStats
+from .RNetController import RNetController
+from ..eventlog import EVENTS
+from ..protocol.resources import Direction
+
+
+class Motion:
+    """
+    Handle of one timed motion, await it to wait for the motion to end
+    """
+    def __init__(self, direction: Direction, seconds: float):
+        """
+        Constructor for a motion which has not started
+
+        :param direction: Direction driven
+        :param seconds: Duration asked for
+        """
+        self.direction = direction
+        self.seconds = seconds
+        self.frames = 0
+        """ Number of frames sent so far """
+
+        self.replaced = False
+        """ Whether a newer motion took over before this one finished """
+
+        self._task = None
+        self._until = 0.0
+
+    def cancel(self) -> None:
+        """
+        End the motion early and stop the chair, does nothing if it already ended
+        """
+        if self._task is not None:
+            self._task.cancel()
+
+    def done(self) -> bool:
+        """
+        :return: Whether the motion has ended, for any reason
+        """
+        return self._task is not None and self._task.done()
+
+    async def wait(self) -> bool:
+        """
+        Wait for the motion to end
+
+        :return: True if it ran for its whole duration, False if it was cancelled or replaced
+        """
+        return await asyncio.shield(self._task)
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    def __repr__(self) -> str:
+        state = "replaced" if self.replaced else "done" if self.done() else "running"
+        return f"Motion({self.direction.name}, {self.seconds}s, frames={self.frames}, {state})"
+
+
+class AsyncRNetController:
+    """
+    Drives the chair from an asyncio event loop without blocking it.
+
+    Every motion method returns a Motion straight away while its frames are sent from a task on the loop, so input
+    processing and chair control can share one thread.
+    """
+    FRAME_PERIOD = RNetController.FRAME_PERIOD
+    """ Seconds between repeated drive frames """
+
+    def __init__(self, bus_num: int = 0, frame_period: float = FRAME_PERIOD, can_socket: socket.socket = None):
+        """
+        Constructor for a controller, connects to the given bus number. Create it from the loop it is used on.
+
+        :param bus_num: Bus number to connect to
+        :param frame_period: Seconds between repeated frames while driving
+        :param can_socket: Already open raw socket to use instead of connecting to the bus
+        """
+        if frame_period <= 0:
+            raise ValueError("Frame period must be positive")
+
+        self.frame_period = frame_period
+        self.stats = TransmitStats()
+        """ Send jitter of the repeated frames """
+
+        self.send_stats = SendStats()
+        """ Sent, dropped and retried frames and time spent waiting for room """
+
+        self._loop = asyncio.get_running_loop()
+        self._motion = None
+
+        if can_socket is None:
+            try:
+                can_socket = RNetController._open_connection(bus_num)
+            except socket.error:
+                can_socket = None
+        if can_socket is not None:
+            can_socket.setblocking(False)
+        self._can_socket = can_socket
+
+    def is_connected(self) -> bool:
+        """
+        :return: Whether there is an open connection to the bus
+        """
+        return self._can_socket is not None
+
+    async def send_frame(self, frame: bytes) -> bool:
+        """
+        Send an already built frame, waiting on the loop while the transmit queue is full
+
+        :param frame: Frame from RNetController.drive_frame, speed_frame or STOP_FRAME_BYTES
+        :return: Whether the frame was sent, False if it was dropped after waiting a frame period
+        """
+        if self._can_socket is None:
+            logging.error("Cannot send command as no canbus socket is open")
+            return False
+
+        keep = frame == RNetController.STOP_FRAME_BYTES
+        start = self._loop.time()
+        backoff = FrameSender.BACKOFF[0]
+        while True:
+            try:
+                # Parks on the loop while the socket buffer is full (EAGAIN)
+                await asyncio.wait_for(self._loop.sock_sendall(self._can_socket, frame),
+                                       None if keep else self.frame_period)
+                self.send_stats.sent += 1
+                return True
+
+            except asyncio.TimeoutError:
+                pass
+
+            except OSError as e:
+                # The interface queue is full, which the loop can not wait for
+                if e.errno != errno.ENOBUFS:
+                    EVENTS.error("Error sending CAN frame %s", frame)
+                    return False
+
+            now = self._loop.time()
+            if not keep and now - start >= self.frame_period:
+                self.send_stats.dropped += 1
+                self.send_stats.blocked_time += now - start
+                return False
+
+            self.send_stats.retried += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, FrameSender.BACKOFF[1])
+            self.send_stats.blocked_time += self._loop.time() - now
+
+    def drive(self, direction: Direction, seconds: float) -> Motion:
+        """
+        Start driving a direction, replacing the motion running
+
+        :param direction: Direction to move in
+        :param seconds: Time to move in that direction
+        :return: Handle of the motion, which has already started
+        """
+        if self._motion is not None and not self._motion.done():
+            self._motion.replaced = True
+            self._motion.cancel()
+
+        motion = Motion(direction, seconds)
+        motion._until = self._loop.time() + seconds
+        motion._task = self._loop.create_task(self.__run(motion))
+        self._motion = motion
+
+        return motion
+
+    def drive_forward(self, seconds: float) -> Motion:
+        """
+        Start driving forward
+
+        :param seconds: Time to drive for
+        :return: Handle of the motion
+        """
+        return self.drive(Direction.FORWARD, seconds)
+
+    def drive_back(self, seconds: float) -> Motion:
+        """
+        Start driving backward
+
+        :param seconds: Time to drive for
+        :return: Handle of the motion
+        """
+        return self.drive(Direction.BACKWARD, seconds)
+
+    def turn_left(self, seconds: float) -> Motion:
+        """
+        Start turning left
+
+        :param seconds: Time to turn for
+        :return: Handle of the motion
+        """
+        return self.drive(Direction.LEFT, seconds)
+
+    def turn_right(self, seconds: float) -> Motion:
+        """
+        Start turning right
+
+        :param seconds: Time to turn for
+        :return: Handle of the motion
+        """
+        return self.drive(Direction.RIGHT, seconds)
+
+    def extend_motion(self, direction: Direction, seconds: float) -> bool:
+        """
+        Keep the motion running going if it is in the given direction, the frames carry on without a gap
+
+        :param direction: Direction the motion has to be in
+        :param seconds: Time from now to keep moving for
+        :return: Whether the motion was extended, False if there is none in that direction
+        """
+        motion = self._motion
+        if motion is None or motion.done() or motion.direction != direction:
+            return False
+
+        motion._until = max(motion._until, self._loop.time() + seconds)
+        return True
+
+    async def stop(self) -> None:
+        """
+        Cancel the motion running and stop the chair
+        """
+        if self._motion is not None and not self._motion.done():
+            self._motion.cancel()
+            await self._motion.wait()
+        else:
+            await self.send_frame(RNetController.STOP_FRAME_BYTES)
+
+    async def set_speed_range(self, speed_range: int) -> bool:
+        """
+        Set the speed of the chair
+
+        :param speed_range: Speed range to set (between 0 and 100)
+        :return: Whether the speed was successfully set
+        """
+        if not RNetController.MIN_SPEED <= speed_range <= RNetController.MAX_SPEED:
+            logging.error(f"Invalid RNET SpeedRange: {speed_range}")
+            return False
+
+        return await self.send_frame(RNetController.speed_frame(speed_range))
+
+    async def __run(self, motion: Motion) -> bool:
+        """
+        Body of a motion task: send its frame on every deadline until it ends
+
+        :param motion: Motion to run
+        :return: Whether it ran for its whole duration
+        """
+        frame = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[motion.direction])
+        start = self._loop.time()
+        index = 0
+
+        try:
+            while True:
+                deadline = start + index * self.frame_period
+                if deadline >= motion._until:
+                    # Hold until the end of the duration, then carry on only if the motion was extended meanwhile
+                    remaining = motion._until - self._loop.time()
+                    if remaining <= 0:
+                        break
+                    await asyncio.sleep(remaining)
+                    continue
+
+                delay = deadline - self._loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.stats.record(max(0.0, self._loop.time() - deadline))
+                if await self.send_frame(frame):
+                    motion.frames += 1
+
+                index += 1
+                behind = int((self._loop.time() - start) // self.frame_period) + 1 - index
+                if behind > 0:
+                    # Skip the slots rather than bursting to catch up, as PeriodicTransmitter does
+                    self.stats.missed_deadlines += behind
+                    index += behind
+
+            await self.send_frame(RNetController.STOP_FRAME_BYTES)
+            return True
+
+        except asyncio.CancelledError:
+            # A replacing motion sends its own frame straight away, anything else has to stop the chair
+            if not motion.replaced:
+                await self.send_frame(RNetController.STOP_FRAME_BYTES)
+            return False
+
+    async def close(self) -> None:
+        """
+        Stop the chair and close the connection
+        """
+        if self._can_socket is not None:
+            await self.stop()
+            self._can_socket.close()
+            self._can_socket = None
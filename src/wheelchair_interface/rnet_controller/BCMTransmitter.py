@@ -0,0 +1,101 @@
+"""
+file: BCMTransmitter.py
+
+description: Hands cyclic frames to the SocketCAN broadcast manager (CAN_BCM) so the kernel repeats them
+"""
+
+import logging
+import math
+import socket
+import struct
+
+
+class BCMTransmitter:
+    """
+    Manages cyclic transmit jobs on a connected CAN_BCM socket, one job per can id
+    """
+    MSG_HEAD = struct.Struct("@3I4l2I0q")
+    """ struct bcm_msg_head: opcode, flags, count, ival1 (sec, usec), ival2 (sec, usec), can_id, nframes """
+
+    CAN_ID = struct.Struct("=I")
+    """ Leading can id of a can_frame """
+
+    def __init__(self, bcm_socket: socket.socket, frame_period: float):
+        """
+        Constructor for a transmitter on an already connected broadcast manager socket
+
+        :param bcm_socket: Socket opened with CAN_BCM (or a stand-in accepting the same messages)
+        :param frame_period: Seconds between frames of a cyclic job
+        """
+        self._socket = bcm_socket
+        self.frame_period = frame_period
+        self._jobs = set()
+        self._held = set()
+        """ Can ids of jobs set up to run out, their timer has to be set up again by the next frame """
+
+    def _message(self, opcode: int, flags: int, can_id: int, frame: bytes = b"", count: int = 0) -> bytes:
+        """
+        Build a broadcast manager message
+
+        :param opcode: CAN_BCM_* operation
+        :param flags: CAN_BCM_* flags
+        :param can_id: Can id the job is keyed by
+        :param frame: Optional can_frame to attach
+        :param count: Frames sent a period apart before the job runs out, 0 to repeat them until the job is replaced
+        :return: Message ready to write to the socket
+        """
+        seconds, microseconds = divmod(round(self.frame_period * 1_000_000), 1_000_000)
+        if count:
+            # count frames on the first interval, then none as the second interval is zero
+            head = self.MSG_HEAD.pack(opcode, flags, count, seconds, microseconds, 0, 0, can_id, 1 if frame else 0)
+        else:
+            head = self.MSG_HEAD.pack(opcode, flags, 0, 0, 0, seconds, microseconds, can_id, 1 if frame else 0)
+
+        return head + frame
+
+    def set_frame(self, frame: bytes, hold: float = None) -> None:
+        """
+        Repeat a frame every period, replacing the data of a running job with the same can id in place
+
+        :param frame: Built can_frame to repeat
+        :param hold: Seconds the kernel repeats it for before the job runs out and the bus goes quiet, None to repeat
+            it until replaced. A hold is set up again each time, restarting the timer with the frame sent at once.
+        """
+        can_id, = self.CAN_ID.unpack_from(frame)
+        count = 0
+
+        if hold is not None:
+            count = max(1, math.ceil(hold / self.frame_period))
+            flags = socket.CAN_BCM_SETTIMER | socket.CAN_BCM_STARTTIMER | socket.CAN_BCM_TX_ANNOUNCE
+            self._held.add(can_id)
+        elif can_id in self._jobs and can_id not in self._held:
+            # Only the data changes, the kernel keeps the existing timer so the cadence is unbroken
+            flags = 0
+        else:
+            flags = socket.CAN_BCM_SETTIMER | socket.CAN_BCM_STARTTIMER
+            self._held.discard(can_id)
+        self._jobs.add(can_id)
+
+        self._socket.send(self._message(socket.CAN_BCM_TX_SETUP, flags, can_id, frame, count))
+
+    def send_once(self, frame: bytes) -> None:
+        """
+        Send a single frame without creating a cyclic job
+
+        :param frame: Built can_frame to send
+        """
+        can_id, = self.CAN_ID.unpack_from(frame)
+        self._socket.send(self._message(socket.CAN_BCM_TX_SEND, 0, can_id, frame))
+
+    def delete_all(self) -> None:
+        """
+        Remove every cyclic job started by this transmitter
+        """
+        for can_id in self._jobs:
+            try:
+                self._socket.send(self._message(socket.CAN_BCM_TX_DELETE, 0, can_id))
+            except socket.error:
+                logging.debug(f"Failed to delete BCM job for can id {can_id:08x}")
+
+        self._jobs.clear()
+        self._held.clear()
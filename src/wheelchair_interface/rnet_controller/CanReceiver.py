@@ -0,0 +1,205 @@
+"""
+file: CanReceiver.py
+
+description: Background receiver which observes the can bus with kernel side filters
+"""
+
+import asyncio
+import logging
+import socket
+import struct
+import threading
+
+from typing import Callable
+
+from .RNetController import RNetController
+from ..eventlog import EVENTS
+
+
+class CanReceiver:
+    """
+    Reads frames from a raw can socket on a background thread and hands them to subscribers.
+
+    The kernel drops every frame not matching the filters. Frames are read with recv_into into a ring of
+    preallocated buffers, so a subscriber is given a memoryview of the data which is only valid until the ring
+    wraps around; copy it if it has to be kept.
+    """
+    FRAME = RNetController.CAN_FRAME
+    """ Layout of a classic struct can_frame """
+
+    HEAD = struct.Struct("IB")
+    """ can_id and dlc at the start of a can_frame, unpacked without copying the data """
+
+    FILTER = struct.Struct("=II")
+    """ Layout of a struct can_filter: can_id, can_mask """
+
+    ERR_FILTER = struct.Struct("=I")
+    """ Layout of the CAN_RAW_ERR_FILTER option """
+
+    CAN_RAW_ERR_FILTER = 2
+    """ Socket option from linux/can/raw.h, not exported by the socket module """
+
+    CAN_ERR_MASK_ALL = 0x1fffffff
+    """ Receive every class of error frame """
+
+    EXACT_EFF_MASK = socket.CAN_EFF_FLAG | socket.CAN_RTR_FLAG | socket.CAN_EFF_MASK
+    """ Mask matching a single extended id exactly """
+
+    RNET_FRAME_IDS = [RNetController.DRIVE_FRAME_ID, RNetController.SPEED_FRAME_ID]
+    """ Joystick and speed frames, the ones worth watching to see what the chair is told """
+
+    RECEIVE_BUFFER = 1 << 18
+    """ Kernel receive buffer in bytes, room for seconds of a saturated 125 kbit/s bus if the thread stalls """
+
+    STOP_POLL = 0.2
+    """ Seconds between checks for close while the bus is quiet """
+
+    def __init__(self, can_socket: socket.socket, can_ids: list[int] = None, errors: bool = True,
+                 ring_size: int = 256, receive_buffer: int = RECEIVE_BUFFER):
+        """
+        Constructor for a receiver on a bound raw can socket, it does not read until started
+
+        :param can_socket: Raw can socket to receive on (a separate socket to the one transmitting)
+        :param can_ids: Extended can ids (with CAN_EFF_FLAG) to receive, None for every id
+        :param errors: Whether to receive error frames
+        :param ring_size: Number of frame buffers to cycle through
+        :param receive_buffer: Kernel receive buffer size in bytes
+        """
+        self._socket = can_socket
+        self._ring = [bytearray(self.FRAME.size) for _ in range(ring_size)]
+        # A view of the data of every buffer for every length, so nothing is sliced per frame
+        self._data_views = [[memoryview(buffer)[8:8 + length] for length in range(9)] for buffer in self._ring]
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.received = 0
+        """ Number of frames received """
+
+        self.errors = 0
+        """ Number of error frames received """
+
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        if can_ids is not None:
+            self.set_filters(can_ids)
+        if errors:
+            self._socket.setsockopt(socket.SOL_CAN_RAW, self.CAN_RAW_ERR_FILTER,
+                                    self.ERR_FILTER.pack(self.CAN_ERR_MASK_ALL))
+
+    @classmethod
+    def open(cls, bus_num: int = 0, **kwargs) -> "CanReceiver":
+        """
+        Open a raw socket on the bus (or its vcan) and build a receiver on it
+
+        :param bus_num: Bus number to connect to
+        :param kwargs: Passed on to the constructor
+        :return: Receiver, not yet started
+        """
+        return cls(RNetController._open_connection(bus_num), **kwargs)
+
+    def set_filters(self, can_ids: list[int]) -> None:
+        """
+        Only receive the given ids, the kernel drops the rest
+
+        :param can_ids: Extended can ids (with CAN_EFF_FLAG) to receive
+        """
+        filters = b"".join(self.FILTER.pack(can_id, self.EXACT_EFF_MASK) for can_id in can_ids)
+        self._socket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, filters)
+
+    def subscribe(self, callback: Callable[[int, memoryview], None]) -> None:
+        """
+        Call a function from the receive thread for every frame, error frames included with CAN_ERR_FLAG in their id
+
+        :param callback: Called with (can id including flags, data) for every frame
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[int, memoryview], None]) -> None:
+        """
+        Stop calling a subscribed function
+
+        :param callback: Function passed to subscribe
+        """
+        self._subscribers.remove(callback)
+
+    def stream(self, loop: asyncio.AbstractEventLoop = None, maxsize: int = 0) -> asyncio.Queue:
+        """
+        Receive frames on an asyncio queue, data is copied to bytes as the buffer is reused
+
+        :param loop: Loop the queue belongs to, the running loop by default
+        :param maxsize: Size limit of the queue, frames are dropped while it is full
+        :return: Queue of (can id including flags, data)
+        """
+        loop = loop or asyncio.get_running_loop()
+        frames = asyncio.Queue(maxsize)
+
+        def put(frame):
+            if not frames.full():
+                frames.put_nowait(frame)
+
+        self.subscribe(lambda can_id, data: loop.call_soon_threadsafe(put, (can_id, bytes(data))))
+
+        return frames
+
+    def start(self) -> threading.Thread:
+        """
+        Start receiving on a daemon thread
+
+        :return: The started thread
+        """
+        self._stop.clear()
+        self._socket.settimeout(self.STOP_POLL)
+        self._thread = threading.Thread(target=self.__run, daemon=True)
+        self._thread.start()
+
+        return self._thread
+
+    def close(self) -> None:
+        """
+        Stop receiving and close the socket
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._socket.close()
+
+    def __run(self) -> None:
+        """
+        Body of the receive thread
+        """
+        ring = self._ring
+        data_views = self._data_views
+        ring_size = len(ring)
+        frame_size = self.FRAME.size
+        unpack_from = self.HEAD.unpack_from
+        index = 0
+
+        while not self._stop.is_set():
+            buffer = ring[index]
+            try:
+                count = self._socket.recv_into(buffer)
+            except TimeoutError:
+                continue
+            except OSError:
+                if not self._stop.is_set():
+                    logging.error("Can receive failed, stopping the receiver")
+                return
+
+            if count < frame_size:
+                if count == 0:
+                    return
+                continue
+
+            can_id, dlc = unpack_from(buffer)
+            self.received += 1
+            data = data_views[index][dlc if dlc < 8 else 8]
+            if can_id & socket.CAN_ERR_FLAG:
+                # Handed on with the flag set, subscribers have to tell it apart from a frame on the bus
+                self.errors += 1
+                EVENTS.warning("Can error frame of class %#x: %s", can_id & self.CAN_ERR_MASK_ALL, bytes(data))
+
+            for callback in self._subscribers:
+                callback(can_id, data)
+
+            index = (index + 1) % ring_size
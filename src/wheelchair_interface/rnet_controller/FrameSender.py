@@ -0,0 +1,135 @@
+"""
+file: FrameSender.py
+
+description: Sends frames on a raw can socket, backing off while the transmit queue is full instead of dropping them
+
+note:
+    - ENOBUFS means the interface queue (txqueuelen) is full and EAGAIN that the socket send buffer is full
+    - select only reports the socket send buffer, so a full interface queue is waited out with a growing backoff
+"""
+
+import errno
+import select
+import socket
+
+from threading import Lock
+from time import monotonic, sleep
+
+from ..eventlog import EVENTS
+
+
+class SendStats:
+    """
+    Counters of a frame sender, used to size txqueuelen and the frame period
+    """
+    def __init__(self):
+        """
+        Constructor for empty counters
+        """
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clear all of the counters
+        """
+        self.sent = 0
+        """ Number of frames sent """
+
+        self.dropped = 0
+        """ Number of frames given up on, because a newer frame replaced them or their slot ran out """
+
+        self.retried = 0
+        """ Number of sends which found the transmit queue full and were tried again """
+
+        self.blocked_time = 0.0
+        """ Seconds spent waiting for room in the transmit queue """
+
+    def __repr__(self) -> str:
+        return (f"SendStats(sent={self.sent}, dropped={self.dropped}, retried={self.retried}, "
+                f"blocked={self.blocked_time * 1000:.1f}ms)")
+
+
+class FrameSender:
+    """
+    Sends frames without blocking and waits for room while the transmit queue is full.
+
+    A frame is given up on once it has waited for its timeout, or as soon as another thread sends a newer frame, since
+    a stale joystick position is worse than none. The stop frame is never given up on.
+    """
+    BACKOFF = (0.0002, 0.002)
+    """ First and longest wait (seconds) for a full interface queue, doubling in between """
+
+    def __init__(self, can_socket: socket.socket, timeout: float, stop_frame: bytes):
+        """
+        Constructor for a sender
+
+        :param can_socket: Raw can socket to send on
+        :param timeout: Seconds a frame may wait for room before it is dropped, normally one frame period
+        :param stop_frame: Frame which is retried until it is sent
+        """
+        self._can_socket = can_socket
+        self._stop_frame = stop_frame
+        self.timeout = timeout
+        self.stats = SendStats()
+
+        self._generation = 0
+        """ Number of frames handed to send so far, tells a waiting frame that a newer one has arrived """
+        self._lock = Lock()
+
+    def send(self, frame: bytes) -> bool:
+        """
+        Send a frame, waiting for room in the transmit queue
+
+        :param frame: Built frame to send
+        :return: Whether the frame was sent, False if it was dropped
+        :raises OSError: If sending fails for any reason other than a full transmit queue
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+
+        keep = frame == self._stop_frame
+        give_up = monotonic() + self.timeout
+        backoff = self.BACKOFF[0]
+
+        while True:
+            try:
+                self._can_socket.send(frame, socket.MSG_DONTWAIT)
+                self.stats.sent += 1
+                return True
+
+            except OSError as e:
+                if e.errno not in (errno.ENOBUFS, errno.EAGAIN):
+                    raise
+                full = e.errno
+
+            now = monotonic()
+            if not keep and (generation != self._generation or now >= give_up):
+                self.stats.dropped += 1
+                EVENTS.debug("Transmit queue full, dropped frame %s", frame)
+                return False
+
+            self.stats.retried += 1
+            # select wakes as soon as the send buffer has room, so it can be given the whole slot
+            wait = self.timeout if full == errno.EAGAIN else backoff
+            self.__wait(full, wait if keep else min(wait, give_up - now))
+            if full == errno.ENOBUFS:
+                backoff = min(backoff * 2, self.BACKOFF[1])
+            self.stats.blocked_time += monotonic() - now
+
+    def __wait(self, full: int, seconds: float) -> None:
+        """
+        Wait for room in whichever queue was full
+
+        :param full: ENOBUFS for the interface queue or EAGAIN for the socket send buffer
+        :param seconds: Longest time to wait
+        """
+        if full == errno.EAGAIN:
+            try:
+                select.select((), (self._can_socket,), (), seconds)
+                return
+            except (OSError, ValueError, TypeError):
+                # Stand-ins without a file descriptor can only be waited on by sleeping
+                seconds = min(seconds, self.BACKOFF[1])
+
+        sleep(seconds)
@@ -0,0 +1,361 @@
+"""
+file: MultiBusController.py
+
+description: Drives any number of can buses from one asyncio loop, each with its own frame schedule
+
+note:
+    - A single scheduler task keeps the next deadline of every driving bus in a heap and sleeps until the earliest.
+      Deadlines sit on a grid shared by every bus, so buses with the same frame period are served in one wake up.
+    - Frames are written with a non-blocking send. There is no waiting for room, since that would hold up every other
+      bus: a drive frame which does not fit is dropped (its next slot brings it again) and a stop frame is retried
+      after a short backoff until it is sent.
+    - The loop's timers wake to the millisecond at best, so frames go out a few hundred microseconds after their
+      deadline. Deadlines stay on the grid however late a frame was, so the lateness never builds up.
+"""
+
+import asyncio
+import errno
+import heapq
+import logging
+import socket
+
+from .FrameSender import FrameSender, SendStats
+from .PeriodicTransmitter import TransmitStats
+from .RNetController import RNetController
+from ..eventlog import EVENTS
+from ..protocol.resources import Direction
+
+
+class BusSchedule:
+    """
+    State and counters of one bus
+    """
+    def __init__(self, name, can_socket: socket.socket, frame_period: float):
+        """
+        Constructor for an idle bus
+
+        :param name: Key the bus was added under
+        :param can_socket: Non-blocking raw socket of the bus
+        :param frame_period: Seconds between repeated frames
+        """
+        self.name = name
+        self.can_socket = can_socket
+        self.frame_period = frame_period
+        self.stats = TransmitStats()
+        """ Send jitter of the repeated frames """
+
+        self.send_stats = SendStats()
+        """ Sent, dropped and retried frames """
+
+        self.direction = None
+        """ Direction of the motion running, None while idle """
+
+        self.frame = None
+        self.until = 0.0
+        self.index = None
+        self.generation = 0
+        """ Bumped whenever the motion changes, heap entries of an older motion are skipped """
+
+        self.future = None
+        self.stop_pending = False
+
+
+class MultiBusController:
+    """
+    Repeats the drive frame of every bus on its own cadence from one task.
+
+    Create it inside the loop it runs on, add the buses and call start. drive returns a future which resolves to True
+    once the motion has run its whole duration, or False if it was stopped or replaced; cancelling the future stops
+    that bus.
+    """
+    FRAME_PERIOD = RNetController.FRAME_PERIOD
+    """ Default seconds between repeated drive frames """
+
+    def __init__(self, frame_period: float = FRAME_PERIOD):
+        """
+        Constructor for a controller with no buses
+
+        :param frame_period: Seconds between repeated frames of buses added without their own period
+        """
+        self.frame_period = frame_period
+        self.buses = {}
+        """ BusSchedule of every bus, by the key it was added under """
+
+        self._loop = asyncio.get_running_loop()
+        self._epoch = self._loop.time()
+        self._heap = []
+        self._sequence = 0
+        self._waiter = None
+        self._task = None
+
+    def add_bus(self, bus_num: int, can_socket: socket.socket = None, frame_period: float = None):
+        """
+        Connect to a bus and add it
+
+        :param bus_num: Bus number to connect to (can<N>, falling back to vcan<N>), or any key if a socket is given
+        :param can_socket: Already open raw socket to use instead of connecting
+        :param frame_period: Seconds between repeated frames of this bus, the controller's period if None
+        :return: Key of the bus, bus_num
+        """
+        if bus_num in self.buses:
+            raise ValueError(f"Bus {bus_num} was already added")
+
+        if can_socket is None:
+            can_socket = RNetController._open_connection(bus_num)
+        can_socket.setblocking(False)
+        self.buses[bus_num] = BusSchedule(bus_num, can_socket, frame_period or self.frame_period)
+
+        return bus_num
+
+    def start(self) -> asyncio.Task:
+        """
+        Start the scheduler task
+
+        :return: The task
+        """
+        if self._task is None:
+            self._task = self._loop.create_task(self.run())
+
+        return self._task
+
+    def drive(self, bus, direction: Direction, seconds: float) -> asyncio.Future:
+        """
+        Start driving a bus, replacing the motion running on it. The first frame goes out on the next pass.
+
+        :param bus: Key of the bus
+        :param direction: Direction to move in
+        :param seconds: Time to move in that direction
+        :return: Future of whether the motion ran its whole duration
+        """
+        schedule = self.buses[bus]
+        self.__end(schedule, False)
+
+        now = self._loop.time()
+        schedule.direction = direction
+        schedule.frame = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[direction])
+        schedule.until = now + seconds
+        schedule.index = None
+        schedule.future = future = self._loop.create_future()
+        future.add_done_callback(lambda done: self.__cancelled(schedule, done))
+        self.__push(now, schedule)
+
+        return future
+
+    def extend_motion(self, bus, direction: Direction, seconds: float) -> bool:
+        """
+        Keep the motion running on a bus going if it is in the given direction
+
+        :param bus: Key of the bus
+        :param direction: Direction the motion has to be in
+        :param seconds: Time from now to keep moving for
+        :return: Whether the motion was extended
+        """
+        schedule = self.buses[bus]
+        if schedule.direction != direction:
+            return False
+
+        schedule.until = max(schedule.until, self._loop.time() + seconds)
+        return True
+
+    def stop(self, bus) -> None:
+        """
+        End the motion of a bus and send it the stop frame
+
+        :param bus: Key of the bus
+        """
+        schedule = self.buses[bus]
+        self.__end(schedule, False)
+        self.__send(schedule, RNetController.STOP_FRAME_BYTES)
+
+    def stop_all(self) -> None:
+        """
+        End the motion of every bus and send each the stop frame
+        """
+        for bus in self.buses:
+            self.stop(bus)
+
+    def set_speed_range(self, bus, speed_range: int) -> bool:
+        """
+        Set the speed of the chair on a bus
+
+        :param bus: Key of the bus
+        :param speed_range: Speed range to set (between 0 and 100)
+        :return: Whether the speed frame was sent
+        """
+        if not RNetController.MIN_SPEED <= speed_range <= RNetController.MAX_SPEED:
+            logging.error(f"Invalid RNET SpeedRange: {speed_range}")
+            return False
+
+        return self.__send(self.buses[bus], RNetController.speed_frame(speed_range))
+
+    def aggregate_stats(self) -> tuple[TransmitStats, SendStats]:
+        """
+        :return: Send jitter and send counters summed over every bus
+        """
+        stats = TransmitStats()
+        send_stats = SendStats()
+        for schedule in self.buses.values():
+            stats.frames += schedule.stats.frames
+            stats.missed_deadlines += schedule.stats.missed_deadlines
+            stats.total_jitter += schedule.stats.total_jitter
+            stats.max_jitter = max(stats.max_jitter, schedule.stats.max_jitter)
+            send_stats.sent += schedule.send_stats.sent
+            send_stats.dropped += schedule.send_stats.dropped
+            send_stats.retried += schedule.send_stats.retried
+            send_stats.blocked_time += schedule.send_stats.blocked_time
+
+        return stats, send_stats
+
+    async def run(self) -> None:
+        """
+        Serve every deadline forever
+        """
+        heap = self._heap
+        while True:
+            if heap:
+                delay = heap[0][0] - self._loop.time()
+                if delay > 0:
+                    await self.__sleep(delay)
+            else:
+                await self.__sleep(None)
+
+            now = self._loop.time()
+            while heap and heap[0][0] <= now:
+                deadline, _, schedule, generation = heapq.heappop(heap)
+                if generation == schedule.generation:
+                    self.__serve(schedule, deadline, now)
+
+    def __serve(self, schedule: BusSchedule, deadline: float, now: float) -> None:
+        """
+        Handle the deadline of a bus: retry its stop frame, send its drive frame or end its motion
+
+        :param schedule: Bus with the deadline
+        :param deadline: Time the deadline was for
+        :param now: Time it is served at
+        """
+        if schedule.stop_pending:
+            if not self.__send(schedule, RNetController.STOP_FRAME_BYTES):
+                schedule.send_stats.retried += 1
+                self.__push(now + FrameSender.BACKOFF[1], schedule)
+                return
+            # A motion started while the stop was waiting goes on once the stop is out
+            if schedule.frame is None:
+                return
+
+        if deadline >= schedule.until:
+            if schedule.until <= now:
+                self.__end(schedule, True)
+                self.__send(schedule, RNetController.STOP_FRAME_BYTES)
+            else:
+                # Hold until the end of the duration, then carry on only if the motion was extended meanwhile
+                self.__push(schedule.until, schedule)
+            return
+
+        schedule.stats.record(now - deadline)
+        self.__send(schedule, schedule.frame)
+
+        # The next slot on the shared grid, skipping any the loop fell more than a period behind on
+        index = int((now - self._epoch) // schedule.frame_period) + 1
+        if schedule.index is not None and index > schedule.index + 1:
+            schedule.stats.missed_deadlines += index - schedule.index - 1
+        schedule.index = index
+        self.__push(self._epoch + index * schedule.frame_period, schedule)
+
+    def __send(self, schedule: BusSchedule, frame: bytes) -> bool:
+        """
+        Send a frame without waiting
+
+        :param schedule: Bus to send on
+        :param frame: Built frame
+        :return: Whether it was sent, a stop frame that was not is retried from the scheduler
+        """
+        try:
+            schedule.can_socket.send(frame)
+            schedule.send_stats.sent += 1
+            if frame == RNetController.STOP_FRAME_BYTES:
+                schedule.stop_pending = False
+            return True
+
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.ENOBUFS):
+                EVENTS.error("Error sending CAN frame %s on bus %s", frame, schedule.name)
+
+        if frame != RNetController.STOP_FRAME_BYTES:
+            schedule.send_stats.dropped += 1
+        elif not schedule.stop_pending:
+            schedule.stop_pending = True
+            schedule.send_stats.retried += 1
+            self.__push(self._loop.time() + FrameSender.BACKOFF[1], schedule)
+
+        return False
+
+    def __end(self, schedule: BusSchedule, completed: bool) -> None:
+        """
+        Forget the motion of a bus, resolving its future
+
+        :param schedule: Bus whose motion ends
+        :param completed: Whether the motion ran its whole duration
+        """
+        schedule.generation += 1
+        schedule.direction = None
+        schedule.frame = None
+        future, schedule.future = schedule.future, None
+        if future is not None and not future.done():
+            future.set_result(completed)
+
+    def __cancelled(self, schedule: BusSchedule, future: asyncio.Future) -> None:
+        """
+        Stop a bus whose motion future was cancelled by its caller
+
+        :param schedule: Bus of the motion
+        :param future: Future of the motion
+        """
+        if future.cancelled() and schedule.future is future:
+            self.stop(schedule.name)
+
+    def __push(self, deadline: float, schedule: BusSchedule) -> None:
+        """
+        Add a deadline of a bus, waking the scheduler if it is earlier than the one it sleeps until
+
+        :param deadline: Time of the deadline
+        :param schedule: Bus the deadline is for
+        """
+        self._sequence += 1
+        heapq.heappush(self._heap, (deadline, self._sequence, schedule, schedule.generation))
+        if self._heap[0][2] is schedule and self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def __sleep(self, delay: float = None) -> None:
+        """
+        Sleep until a delay passes or an earlier deadline is added
+
+        :param delay: Seconds to sleep, None to sleep until a deadline is added
+        """
+        self._waiter = waiter = self._loop.create_future()
+        timer = None
+        if delay is not None:
+            timer = self._loop.call_later(delay, lambda: waiter.done() or waiter.set_result(None))
+        try:
+            await waiter
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._waiter = None
+
+    async def close(self) -> None:
+        """
+        Stop every bus, end the scheduler and close every socket
+        """
+        self.stop_all()
+        # Give stop frames which did not fit a chance to be retried
+        for _ in range(10):
+            if not any(schedule.stop_pending for schedule in self.buses.values()):
+                break
+            await asyncio.sleep(FrameSender.BACKOFF[1])
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for schedule in self.buses.values():
+            schedule.can_socket.close()
+        self.buses = {}
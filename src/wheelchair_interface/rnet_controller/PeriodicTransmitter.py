@@ -0,0 +1,225 @@
+"""
+file: PeriodicTransmitter.py
+
+description: Deadline based periodic sender used to repeat frames onto the can bus at a fixed cadence
+"""
+
+import math
+
+from threading import Event, Lock
+from time import monotonic, sleep
+from typing import Any, Callable
+
+
+class TransmitStats:
+    """
+    Send jitter statistics collected by a periodic transmitter
+    """
+    def __init__(self):
+        """
+        Constructor for empty statistics
+        """
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clear all of the collected statistics
+        """
+        self.frames = 0
+        """ Number of frames sent """
+
+        self.missed_deadlines = 0
+        """ Number of deadlines skipped because the sender fell more than a period behind """
+
+        self.total_jitter = 0.0
+        """ Sum of the lateness of every send (seconds) """
+
+        self.max_jitter = 0.0
+        """ Worst lateness of a single send (seconds) """
+
+    def record(self, jitter: float) -> None:
+        """
+        Record the lateness of a single send
+
+        :param jitter: Seconds between the deadline and the actual send
+        """
+        self.frames += 1
+        self.total_jitter += jitter
+        if jitter > self.max_jitter:
+            self.max_jitter = jitter
+
+    @property
+    def mean_jitter(self) -> float:
+        """
+        :return: Average lateness of a send (seconds)
+        """
+        return self.total_jitter / self.frames if self.frames else 0.0
+
+    def __repr__(self) -> str:
+        return (f"TransmitStats(frames={self.frames}, missed_deadlines={self.missed_deadlines}, "
+                f"mean_jitter={self.mean_jitter * 1e6:.1f}us, max_jitter={self.max_jitter * 1e6:.1f}us)")
+
+
+class PeriodicTransmitter:
+    """
+    Repeats a frame at a fixed period for a duration using absolute deadlines so the cadence does not drift.
+
+    A running transmission can be extended from another thread, the frames carry on without a gap.
+    """
+    DEFAULT_FRAME_PERIOD = 0.01
+    """ Seconds between frames, R-Net joysticks send roughly every 10ms """
+
+    def __init__(self, send: Callable[[Any], bool], frame_period: float = DEFAULT_FRAME_PERIOD,
+                 clock: Callable[[], float] = monotonic, sleeper: Callable[[float], None] = sleep):
+        """
+        Constructor for a transmitter
+
+        :param send: Function called with the frame on every deadline
+        :param frame_period: Seconds between frames
+        :param clock: Monotonic clock returning seconds
+        :param sleeper: Function to sleep for a number of seconds
+        """
+        if frame_period <= 0:
+            raise ValueError("Frame period must be positive")
+
+        self._send = send
+        self._clock = clock
+        self._sleep = sleeper
+        self.frame_period = frame_period
+        self.stats = TransmitStats()
+
+        self._stop_time = 0.0
+        self._running = False
+        # Keeps an extension and the decision to finish together so an extension is never lost
+        self._lock = Lock()
+
+    def transmit_seconds(self, frame: Any, seconds: float, cancel: Event = None) -> int:
+        """
+        Send a frame every period until the duration has passed, the first frame is sent immediately
+
+        :param frame: Frame to pass to the send function
+        :param seconds: Time to keep transmitting for
+        :param cancel: Event which ends the transmission early as soon as it is set
+        :return: Number of frames sent
+        """
+        return self._run(lambda: frame, seconds, cancel)
+
+    def stream(self, next_frame: Callable[[], Any], cancel: Event) -> int:
+        """
+        Send whichever frame is current on every period until cancelled, the first frame is sent immediately
+
+        :param next_frame: Called on every deadline to get the frame to send
+        :param cancel: Event which ends the stream as soon as it is set
+        :return: Number of frames sent
+        """
+        return self._run(next_frame, math.inf, cancel)
+
+    def extend(self, seconds: float) -> bool:
+        """
+        Keep a running transmission going until at least the given time from now
+
+        :param seconds: Time from now to transmit until
+        :return: Whether a transmission was running and has been extended, False if it already finished
+        """
+        with self._lock:
+            if not self._running:
+                return False
+
+            self._stop_time = max(self._stop_time, self._clock() + seconds)
+            return True
+
+    def _run(self, next_frame: Callable[[], Any], seconds: float, cancel: Event = None) -> int:
+        """
+        Send a frame on every deadline until the duration has passed or the transmission is cancelled
+
+        :param next_frame: Called on every deadline to get the frame to send
+        :param seconds: Time to keep transmitting for, may be infinite
+        :param cancel: Event which ends the transmission early as soon as it is set
+        :return: Number of frames sent
+        """
+        start_time = self._clock()
+        deadline = start_time
+        index = 0
+        sent = 0
+        with self._lock:
+            self._stop_time = start_time + seconds
+            self._running = True
+
+        try:
+            while self.__continues(deadline, cancel):
+                sent += self.__send_on(deadline, next_frame, cancel)
+                if cancel is not None and cancel.is_set():
+                    return sent
+
+                index += 1
+                now = self._clock()
+                # Deadlines are computed from the start so a late send does not push back the ones after it
+                behind = int((now - start_time) // self.frame_period) + 1 - index
+                if behind > 0:
+                    # Fell more than a whole period behind, skip the slots rather than bursting to catch up
+                    self.stats.missed_deadlines += behind
+                    index += behind
+                deadline = start_time + index * self.frame_period
+
+            return sent
+
+        finally:
+            with self._lock:
+                self._running = False
+
+    def __continues(self, deadline: float, cancel: Event = None) -> bool:
+        """
+        Hold until the end of the duration once the next deadline is past it, so callers see the same timing as
+        before, and carry on if the transmission was extended in the meantime
+
+        :param deadline: Next deadline
+        :param cancel: Event which ends the transmission early as soon as it is set
+        :return: Whether a frame is due on the deadline
+        """
+        while True:
+            with self._lock:
+                if deadline < self._stop_time:
+                    return True
+                remaining = self._stop_time - self._clock()
+                if remaining <= 0:
+                    self._running = False
+                    return False
+
+            if self._wait(remaining, cancel):
+                return False
+
+    def __send_on(self, deadline: float, next_frame: Callable[[], Any], cancel: Event = None) -> int:
+        """
+        Wait for a deadline and send the current frame
+
+        :param deadline: Time to send at
+        :param next_frame: Called to get the frame to send
+        :param cancel: Event which ends the transmission early as soon as it is set
+        :return: 1 if the frame was sent, 0 if cancelled first
+        """
+        now = self._clock()
+        if deadline > now:
+            if self._wait(deadline - now, cancel):
+                return 0
+            now = self._clock()
+        elif cancel is not None and cancel.is_set():
+            return 0
+
+        self._send(next_frame())
+        self.stats.record(now - deadline)
+
+        return 1
+
+    def _wait(self, seconds: float, cancel: Event = None) -> bool:
+        """
+        Sleep for a number of seconds, waking early if cancelled
+
+        :param seconds: Time to sleep for
+        :param cancel: Optional event to wake on
+        :return: Whether the wait was cancelled
+        """
+        if cancel is None:
+            self._sleep(seconds)
+            return False
+
+        return cancel.wait(seconds)
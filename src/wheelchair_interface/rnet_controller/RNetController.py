@@ -16,9 +16,24 @@ import socket
 import struct
 import binascii
 
-from time import time
+from functools import lru_cache
+from threading import Event, Lock
 
-from ..protocol.resources import Direction
+from .BCMTransmitter import BCMTransmitter
+from .FrameSender import FrameSender, SendStats
+from .PeriodicTransmitter import PeriodicTransmitter, TransmitStats
+from ..clock import Clock, SYSTEM_CLOCK
+from ..eventlog import EVENTS
+from ..metrics import METRICS
+from ..protocol.resources import Direction, MAX_SETPOINT, MIN_SETPOINT, SETPOINT_HOLD_TIMEOUT
+from ..recording import RECORDER, KIND_CAN_JOB, KIND_CAN_TX
+from ..tracing import TRACER
+
+
+FRAMES_SENT = METRICS.counter("nxt_can_frames_total", "Can frames sent or handed to the kernel", result="sent")
+FRAMES_DROPPED = METRICS.counter("nxt_can_frames_total", "Can frames sent or handed to the kernel", result="dropped")
+FRAMES_FAILED = METRICS.counter("nxt_can_frames_total", "Can frames sent or handed to the kernel", result="failed")
+JOB_UPDATES = METRICS.counter("nxt_can_job_updates_total", "Frames swapped into the BCM job or transmit process")
 
 
 class RNetController:
@@ -31,6 +46,15 @@ class RNetController:
     MAX_NEGATIVE = 400
     """ Max value to go back or left """
 
+    DIRECTION_POSITIONS = {
+        Direction.FORWARD: (0, MAX_POSITIVE),
+        Direction.BACKWARD: (0, MAX_NEGATIVE),
+        Direction.LEFT: (MAX_NEGATIVE, 0),
+        Direction.RIGHT: (MAX_POSITIVE, 0),
+        Direction.STOP: (0, 0),
+    }
+    """ Joystick position (x, y) driven for each direction """
+
     DRIVE_FRAME_START = "02000000#"
     """ Start of the drive instruction frame """
 
@@ -46,38 +70,122 @@ class RNetController:
     MAX_SPEED = 0x64
     """ Maximum speed of the chair """
 
-    def __init__(self, bus_num: int = 0):
+    CAN_FRAME = struct.Struct("IB3x8s")
+    """ Layout of a classic struct can_frame: can_id, dlc, padding, data """
+
+    DRIVE_FRAME_ID = 0x02000000 | socket.CAN_EFF_FLAG
+    """ Extended can id of the drive instruction frame """
+
+    SPEED_FRAME_ID = 0x0a040100 | socket.CAN_EFF_FLAG
+    """ Extended can id of the speed change instruction frame """
+
+    STOP_FRAME_BYTES = CAN_FRAME.pack(DRIVE_FRAME_ID, 2, b"")
+    """ The stop frame ready to send """
+
+    FRAME_PERIOD = PeriodicTransmitter.DEFAULT_FRAME_PERIOD
+    """ Seconds between repeated drive frames """
+
+    SETPOINT_HOLD_TIMEOUT = SETPOINT_HOLD_TIMEOUT
+    """ Seconds a streamed setpoint is held without an update before the chair is stopped """
+
+    TRANSPORT_RAW = "raw"
+    """ Frames are written to a CAN_RAW socket and repeated from python """
+
+    TRANSPORT_BCM = "bcm"
+    """ Frames are handed to the kernel broadcast manager which repeats them itself """
+
+    TRANSPORT_PROCESS = "process"
+    """ Frames are repeated on a CAN_RAW socket by a separate transmit process """
+
+    def __init__(self, bus_num: int = 0, frame_period: float = FRAME_PERIOD, transport: str = TRANSPORT_RAW,
+                 can_socket: socket.socket = None, transmit_cpu: int = None, fifo_priority: int = None,
+                 clock: Clock = SYSTEM_CLOCK):
         """
         Constructor for a controller, connects to the given bus number
 
         :param bus_num: Bus number to connect to
+        :param frame_period: Seconds between repeated frames while driving
+        :param transport: TRANSPORT_RAW, TRANSPORT_BCM or TRANSPORT_PROCESS
+        :param can_socket: Already open socket to use instead of connecting to the bus (matching the transport)
+        :param transmit_cpu: CPU to pin the transmit process to (TRANSPORT_PROCESS only)
+        :param fifo_priority: SCHED_FIFO priority of the transmit process (TRANSPORT_PROCESS only)
+        :param clock: Clock the motions are timed on, a virtual clock only applies to TRANSPORT_RAW where the frames
+            are sent from this process
         """
-        try:
-            self._can_socket = self._open_connection(bus_num)
+        if transport not in (self.TRANSPORT_RAW, self.TRANSPORT_BCM, self.TRANSPORT_PROCESS):
+            raise ValueError(f"Unknown can transport: {transport}")
+
+        self._clock = clock
+        self._transmitter = PeriodicTransmitter(self.send_frame, frame_period, clock, clock.sleep)
+        self._sender = None
+        """ Sender of the frames written to a raw socket from this process, None for the broadcast manager """
+        self._bcm = None
+        self._process = None
+        self._job = None
+        """ BCM job or transmit process repeating frames outside this thread, None when frames are sent from here """
+        self._process_streaming = False
+
+        self._motion_frame = None
+        """ Frame of the timed motion in progress, None while there is none """
+        self._motion_until = 0.0
+        # Keeps an extension and the end of a motion together so an extension is never lost
+        self._motion_lock = Lock()
+
+        self._setpoint_frame = self.STOP_FRAME_BYTES
+        self._setpoint_time = 0.0
+        self._setpoint_hold_timeout = self.SETPOINT_HOLD_TIMEOUT
+        self._stream_thread = None
+        self._stream_cancel = clock.event()
+        self._stream_lock = Lock()
+
+        if can_socket is not None:
+            self._can_socket = can_socket
+        else:
+            try:
+                self._can_socket = self._open_connection(bus_num, transport)
 
-        except socket.error:
-            self._can_socket = None
+            except socket.error:
+                self._can_socket = None
+
+        if self._can_socket is not None and transport == self.TRANSPORT_BCM:
+            self._bcm = self._job = BCMTransmitter(self._can_socket, frame_period)
+        elif self._can_socket is not None:
+            # A frame waits at most until the next deadline brings a newer one
+            self._sender = FrameSender(self._can_socket, frame_period, self.STOP_FRAME_BYTES)
+
+        if self._can_socket is not None and transport == self.TRANSPORT_PROCESS:
+            # Only imported when used, multiprocessing and shared memory add to the start up time of every mode
+            from .TransmitProcess import TransmitProcess
+            self._process = self._job = TransmitProcess(self._can_socket, self.STOP_FRAME_BYTES, frame_period,
+                                                        transmit_cpu, fifo_priority)
 
     @staticmethod
-    def _open_connection(bus_num: int) -> socket.socket:
+    def _open_connection(bus_num: int, transport: str = TRANSPORT_RAW) -> socket.socket:
         """
         Open a connection to the bus and return the socket
 
         :param bus_num: Bus number to connect to (0 for the hat)
+        :param transport: TRANSPORT_RAW for a raw socket or TRANSPORT_BCM for a broadcast manager socket
         :return: A socket with an open connection to the bus
         """
         bus_num = str(bus_num)
 
         # Attempt to open a socket
         try:
-            can_socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+            if transport == RNetController.TRANSPORT_BCM:
+                can_socket = socket.socket(socket.AF_CAN, socket.SOCK_DGRAM, socket.CAN_BCM)
+                # Broadcast manager sockets are connected to an interface rather than bound
+                attach = can_socket.connect
+            else:
+                can_socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+                attach = can_socket.bind
         except socket.error:
             logging.error("Failed to create a canbus socket")
             raise socket.error
 
         # Attempt to connect to the canbus
         try:
-            can_socket.bind((f"can{bus_num}",))
+            attach((f"can{bus_num}",))
             logging.info(f"Socket connect to can: {bus_num}")
         except socket.error:
             logging.error(f"Failed to open can{bus_num} socket")
@@ -85,7 +193,7 @@ class RNetController:
 
             # Now we will try to connect to virtual can (vcan)
             try:
-                can_socket.bind((f"vcan{bus_num}",))
+                attach((f"vcan{bus_num}",))
                 logging.info(f"Socket connected to vcan{bus_num}")
             except socket.error:
                 logging.error(f"Failed to open vcan{bus_num} socket")
@@ -94,6 +202,7 @@ class RNetController:
         return can_socket
 
     @staticmethod
+    @lru_cache(maxsize=256)
     def _build_frame(can_string: str) -> bytes:
         """
         Build a data frame to send to the bus in the following format:
@@ -102,8 +211,10 @@ class RNetController:
             <can_id>#{R|data}          for CAN 2.0 frames
             <can_id>##<flags>{data}    for CAN FD frames
 
+        Only kept for compatibility with cansend strings, results are cached since the same few strings repeat
+
         :param can_string: Command string to build into a frame
-        :return:
+        :return: Frame ready to send
         """
         if "#" not in can_string:
             logging.error("Cannot build command frame: missing #")
@@ -152,67 +263,230 @@ class RNetController:
             h = "0" + hex(int(decimal_num))[1:]
         return ("0" * hex_len + h)[l:l + hex_len]
 
-    def __can_send(self, command_string: str) -> bool:
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def drive_frame(x: int, y: int) -> bytes:
         """
-        Send a command to the opened socket
+        Get the ready to send drive frame for a joystick position, frames are built once and cached
 
-        :param command_string: String to build into a command and send
-        :return: If the command was sent successfully
+        :param x: Amount to aim in x (only the low byte is sent)
+        :param y: Amount to aim in y (only the low byte is sent)
+        :return: Drive frame ready to send
+        """
+        return RNetController.CAN_FRAME.pack(RNetController.DRIVE_FRAME_ID, 2, bytes((x & 0xff, y & 0xff)))
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def speed_frame(speed_range: int) -> bytes:
+        """
+        Get the ready to send speed change frame, frames are built once and cached
+
+        :param speed_range: Speed range to set (only the low byte is sent)
+        :return: Speed frame ready to send
+        """
+        return RNetController.CAN_FRAME.pack(RNetController.SPEED_FRAME_ID, 1, bytes((speed_range & 0xff,)))
+
+    def send_frame(self, frame: bytes) -> bool:
+        """
+        Send an already built frame to the opened socket
+
+        :param frame: Frame from drive_frame, speed_frame, STOP_FRAME_BYTES or _build_frame
+        :return: If the frame was sent successfully
         """
         if self._can_socket is None:
             logging.error("Cannot send command as no canbus socket is open")
+            FRAMES_FAILED.inc()
             return False
 
         try:
-            out = self._build_frame(command_string)
-
-            self._can_socket.send(out)
+            if self._bcm is not None:
+                self._bcm.send_once(frame)
+            elif not self._sender.send(frame):
+                # Dropped for a newer frame or because the transmit queue stayed full for its whole slot
+                FRAMES_DROPPED.inc()
+                return False
+
+            FRAMES_SENT.inc()
+            if RECORDER.enabled:
+                RECORDER.record_frame(KIND_CAN_TX, frame)
+            if TRACER.armed is not None:
+                TRACER.fire()
             return True
 
         except socket.error:
-            logging.debug(f"Error sending CAN frame {command_string}")
+            EVENTS.debug("Error sending CAN frame %s", frame)
+            FRAMES_FAILED.inc()
             return False
 
-    def stop_seconds(self, seconds: float) -> None:
-        start_time = time()
-        stop_time = start_time + seconds
+    def can_send(self, command_string: str) -> bool:
+        """
+        Send a cansend style command string to the opened socket, kept for compatibility (prefer send_frame)
 
-        forward_frame = self.DRIVE_FRAME_START + self._dec2hex(x, 2) + self._dec2hex(y, 2)
-        while time() < stop_time:
-            self.stop_chair()
+        :param command_string: String to build into a command and send
+        :return: If the command was sent successfully
+        """
+        return self.send_frame(self._build_frame(command_string))
 
-    def __drive_seconds(self, seconds: float, x: int, y: int) -> None:
+    def stop_seconds(self, seconds: float, cancel: Event = None) -> None:
+        """
+        Repeat the stop frame for a given number of seconds
+
+        :param seconds: Time to hold the chair stopped for
+        :param cancel: Event which ends the hold early as soon as it is set
+        """
+        self.__transmit_seconds(self.STOP_FRAME_BYTES, seconds, cancel)
+
+    def __transmit_seconds(self, frame: bytes, seconds: float, cancel: Event = None) -> None:
+        """
+        Repeat a frame every frame period for a given number of seconds
+
+        :param frame: Built frame to repeat
+        :param seconds: Time to repeat the frame for
+        :param cancel: Event which ends the motion early as soon as it is set
+        """
+        with self._motion_lock:
+            self._motion_frame = frame
+            self._motion_until = self._clock() + seconds
+
+        if self._job is None:
+            try:
+                self._transmitter.transmit_seconds(frame, seconds, cancel)
+            finally:
+                with self._motion_lock:
+                    self._motion_frame = None
+            return
+
+        # The kernel or transmit process repeats the frame, so only the start and end of the motion need an update.
+        # It is held for the duration, so the frame runs out even if this process hangs or dies before replacing it.
+        try:
+            self.__set_job(frame, seconds)
+            while True:
+                with self._motion_lock:
+                    remaining = self._motion_until - self._clock()
+                    if remaining <= 0:
+                        self._motion_frame = None
+                        break
+
+                if cancel is None:
+                    self._clock.sleep(remaining)
+                elif cancel.wait(remaining):
+                    break
+            self.__set_job(self.STOP_FRAME_BYTES)
+
+        except socket.error:
+            logging.error(f"Failed to update transmit job with {frame.hex()}")
+
+        finally:
+            with self._motion_lock:
+                self._motion_frame = None
+
+    def extend_motion(self, direction: Direction, seconds: float) -> bool:
+        """
+        Keep the timed motion in progress going if it is in the given direction, the frames carry on without a gap
+
+        :param direction: Direction the motion has to be in
+        :param seconds: Time from now to keep moving for
+        :return: Whether the motion was extended, False if there is none in that direction (start a new one instead)
+        """
+        position = self.DIRECTION_POSITIONS.get(direction)
+        if position is None:
+            return False
+
+        with self._motion_lock:
+            if self._motion_frame != self.drive_frame(*position):
+                return False
+
+            if self._job is None:
+                return self._transmitter.extend(seconds)
+
+            until = max(self._motion_until, self._clock() + seconds)
+            try:
+                # The hold has to cover the extension too, or the job runs out before this process ends the motion
+                self.__set_job(self._motion_frame, until - self._clock())
+            except socket.error:
+                logging.error(f"Failed to extend transmit job with {self._motion_frame.hex()}")
+                return False
+
+            self._motion_until = until
+            return True
+
+    def __set_job(self, frame: bytes, hold: float = None) -> None:
+        """
+        Swap a frame into the BCM transmit job or transmit process
+
+        :param frame: Built frame to repeat
+        :param hold: Seconds the frame is repeated for before the transmit process sends stop instead, or the BCM job
+            runs out, None to repeat until replaced
+        """
+        if self._process is not None:
+            self._process.set_frame(frame, hold)
+        else:
+            self._bcm.set_frame(frame, hold)
+        JOB_UPDATES.inc()
+        if RECORDER.enabled:
+            RECORDER.record_frame(KIND_CAN_JOB, frame)
+        if TRACER.armed is not None:
+            TRACER.fire()
+
+    def __drive_seconds(self, seconds: float, x: int, y: int, cancel: Event = None) -> None:
         """
         Function to drive the chair for a given number of seconds in a certain direction
 
         :param seconds: Number of seconds to continue in a given direction for
         :param x: Amount to aim in x
         :param y: Amount to aim in y
+        :param cancel: Event which ends the drive early as soon as it is set
+        """
+        self.__transmit_seconds(self.drive_frame(x, y), seconds, cancel)
+
+    @property
+    def frame_period(self) -> float:
+        """
+        :return: Seconds between repeated frames while driving
+        """
+        return self._transmitter.frame_period
+
+    @property
+    def transmit_stats(self) -> TransmitStats:
+        """
+        :return: Send jitter statistics of the repeated frames
         """
-        start_time = time()
-        stop_time = start_time + seconds
+        if self._process is not None:
+            return self._process.stats
 
-        forward_frame = self.DRIVE_FRAME_START + self._dec2hex(x, 2) + self._dec2hex(y, 2)
-        while time() < stop_time:
-            self.__can_send(forward_frame)
+        return self._transmitter.stats
 
-    def drive_direction_seconds(self, direction: Direction, seconds: float) -> None:
+    @property
+    def send_stats(self) -> SendStats:
+        """
+        :return: Sent, dropped and retried frames and the time spent waiting on a full transmit queue, the counters of
+            the transmit process in TRANSPORT_PROCESS, empty for TRANSPORT_BCM where the kernel sends the frames
+        """
+        if self._process is not None:
+            return self._process.send_stats
+        if self._sender is None:
+            return SendStats()
+
+        return self._sender.stats
+
+    def drive_direction_seconds(self, direction: Direction, seconds: float, cancel: Event = None) -> None:
         """
         Drive a direction for given timeframe
 
         :param direction: Direction to move in
         :param seconds: Time to move in that direction
+        :param cancel: Event which ends the motion early as soon as it is set
         """
         if direction == Direction.FORWARD:
-            self.drive_forward_seconds(seconds)
+            self.drive_forward_seconds(seconds, cancel)
         elif direction == Direction.BACKWARD:
-            self.drive_back_seconds(seconds)
+            self.drive_back_seconds(seconds, cancel)
         elif direction == Direction.LEFT:
-            self.turn_left_seconds(seconds)
+            self.turn_left_seconds(seconds, cancel)
         elif direction == Direction.RIGHT:
-            self.turn_right_seconds(seconds)
+            self.turn_right_seconds(seconds, cancel)
         elif direction == Direction.STOP:
-            self.stop_seconds(seconds)
+            self.stop_seconds(seconds, cancel)
 
     def is_connected(self) -> bool:
         """
@@ -222,37 +496,139 @@ class RNetController:
         """
         return self._can_socket is not None
 
-    def drive_forward_seconds(self, seconds: float) -> None:
+    def drive_forward_seconds(self, seconds: float, cancel: Event = None) -> None:
         """
         Drive max forward
 
         :param seconds: Time to drive for
+        :param cancel: Event which ends the drive early as soon as it is set
         """
-        self.__drive_seconds(seconds, 0, self.MAX_POSITIVE)
+        self.__drive_seconds(seconds, 0, self.MAX_POSITIVE, cancel)
 
-    def drive_back_seconds(self, seconds: float) -> None:
+    def drive_back_seconds(self, seconds: float, cancel: Event = None) -> None:
         """
         Drive max back
 
         :param seconds: Time to drive for
+        :param cancel: Event which ends the drive early as soon as it is set
         """
-        self.__drive_seconds(seconds, 0, self.MAX_NEGATIVE)
+        self.__drive_seconds(seconds, 0, self.MAX_NEGATIVE, cancel)
 
-    def turn_left_seconds(self, seconds: float) -> None:
+    def turn_left_seconds(self, seconds: float, cancel: Event = None) -> None:
         """
         Turn max left
 
         :param seconds: Time to drive for
+        :param cancel: Event which ends the drive early as soon as it is set
         """
-        self.__drive_seconds(seconds, self.MAX_NEGATIVE, 0)
+        self.__drive_seconds(seconds, self.MAX_NEGATIVE, 0, cancel)
 
-    def turn_right_seconds(self, seconds: float) -> None:
+    def turn_right_seconds(self, seconds: float, cancel: Event = None) -> None:
         """
         Turn max right
 
         :param seconds: Time to drive for
+        :param cancel: Event which ends the drive early as soon as it is set
+        """
+        self.__drive_seconds(seconds, self.MAX_POSITIVE, 0, cancel)
+
+    def start_setpoint_stream(self, hold_timeout: float = SETPOINT_HOLD_TIMEOUT) -> None:
+        """
+        Start continuously transmitting the latest setpoint every frame period on a background thread.
+
+        A setpoint that is not refreshed within the hold timeout is replaced by the stop frame. Do not call the
+        blocking drive functions while a stream is running, stop it first. With TRANSPORT_PROCESS no thread is
+        started, the transmit process holds each setpoint and falls back to the stop frame by itself.
+
+        :param hold_timeout: Seconds to hold the last setpoint without an update
         """
-        self.__drive_seconds(seconds, self.MAX_POSITIVE, 0)
+        with self._stream_lock:
+            if self.is_streaming():
+                return
+
+            self._setpoint_hold_timeout = hold_timeout
+            if self._process is not None:
+                self._process_streaming = True
+                return
+
+            self._stream_cancel.clear()
+            self._stream_thread = self._clock.thread(self.__stream)
+            self._stream_thread.start()
+
+    def set_setpoint(self, x: int, y: int) -> None:
+        """
+        Update the joystick position being streamed, starting the stream if it is not running
+
+        :param x: Joystick x position, positive is right, clamped to [MIN_SETPOINT, MAX_SETPOINT]
+        :param y: Joystick y position, positive is forward, clamped to [MIN_SETPOINT, MAX_SETPOINT]
+        """
+        # Only the low byte is sent, so an unclamped -200 would wrap round to a forward 56
+        x = max(MIN_SETPOINT, min(MAX_SETPOINT, int(x)))
+        y = max(MIN_SETPOINT, min(MAX_SETPOINT, int(y)))
+        self._setpoint_frame = self.drive_frame(x, y)
+        self._setpoint_time = self._clock()
+
+        if not self.is_streaming():
+            self.start_setpoint_stream(self._setpoint_hold_timeout)
+
+        if self._process is not None:
+            # The only work done here per setpoint, the transmit process does the rest
+            self.__set_job(self._setpoint_frame, self._setpoint_hold_timeout)
+
+    def stop_setpoint_stream(self) -> None:
+        """
+        Stop a running setpoint stream and send the stop frame
+        """
+        with self._stream_lock:
+            if not self.is_streaming():
+                return
+
+            if self._stream_thread is not None:
+                self._stream_cancel.set()
+                self._stream_thread.join()
+                self._stream_thread = None
+            self._process_streaming = False
+
+        self._setpoint_frame = self.STOP_FRAME_BYTES
+        self.stop_chair()
+
+    def is_streaming(self) -> bool:
+        """
+        :return: Whether a setpoint stream is running
+        """
+        return self._stream_thread is not None or self._process_streaming
+
+    def __current_setpoint(self) -> bytes:
+        """
+        :return: Frame of the latest setpoint, or the stop frame once it has not been updated within the hold timeout
+        """
+        if self._clock() - self._setpoint_time > self._setpoint_hold_timeout:
+            return self.STOP_FRAME_BYTES
+
+        return self._setpoint_frame
+
+    def __stream(self) -> None:
+        """
+        Body of the setpoint stream thread
+        """
+        if self._job is None:
+            self._transmitter.stream(self.__current_setpoint, self._stream_cancel)
+            return
+
+        # The kernel repeats the job by itself, so the thread only has to swap in a changed frame
+        current = None
+
+        def update(frame: bytes) -> None:
+            nonlocal current
+            if frame != current:
+                self.__set_job(frame)
+                current = frame
+
+        try:
+            PeriodicTransmitter(update, self.frame_period, self._clock, self._clock.sleep).stream(
+                self.__current_setpoint, self._stream_cancel)
+        except socket.error:
+            logging.error("Failed to update transmit job with setpoint")
 
     def set_speed_range(self, speed_range: int) -> bool:
         """
@@ -262,7 +638,7 @@ class RNetController:
         :return: Whether the speed was successfully set
         """
         if self.MIN_SPEED <= speed_range <= self.MAX_SPEED:
-            self.__can_send(self.SPEED_FRAME_START + self._dec2hex(speed_range, 2))
+            self.send_frame(self.speed_frame(speed_range))
             return True
         else:
             logging.error(f"Invalid RNET SpeedRange: {speed_range}")
@@ -273,11 +649,28 @@ class RNetController:
         Stop the chair's movement
         """
         # Send the stop command
-        self.__can_send(self.STOP_FRAME)
+        if self._job is not None:
+            # Swap the stop frame into the cyclic job so it stops repeating the last drive frame
+            try:
+                self.__set_job(self.STOP_FRAME_BYTES)
+            except socket.error:
+                logging.error("Failed to update transmit job with stop frame")
+        else:
+            self.send_frame(self.STOP_FRAME_BYTES)
 
     def close(self) -> None:
         """
         Close the connection to the chair
         """
+        self.stop_setpoint_stream()
+
+        if self._bcm is not None:
+            self._bcm.delete_all()
+            self._bcm = None
+        if self._process is not None:
+            self._process.close()
+            self._process = None
+        self._job = None
+
         self._can_socket.close()
         self._can_socket = None
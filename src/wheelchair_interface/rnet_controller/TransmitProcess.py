@@ -0,0 +1,204 @@
+"""
+file: TransmitProcess.py
+
+description: Repeats frames onto the can bus from a separate process reading the current frame from shared memory
+
+note:
+    - The frame is published through a seqlock: the writer makes the sequence odd, writes the frame and makes it even
+      again, and the reader retries whenever the sequence was odd or changed while it read. There is only ever one
+      writer, the controlling process.
+    - The child is forked so it inherits the can socket and the shared memory without either being pickled
+    - The child logs straight to the root logger's handlers even if the event log was running when it was forked,
+      see eventlog.py
+    - The child checks on every frame that the controlling process is still its parent. Once it is gone (killed,
+      crashed or OOM killed) the child sends the stop frame and exits rather than repeating the last frame forever.
+"""
+
+import gc
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+
+from multiprocessing import shared_memory
+from threading import Lock
+from time import monotonic_ns
+
+from .FrameSender import FrameSender, SendStats
+from .PeriodicTransmitter import PeriodicTransmitter, TransmitStats
+
+
+class TransmitProcess:
+    """
+    Runs the periodic transmit loop in its own process so the controlling interpreter can not delay frames.
+
+    The controlling process only writes frames, optionally with a hold time after which the child sends the stop frame
+    instead, and the child stops the chair by itself if the controlling process dies. Send jitter is published back
+    through the same shared memory.
+    """
+    SEQUENCE = struct.Struct("<Q")
+    """ Seqlock sequence at the start of the shared memory, odd while a frame is being written """
+
+    SETPOINT = struct.Struct("<QQ16s")
+    """ Sequence, expiry (monotonic ns) and the can_frame to repeat """
+
+    STATS = struct.Struct("<QQddQQQd")
+    """ Frames, missed deadlines, total jitter, max jitter, then sent, dropped, retried and blocked time of the child,
+    after the setpoint """
+
+    NO_EXPIRY = (1 << 64) - 1
+    """ Expiry of a frame held until it is replaced """
+
+    READ_ATTEMPTS = 100
+    """ Reads of a frame being written before the child gives up and repeats the last frame it read """
+
+    def __init__(self, can_socket: socket.socket, stop_frame: bytes, frame_period: float, cpu: int = None,
+                 fifo_priority: int = None):
+        """
+        Constructor which starts the transmit process, it sends nothing until the first frame is set
+
+        :param can_socket: Raw can socket the child sends on
+        :param stop_frame: Frame sent once a held frame expires and when the process is closed
+        :param frame_period: Seconds between frames
+        :param cpu: CPU to pin the child to, None to leave it unpinned
+        :param fifo_priority: SCHED_FIFO priority (1-99) for the child, None for the default scheduler
+        """
+        self.frame_period = frame_period
+        self._shm = shared_memory.SharedMemory(create=True, size=self.SETPOINT.size + self.STATS.size)
+        self._buffer = self._shm.buf
+        self._sequence = 0
+        self._lock = Lock()
+
+        context = multiprocessing.get_context("fork")
+        self._cancel = context.Event()
+        self._process = context.Process(target=_transmit,
+                                        args=(self._buffer, can_socket, stop_frame, frame_period, cpu,
+                                              fifo_priority, self._cancel),
+                                        daemon=True)
+        self._process.start()
+
+    def set_frame(self, frame: bytes, hold: float = None) -> None:
+        """
+        Replace the frame the child repeats
+
+        :param frame: Built can_frame to repeat
+        :param hold: Seconds to repeat it for before falling back to the stop frame, None to repeat it until replaced
+        """
+        expiry = self.NO_EXPIRY if hold is None else monotonic_ns() + int(hold * 1e9)
+
+        with self._lock:
+            self.SEQUENCE.pack_into(self._buffer, 0, self._sequence + 1)
+            self.SETPOINT.pack_into(self._buffer, 0, self._sequence + 1, expiry, frame)
+            self._sequence += 2
+            self.SEQUENCE.pack_into(self._buffer, 0, self._sequence)
+
+    @property
+    def stats(self) -> TransmitStats:
+        """
+        :return: Send jitter statistics published by the child
+        """
+        stats = TransmitStats()
+        stats.frames, stats.missed_deadlines, stats.total_jitter, stats.max_jitter = \
+            self.STATS.unpack_from(self._buffer, self.SETPOINT.size)[:4]
+
+        return stats
+
+    @property
+    def send_stats(self) -> SendStats:
+        """
+        :return: Transmit queue counters published by the child
+        """
+        stats = SendStats()
+        stats.sent, stats.dropped, stats.retried, stats.blocked_time = \
+            self.STATS.unpack_from(self._buffer, self.SETPOINT.size)[4:]
+
+        return stats
+
+    def is_alive(self) -> bool:
+        """
+        :return: Whether the transmit process is running
+        """
+        return self._process.is_alive()
+
+    def close(self) -> None:
+        """
+        Stop the transmit process, which sends the stop frame as it exits, and free the shared memory
+        """
+        self._cancel.set()
+        self._process.join()
+        self._buffer = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _transmit(buffer: memoryview, can_socket: socket.socket, stop_frame: bytes, frame_period: float, cpu: int,
+              fifo_priority: int, cancel) -> None:
+    """
+    Body of the transmit process
+
+    :param buffer: Shared memory holding the setpoint and stats
+    :param can_socket: Raw can socket to send on
+    :param stop_frame: Frame sent once a held frame expires and on exit
+    :param frame_period: Seconds between frames
+    :param cpu: CPU to pin to, or None
+    :param fifo_priority: SCHED_FIFO priority, or None
+    :param cancel: Event set by the controlling process to stop
+    """
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError:
+            logging.warning(f"Failed to pin the transmit process to CPU {cpu}, leaving it unpinned")
+    if fifo_priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(fifo_priority))
+        except PermissionError:
+            logging.warning("SCHED_FIFO needs CAP_SYS_NICE, the transmit process uses the default scheduler")
+
+    # The loop allocates next to nothing, so a collection would only ever add jitter
+    gc.disable()
+
+    sequence_struct = TransmitProcess.SEQUENCE
+    setpoint_struct = TransmitProcess.SETPOINT
+    stats_struct = TransmitProcess.STATS
+    stats_offset = setpoint_struct.size
+    sender = FrameSender(can_socket, frame_period, stop_frame)
+    transmitter = PeriodicTransmitter(sender.send, frame_period)
+    stats = transmitter.stats
+    send_stats = sender.stats
+    last = stop_frame
+    parent = os.getppid()
+
+    def next_frame() -> bytes:
+        nonlocal last
+        # Orphaned children are reparented, so a different parent means nothing is left to replace or stop the frame
+        if os.getppid() != parent:
+            logging.error("Controlling process is gone, the transmit process is stopping the chair")
+            cancel.set()
+            last = stop_frame
+            return last
+
+        # Publish the stats of the frames so far for the controlling process
+        stats_struct.pack_into(buffer, stats_offset, stats.frames, stats.missed_deadlines, stats.total_jitter,
+                               stats.max_jitter, send_stats.sent, send_stats.dropped, send_stats.retried,
+                               send_stats.blocked_time)
+
+        for _ in range(TransmitProcess.READ_ATTEMPTS):
+            sequence, expiry, frame = setpoint_struct.unpack_from(buffer)
+            if sequence & 1 == 0 and sequence_struct.unpack_from(buffer)[0] == sequence:
+                last = stop_frame if monotonic_ns() > expiry else frame
+                break
+
+        return last
+
+    # Nothing is sent until the first frame is set
+    while sequence_struct.unpack_from(buffer)[0] == 0:
+        if cancel.wait(frame_period) or os.getppid() != parent:
+            return
+
+    try:
+        transmitter.stream(next_frame, cancel)
+        sender.send(stop_frame)
+    except socket.error:
+        logging.error("Transmit process failed to send, stopping")
@@ -0,0 +1,253 @@
+"""
+file: simulation.py
+
+description: Simulated R-Net chair and command link, so the whole Pi side can be run on a virtual clock
+
+note:
+    - The chair stands in for the can socket: it reads the drive and speed frames sent to it and integrates where a
+      chair obeying them would be. It moves at a constant velocity for each joystick position, there is no
+      acceleration.
+    - run_session runs pi_server's serve loop, dispatcher, watchdog and controller unchanged on a VirtualClock, a
+      ten minute session takes a couple of seconds and gives the same result every time
+"""
+
+import math
+
+from .clientserver.pi_server import serve
+from .clock import Clock, SYSTEM_CLOCK, VirtualClock
+from .protocol.resources import *
+from .rnet_controller.RNetController import RNetController
+
+
+class SimulatedChair:
+    """
+    Stand-in can socket which drives a kinematic model of the chair with the frames sent to it
+    """
+    TOP_SPEED = 1.7
+    """ Metres per second at full forward joystick and full speed range """
+
+    TOP_TURN_RATE = math.pi / 2
+    """ Radians per second at full side joystick and full speed range """
+
+    SLOWEST_FRACTION = 0.25
+    """ Fraction of the top speed reached at speed range 0, R-Net scales linearly from it up to the top speed """
+
+    FRAME_TIMEOUT = 0.1
+    """ Seconds without a drive frame before the chair stops by itself, as it does when the joystick goes quiet """
+
+    def __init__(self, clock: Clock = SYSTEM_CLOCK, speed_range: int = RNetController.MAX_SPEED):
+        """
+        Constructor for a chair at rest at the origin, facing along x
+
+        :param clock: Clock frames are timestamped with
+        :param speed_range: Speed range the chair starts at
+        """
+        self._clock = clock
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0
+        """ Pose as of the last update, metres and radians anticlockwise from x """
+
+        self.speed_range = speed_range
+        self.frames = 0
+        """ Number of frames received """
+
+        self.segments = []
+        """ (time, joystick x, joystick y) every time the joystick position changes """
+
+        self._joystick = (0, 0)
+        self._updated = clock()
+        self._last_drive = self._updated
+
+    @staticmethod
+    def joystick_position(data: bytes) -> tuple[int, int]:
+        """
+        :param data: Data of a drive frame
+        :return: Signed joystick position (x, y), each clamped to -100..100
+        """
+        x, y = (max(-100, min(100, value - 256 if value > 127 else value)) for value in data[:2])
+        return x, y
+
+    def send(self, frame: bytes, flags: int = 0) -> int:
+        """
+        Receive a frame as if it were written to the bus
+
+        :param frame: Built can frame
+        :param flags: Ignored, for the send flags of a socket
+        :return: Bytes "sent"
+        """
+        now = self._clock()
+        self.__advance(now)
+        self.frames += 1
+
+        can_id, dlc, data = RNetController.CAN_FRAME.unpack(frame)
+        if can_id == RNetController.DRIVE_FRAME_ID:
+            self._last_drive = now
+            self.__set_joystick(now, self.joystick_position(data))
+        elif can_id == RNetController.SPEED_FRAME_ID:
+            self.speed_range = min(data[0], RNetController.MAX_SPEED)
+
+        return len(frame)
+
+    def setblocking(self, flag: bool) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def pose(self) -> tuple[float, float, float]:
+        """
+        :return: (x, y, heading) now
+        """
+        self.__advance(self._clock())
+        return self.x, self.y, self.heading
+
+    def moving_time(self) -> float:
+        """
+        :return: Seconds the joystick has been off centre so far
+        """
+        self.__advance(self._clock())
+        moving = 0.0
+        for (start, x, y), (end, _, _) in zip(self.segments, self.segments[1:] + [(self._updated, 0, 0)]):
+            if x or y:
+                moving += end - start
+
+        return moving
+
+    def __set_joystick(self, now: float, joystick: tuple[int, int]) -> None:
+        """
+        :param now: Time of the change
+        :param joystick: New joystick position (x, y)
+        """
+        if joystick != self._joystick:
+            self._joystick = joystick
+            self.segments.append((now, *joystick))
+
+    def __advance(self, now: float) -> None:
+        """
+        Integrate the pose up to a time, stopping the chair where the drive frames ran out
+
+        :param now: Time to integrate to
+        """
+        timeout = self._last_drive + self.FRAME_TIMEOUT
+        if self._joystick != (0, 0) and timeout < now:
+            self.__integrate(timeout)
+            self.__set_joystick(timeout, (0, 0))
+        self.__integrate(now)
+
+    def __integrate(self, now: float) -> None:
+        """
+        Move the pose along the arc driven at the current joystick position
+
+        :param now: Time to integrate to
+        """
+        seconds = now - self._updated
+        if seconds <= 0:
+            return
+        self._updated = now
+
+        x, y = self._joystick
+        if not x and not y:
+            return
+
+        scale = self.SLOWEST_FRACTION + (1 - self.SLOWEST_FRACTION) * self.speed_range / RNetController.MAX_SPEED
+        speed = y / 100 * self.TOP_SPEED * scale
+        # Pushing the joystick right turns clockwise
+        turn_rate = -x / 100 * self.TOP_TURN_RATE * scale
+
+        heading = self.heading + turn_rate * seconds
+        if turn_rate:
+            self.x += speed / turn_rate * (math.sin(heading) - math.sin(self.heading))
+            self.y -= speed / turn_rate * (math.cos(heading) - math.cos(self.heading))
+        else:
+            self.x += speed * seconds * math.cos(self.heading)
+            self.y += speed * seconds * math.sin(self.heading)
+        self.heading = heading
+
+    def __repr__(self) -> str:
+        x, y, heading = self.pose()
+        return f"SimulatedChair(x={x:.3f}m, y={y:.3f}m, heading={math.degrees(heading):.1f}deg, frames={self.frames})"
+
+
+class ScriptedLink:
+    """
+    Stand-in for pi_server's serial device which delivers scripted commands at their times on a clock
+    """
+    def __init__(self, clock: Clock, commands: list[tuple[float, bytes]], end: float):
+        """
+        Constructor for a link, script times count from now
+
+        :param clock: Clock the script is timed on
+        :param commands: (seconds from now, command bytes) sorted by time
+        :param end: Seconds from now at which reading raises EOFError, so serve returns
+        """
+        self._clock = clock
+        self._start = clock()
+        self._commands = commands
+        self._next = 0
+        self._end = end
+        self._buffer = b""
+
+    @property
+    def in_waiting(self) -> int:
+        """
+        :return: Bytes which can be read without waiting
+        """
+        return len(self._buffer)
+
+    def read(self, size: int = 1) -> bytes:
+        """
+        Wait on the clock for the next scripted command if nothing is buffered
+
+        :param size: Bytes to read at most
+        :return: Up to size bytes
+        """
+        if not self._buffer:
+            if self._next == len(self._commands):
+                self._clock.sleep(self._start + self._end - self._clock())
+                raise EOFError("The script has finished")
+
+            at, command = self._commands[self._next]
+            self._next += 1
+            self._clock.sleep(self._start + at - self._clock())
+            self._buffer = bytes(command)
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "ScriptedLink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def run_session(commands: list[tuple[float, bytes]], seconds: float, watchdog_window: float = WATCHDOG_WINDOW,
+                coalesce: bool = True, frame_period: float = RNetController.FRAME_PERIOD,
+                clock: VirtualClock = None) -> SimulatedChair:
+    """
+    Serve a scripted session through pi_server to a simulated chair on a virtual clock
+
+    :param commands: (seconds from the start, command bytes) sorted by time, as the Nano would send them
+    :param seconds: Length of the session
+    :param watchdog_window: Seconds without a heartbeat or command before the chair is stopped, None to disable
+    :param coalesce: Whether moves continuing the running motion are merged into it
+    :param frame_period: Seconds between repeated frames while driving
+    :param clock: Virtual clock to run on, created by the calling thread, a new one if None
+    :return: The chair, as it was at the end of the session
+    """
+    clock = clock or VirtualClock()
+    chair = SimulatedChair(clock)
+    controller = RNetController(frame_period=frame_period, can_socket=chair, clock=clock)
+
+    try:
+        serve(controller, ScriptedLink(clock, commands, seconds), watchdog_window, coalesce, clock)
+    except EOFError:
+        pass
+
+    # The threads left on the clock do not run again unless this thread waits on it
+    chair.pose()
+    return chair
@@ -0,0 +1,81 @@
+"""
+file: startup.py
+
+description: Records how long each stage of start up takes, so restarts after a fault can be kept fast
+
+note:
+    - Imported first by main.py, its import time is the origin of every stage
+    - The interpreter start up before that comes from /proc and only has the resolution of the kernel clock tick
+"""
+import logging
+import os
+import time
+
+
+def _process_age() -> float:
+    """
+    :return: Seconds since the process was started, or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # The process name may hold spaces, the fields after it start with the state (field 3)
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupTimer:
+    """
+    Collects the time at which each start up stage is first reached
+    """
+    def __init__(self):
+        """
+        Constructor which takes now as the origin
+        """
+        self.origin = time.monotonic()
+        self.interpreter = _process_age()
+        """ Seconds from the process starting to the origin, None if unknown """
+
+        self.stages = {}
+        """ Seconds from the origin to each stage, in the order they were reached """
+
+        self.report_when_ready = False
+        """ Whether to log the report once the chair is controllable """
+
+    def mark(self, stage: str) -> None:
+        """
+        Record reaching a stage, only the first time counts
+
+        :param stage: Name of the stage
+        """
+        self.stages.setdefault(stage, time.monotonic() - self.origin)
+
+    def ready(self) -> None:
+        """
+        Record that the process is ready to take commands and log the report if asked for
+        """
+        first = "ready" not in self.stages
+        self.mark("ready")
+        if first and self.report_when_ready:
+            logging.info(self.report())
+
+    def report(self) -> str:
+        """
+        :return: Every stage with the milliseconds since the process started
+        """
+        offset = self.interpreter or 0.0
+        lines = ["Start up time (ms since the process started):"]
+        if self.interpreter is not None:
+            lines.append(f"{'interpreter':>24}: {offset * 1000:8.1f}")
+        for stage, seconds in self.stages.items():
+            lines.append(f"{stage:>24}: {(offset + seconds) * 1000:8.1f}")
+
+        return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+""" Start up timer shared by the whole process """
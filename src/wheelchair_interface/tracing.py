@@ -0,0 +1,222 @@
+"""
+file: tracing.py
+
+description: Optional per-command latency tracing from the producer's socket to the first can frame
+
+note:
+    - Timestamps come from the monotonic clock of each process. Hops on the same machine compare directly, the
+      UART hop between the Nano and the Pi is only meaningful when both ends run on one host (bench setups with a
+      pty) or the clocks are otherwise aligned.
+"""
+import argparse
+import atexit
+import json
+import logging
+import math
+import os
+
+from collections import defaultdict, deque
+from time import monotonic_ns
+
+
+HOP_CLIENT_SEND = "client_send"
+""" Producer hands the command to its socket """
+
+HOP_SOCKET_RECEIVE = "socket_receive"
+""" nano_client parses the command from the socket """
+
+HOP_UART_WRITE = "uart_write"
+""" nano_client starts writing the command to the UART """
+
+HOP_UART_DECODE = "uart_decode"
+""" pi_server parsed the command from the UART """
+
+HOP_DEQUEUE = "dequeue"
+""" pi_server dispatcher took the command off its queue """
+
+HOP_CAN_SEND = "can_send"
+""" First can frame sent after the command was dequeued """
+
+HOPS = (HOP_CLIENT_SEND, HOP_SOCKET_RECEIVE, HOP_UART_WRITE, HOP_UART_DECODE, HOP_DEQUEUE, HOP_CAN_SEND)
+""" Hops in the order a command passes through them """
+
+
+class Tracer:
+    """
+    Collects (trace id, hop, timestamp) events in memory while enabled, recording is a no-op while disabled
+    """
+    def __init__(self, max_events: int = 100_000):
+        """
+        Constructor for a disabled tracer
+
+        :param max_events: Events kept before the oldest are discarded
+        """
+        self.enabled = False
+        self.armed = None
+        """ Trace id waiting for its first can frame, checked on every frame so it is only set while enabled """
+
+        self._events = deque(maxlen=max_events)
+
+    def mark(self, trace_id: int, hop: str) -> None:
+        """
+        Record that a traced command reached a hop
+
+        :param trace_id: Id the command was tagged with
+        :param hop: One of HOPS
+        """
+        if self.enabled:
+            self._events.append((trace_id, hop, monotonic_ns()))
+
+    def arm(self, trace_id: int) -> None:
+        """
+        Record the next can frame sent as the can_send hop of a trace
+
+        :param trace_id: Id the command was tagged with
+        """
+        if self.enabled:
+            self.armed = trace_id
+
+    def fire(self) -> None:
+        """
+        Called when a can frame is sent while a trace is armed
+        """
+        trace_id, self.armed = self.armed, None
+        if trace_id is not None:
+            self.mark(trace_id, HOP_CAN_SEND)
+
+    def take(self) -> list[tuple[int, str, int]]:
+        """
+        Remove and return the recorded events
+
+        :return: (trace id, hop, monotonic ns) in the order they were recorded
+        """
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+
+        return events
+
+    def export(self, path: str) -> int:
+        """
+        Append the recorded events to a JSON lines file and clear them
+
+        :param path: File to append to
+        :return: Number of events written
+        """
+        events = self.take()
+        pid = os.getpid()
+        with open(path, "a") as f:
+            for trace_id, hop, ns in events:
+                f.write(json.dumps({"trace": trace_id, "hop": hop, "ns": ns, "pid": pid}) + "\n")
+
+        return len(events)
+
+
+TRACER = Tracer()
+""" Tracer shared by the whole process """
+
+
+def enable(export_path: str = None) -> Tracer:
+    """
+    Start recording trace events in this process
+
+    :param export_path: If given, events are appended to this file when the process exits
+    :return: The process tracer
+    """
+    TRACER.enabled = True
+    if export_path is not None:
+        atexit.register(TRACER.export, export_path)
+
+    return TRACER
+
+
+def group(events, traces: dict[int, dict[str, int]] = None) -> dict[int, dict[str, int]]:
+    """
+    Group events by trace id
+
+    :param events: (trace id, hop, monotonic ns) events
+    :param traces: Existing grouping to add to
+    :return: Timestamp (ns) of each hop keyed by trace id, the first event of each hop wins
+    """
+    traces = defaultdict(dict) if traces is None else traces
+    for trace_id, hop, ns in events:
+        traces[trace_id].setdefault(hop, ns)
+
+    return traces
+
+
+def load(paths: list[str]) -> dict[int, dict[str, int]]:
+    """
+    Merge exported events from one or more processes
+
+    :param paths: JSON lines files written by Tracer.export
+    :return: Timestamp (ns) of each hop keyed by trace id, the first event of each hop wins
+    """
+    traces = defaultdict(dict)
+    for path in paths:
+        with open(path) as f:
+            events = (json.loads(line) for line in f)
+            group(((event["trace"], event["hop"], event["ns"]) for event in events), traces)
+
+    return traces
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Nearest rank percentile
+
+    :param values: Sorted values
+    :param fraction: Percentile as a fraction of 1
+    :return: Value at the percentile
+    """
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def summarize(traces: dict[int, dict[str, int]]) -> dict[str, dict[str, float]]:
+    """
+    Compute the latency of every hop from the hop recorded before it
+
+    :param traces: Output of load
+    :return: {"<from>-><to>": {"count", "p50_us", "p99_us", "max_us"}} plus an "end_to_end" entry
+    """
+    latencies = defaultdict(list)
+    for hops in traces.values():
+        present = [hop for hop in HOPS if hop in hops]
+        for first, second in zip(present, present[1:]):
+            latencies[f"{first}->{second}"].append((hops[second] - hops[first]) / 1000)
+        if len(present) > 1:
+            latencies["end_to_end"].append((hops[present[-1]] - hops[present[0]]) / 1000)
+
+    summary = {}
+    for name, values in latencies.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50_us": percentile(values, 0.50),
+            "p99_us": percentile(values, 0.99),
+            "max_us": values[-1],
+        }
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize exported trace events into per-hop latencies")
+    parser.add_argument("paths", nargs="+", help="JSON lines files written by Tracer.export")
+    parser.add_argument("--json", help="Also write the summary to this file for comparison between releases")
+    args = parser.parse_args()
+
+    summary = summarize(load(args.paths))
+    for name, stats in summary.items():
+        print(f"{name:>28}: n={stats['count']:<6} p50={stats['p50_us']:9.1f}us "
+              f"p99={stats['p99_us']:9.1f}us max={stats['max_us']:9.1f}us")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        logging.info(f"Wrote summary to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+file: conftest.py
+
+description: Makes the wheelchair_interface package under src importable from the tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,172 @@
+"""
+file: test_async_controller.py
+
+description: Cancelling, replacing, extending and stopping motions of the AsyncRNetController, and its send timeout
+"""
+import asyncio
+import errno
+import socket
+
+from wheelchair_interface.benchmarks.standins import RecordingSocket
+from wheelchair_interface.protocol.resources import Direction
+from wheelchair_interface.rnet_controller.AsyncRNetController import AsyncRNetController
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+
+
+PERIOD = 0.01
+STOP = RNetController.STOP_FRAME_BYTES
+FORWARD = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.FORWARD])
+LEFT = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.LEFT])
+
+
+class FullQueueSocket(RecordingSocket):
+    """
+    Stand-in can socket whose next sends fail with ENOBUFS, as a full interface queue does
+    """
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, frame: bytes, flags: int = 0) -> int:
+        if self.failures:
+            self.failures -= 1
+            raise OSError(errno.ENOBUFS, "No buffer space available")
+        return super().send(frame, flags)
+
+
+def run(test, can_socket=None):
+    """
+    Run a test coroutine against a controller on a recording stand-in
+
+    :param test: Coroutine function taking (controller, socket)
+    :param can_socket: Stand-in to use instead of a RecordingSocket
+    :return: What the test returned
+    """
+    async def main():
+        stand_in = can_socket or RecordingSocket()
+        controller = AsyncRNetController(frame_period=PERIOD, can_socket=stand_in)
+        return await test(controller, stand_in)
+
+    return asyncio.run(main())
+
+
+def gaps(frames: list[tuple[float, bytes]]) -> list[float]:
+    """
+    :return: Seconds between each frame and the one before it
+    """
+    return [later - earlier for (earlier, _), (later, _) in zip(frames, frames[1:])]
+
+
+def test_cancelled_motion_ends_with_stop():
+    async def test(controller, can_socket):
+        motion = controller.drive_forward(10)
+        await asyncio.sleep(0.05)
+        motion.cancel()
+
+        assert await motion is False
+        assert motion.done() and not motion.replaced
+        frames = [frame for _, frame in can_socket.frames]
+        assert frames[-1] == STOP and set(frames[:-1]) == {FORWARD}
+        assert motion.frames == len(frames) - 1
+
+    run(test)
+
+
+def test_replaced_motion_leaves_no_gap_and_no_second_stream():
+    async def test(controller, can_socket):
+        forward = controller.drive_forward(10)
+        await asyncio.sleep(0.05)
+        left = controller.turn_left(0.1)
+
+        assert await left is True
+        assert await forward is False and forward.replaced
+        frames = [frame for _, frame in can_socket.frames]
+        switch = frames.index(LEFT)
+        # Forward hands straight over to left, with no stop in between and no forward frame after
+        assert set(frames[:switch]) == {FORWARD}
+        assert set(frames[switch:-1]) == {LEFT}
+        assert frames[-1] == STOP and frames.count(STOP) == 1
+        # No missing slot across the hand over, and one stream at a time after it: never two frames in one slot
+        assert all(gap < 2.5 * PERIOD for gap in gaps(can_socket.frames[:-1]))
+        assert all(gap > 0.5 * PERIOD for gap in gaps(can_socket.frames[switch:-1]))
+
+    run(test)
+
+
+def test_extended_motion_runs_on_without_a_gap():
+    async def test(controller, can_socket):
+        start = asyncio.get_running_loop().time()
+        motion = controller.drive_forward(0.1)
+        await asyncio.sleep(0.05)
+
+        assert controller.extend_motion(Direction.FORWARD, 0.2)
+        assert not controller.extend_motion(Direction.LEFT, 0.2)
+        assert await motion is True
+        assert asyncio.get_running_loop().time() - start >= 0.25
+        assert not controller.extend_motion(Direction.FORWARD, 0.2)
+        assert all(gap < 2.5 * PERIOD for gap in gaps(can_socket.frames))
+        assert can_socket.frames[-1][1] == STOP
+
+    run(test)
+
+
+def test_stop_ends_the_motion_or_sends_stop_when_idle():
+    async def test(controller, can_socket):
+        await controller.stop()
+        assert [frame for _, frame in can_socket.frames] == [STOP]
+
+        motion = controller.drive_forward(10)
+        await asyncio.sleep(0.03)
+        await controller.stop()
+
+        assert motion.done() and await motion is False
+        assert can_socket.frames[-1][1] == STOP and can_socket.frames[-2][1] == FORWARD
+
+    run(test)
+
+
+def test_drive_frame_is_dropped_after_a_period_but_stop_waits_for_room():
+    controller_socket, bus_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    controller_socket.setblocking(False)
+    # Fill the socket buffer, as a transmit queue which is not draining
+    try:
+        while True:
+            controller_socket.send(FORWARD)
+    except BlockingIOError:
+        pass
+
+    def drain():
+        bus_socket.setblocking(False)
+        try:
+            while True:
+                bus_socket.recv(16)
+        except BlockingIOError:
+            pass
+
+    async def test(controller, _):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        assert await controller.send_frame(FORWARD) is False
+        assert PERIOD <= loop.time() - start < 5 * PERIOD
+        assert controller.send_stats.dropped == 1
+
+        # Room is made only after several periods, the stop frame still goes out
+        loop.call_later(5 * PERIOD, drain)
+        start = loop.time()
+        assert await asyncio.wait_for(controller.send_frame(STOP), 1) is True
+        assert loop.time() - start >= 4 * PERIOD
+
+    try:
+        run(test, controller_socket)
+    finally:
+        controller_socket.close()
+        bus_socket.close()
+
+
+def test_full_interface_queue_is_retried():
+    async def test(controller, can_socket):
+        assert await controller.send_frame(STOP) is True
+        assert controller.send_stats.retried == 3 and controller.send_stats.sent == 1
+        assert [frame for _, frame in can_socket.frames] == [STOP]
+
+    run(test, FullQueueSocket(3))
@@ -0,0 +1,130 @@
+"""
+file: test_bcm_transmitter.py
+
+description: Broadcast manager messages of the BCM transport, checked byte for byte on a stand-in socket and on vcan0
+    where it exists
+"""
+import os
+import socket
+import struct
+import time
+
+import pytest
+
+from wheelchair_interface.protocol.resources import Direction
+from wheelchair_interface.rnet_controller.BCMTransmitter import BCMTransmitter
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+
+
+STOP = RNetController.STOP_FRAME_BYTES
+FORWARD = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.FORWARD])
+DRIVE_ID = RNetController.DRIVE_FRAME_ID
+TIMER = socket.CAN_BCM_SETTIMER | socket.CAN_BCM_STARTTIMER
+
+# Laid out by hand rather than with BCMTransmitter.MSG_HEAD, as the kernel's struct bcm_msg_head on a 64 bit build
+HEAD = struct.Struct("=IIIxxxxqqqqII") if struct.calcsize("l") == 8 else struct.Struct("=IIIllllII")
+
+
+@pytest.fixture
+def bcm():
+    """
+    :return: (transmitter on a stand-in socket, the other end reading its messages)
+    """
+    bcm_socket, kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    kernel.settimeout(1)
+    yield BCMTransmitter(bcm_socket, 0.01), kernel
+    bcm_socket.close()
+    kernel.close()
+
+
+def read(kernel: socket.socket) -> tuple[tuple, bytes]:
+    """
+    :return: (opcode, flags, count, ival1 sec, ival1 usec, ival2 sec, ival2 usec, can_id, nframes), attached frames
+    """
+    message = kernel.recv(256)
+
+    return HEAD.unpack_from(message), message[HEAD.size:]
+
+
+def test_head_matches_the_kernel_layout():
+    assert BCMTransmitter.MSG_HEAD.size == HEAD.size
+
+
+def test_first_frame_sets_up_the_timer_and_later_ones_only_the_data(bcm):
+    transmitter, kernel = bcm
+
+    transmitter.set_frame(FORWARD)
+    assert read(kernel) == ((socket.CAN_BCM_TX_SETUP, TIMER, 0, 0, 0, 0, 10_000, DRIVE_ID, 1), FORWARD)
+
+    transmitter.set_frame(STOP)
+    assert read(kernel) == ((socket.CAN_BCM_TX_SETUP, 0, 0, 0, 0, 0, 10_000, DRIVE_ID, 1), STOP)
+
+
+def test_held_frame_runs_out_and_the_next_frame_restarts_the_timer(bcm):
+    transmitter, kernel = bcm
+    transmitter.set_frame(STOP)
+    read(kernel)
+
+    transmitter.set_frame(FORWARD, hold=0.255)
+    assert read(kernel) == ((socket.CAN_BCM_TX_SETUP, TIMER | socket.CAN_BCM_TX_ANNOUNCE, 26, 0, 10_000, 0, 0,
+                             DRIVE_ID, 1), FORWARD)
+
+    transmitter.set_frame(STOP)
+    assert read(kernel) == ((socket.CAN_BCM_TX_SETUP, TIMER, 0, 0, 0, 0, 10_000, DRIVE_ID, 1), STOP)
+
+
+def test_send_once_and_delete(bcm):
+    transmitter, kernel = bcm
+    speed = RNetController.speed_frame(50)
+
+    transmitter.send_once(speed)
+    assert read(kernel) == ((socket.CAN_BCM_TX_SEND, 0, 0, 0, 0, 0, 10_000, RNetController.SPEED_FRAME_ID, 1), speed)
+
+    transmitter.set_frame(FORWARD)
+    read(kernel)
+    transmitter.delete_all()
+    assert read(kernel) == ((socket.CAN_BCM_TX_DELETE, 0, 0, 0, 0, 0, 10_000, DRIVE_ID, 0), b"")
+
+
+def test_controller_holds_a_timed_motion_then_stops():
+    bcm_socket, kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    kernel.settimeout(1)
+    controller = RNetController(transport=RNetController.TRANSPORT_BCM, can_socket=bcm_socket)
+
+    try:
+        controller.drive_forward_seconds(0.05)
+
+        (opcode, flags, count, *_), frame = read(kernel)
+        assert (opcode, flags & socket.CAN_BCM_TX_ANNOUNCE, count, frame) == \
+            (socket.CAN_BCM_TX_SETUP, socket.CAN_BCM_TX_ANNOUNCE, 5, FORWARD)
+        assert read(kernel) == ((socket.CAN_BCM_TX_SETUP, TIMER, 0, 0, 0, 0, 10_000, DRIVE_ID, 1), STOP)
+
+    finally:
+        controller.close()
+        kernel.close()
+
+
+@pytest.mark.skipif(not os.path.exists("/sys/class/net/vcan0"), reason="needs a vcan0 interface")
+def test_kernel_repeats_the_job_on_vcan():
+    bus = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    bus.bind(("vcan0",))
+    bus.settimeout(1)
+    transmitter = BCMTransmitter(RNetController._open_connection(0, RNetController.TRANSPORT_BCM), 0.01)
+
+    try:
+        transmitter.set_frame(FORWARD)
+        start = time.monotonic()
+        frames = [bus.recv(16) for _ in range(10)]
+        assert frames == [FORWARD] * 10
+        assert 0.08 < time.monotonic() - start < 0.2
+
+        transmitter.delete_all()
+        time.sleep(0.05)
+        bus.settimeout(0.05)
+        with pytest.raises(socket.timeout):
+            while True:
+                bus.recv(16)
+
+    finally:
+        transmitter._socket.close()
+        bus.close()
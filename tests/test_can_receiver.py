@@ -0,0 +1,154 @@
+"""
+file: test_can_receiver.py
+
+description: Filters, ring buffer reuse, error frames and the asyncio stream of the CanReceiver
+"""
+import asyncio
+import logging
+import queue
+import socket
+import struct
+import time
+
+from wheelchair_interface.protocol.resources import Direction
+from wheelchair_interface.rnet_controller.CanReceiver import CanReceiver
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+
+
+FORWARD = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.FORWARD])
+
+
+class StandInCanSocket:
+    """
+    Stand-in raw can socket recording its options and receiving the frames it is fed
+    """
+    def __init__(self):
+        self.options = {}
+        self.frames = queue.Queue()
+        self.timeout = None
+        self.closed = False
+
+    def setsockopt(self, level: int, option: int, value) -> None:
+        self.options[(level, option)] = value
+
+    def settimeout(self, timeout: float) -> None:
+        self.timeout = timeout
+
+    def recv_into(self, buffer: bytearray) -> int:
+        try:
+            frame = self.frames.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError
+        buffer[:len(frame)] = frame
+        return len(frame)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def frame(can_id: int, data: bytes) -> bytes:
+    return RNetController.CAN_FRAME.pack(can_id, len(data), data)
+
+
+def receive(receiver: CanReceiver, can_socket: StandInCanSocket, frames: list[bytes]) -> list:
+    """
+    Feed frames through a started receiver
+
+    :return: (can id, view, copy of the data) of every frame handed to the subscriber
+    """
+    received = []
+    receiver.subscribe(lambda can_id, data: received.append((can_id, data, bytes(data))))
+    receiver.start()
+    for built in frames:
+        can_socket.frames.put(built)
+    deadline = time.monotonic() + 2
+    while len(received) < len(frames) and time.monotonic() < deadline:
+        time.sleep(0.001)
+    receiver.close()
+
+    return received
+
+
+def test_filters_are_packed_for_the_kernel():
+    can_socket = StandInCanSocket()
+    CanReceiver(can_socket, can_ids=CanReceiver.RNET_FRAME_IDS, receive_buffer=1 << 16)
+
+    mask = socket.CAN_EFF_FLAG | socket.CAN_RTR_FLAG | socket.CAN_EFF_MASK
+    assert can_socket.options[(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER)] == \
+        struct.pack("=IIII", RNetController.DRIVE_FRAME_ID, mask, RNetController.SPEED_FRAME_ID, mask)
+    assert can_socket.options[(socket.SOL_CAN_RAW, CanReceiver.CAN_RAW_ERR_FILTER)] == struct.pack("=I", 0x1fffffff)
+    assert can_socket.options[(socket.SOL_SOCKET, socket.SO_RCVBUF)] == 1 << 16
+
+
+def test_no_filters_unless_asked():
+    can_socket = StandInCanSocket()
+    CanReceiver(can_socket, errors=False)
+
+    assert (socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER) not in can_socket.options
+    assert (socket.SOL_CAN_RAW, CanReceiver.CAN_RAW_ERR_FILTER) not in can_socket.options
+
+
+def test_ring_wraps_around_and_reuses_its_buffers():
+    can_socket = StandInCanSocket()
+    receiver = CanReceiver(can_socket, ring_size=4)
+    frames = [frame(RNetController.DRIVE_FRAME_ID, bytes((i, 0x64))) for i in range(10)]
+
+    received = receive(receiver, can_socket, frames)
+
+    assert [copy for _, _, copy in received] == [bytes((i, 0x64)) for i in range(10)]
+    assert all(can_id == RNetController.DRIVE_FRAME_ID for can_id, _, _ in received)
+    assert receiver.received == 10 and receiver.errors == 0
+    # A view is only valid until the ring comes round to its buffer again
+    assert bytes(received[0][1]) == bytes((8, 0x64))
+    assert bytes(received[9][1]) == bytes((9, 0x64))
+    assert can_socket.closed
+
+
+def test_data_length_is_taken_from_the_dlc():
+    can_socket = StandInCanSocket()
+    receiver = CanReceiver(can_socket)
+    # A dlc above 8 is clamped to the data there is
+    oversized = RNetController.CAN_FRAME.pack(RNetController.SPEED_FRAME_ID, 15, bytes(range(8)))
+
+    received = receive(receiver, can_socket, [RNetController.speed_frame(50), oversized])
+
+    assert [copy for _, _, copy in received] == [bytes((50,)), bytes(range(8))]
+
+
+def test_error_frame_is_reported_not_taken_for_a_drive_frame(caplog):
+    can_socket = StandInCanSocket()
+    receiver = CanReceiver(can_socket)
+    # Bus off, with data which would read as a forward drive
+    error = frame(socket.CAN_ERR_FLAG | 0x40, FORWARD[8:10])
+
+    with caplog.at_level(logging.WARNING):
+        received = receive(receiver, can_socket, [error, FORWARD])
+
+    (error_id, _, _), (drive_id, _, _) = received
+    assert error_id & socket.CAN_ERR_FLAG and error_id != RNetController.DRIVE_FRAME_ID
+    assert drive_id == RNetController.DRIVE_FRAME_ID
+    assert receiver.received == 2 and receiver.errors == 1
+    assert "Can error frame of class 0x40" in caplog.text
+
+
+def test_stream_copies_frames_onto_the_loop():
+    can_socket = StandInCanSocket()
+    receiver = CanReceiver(can_socket, ring_size=2)
+
+    async def main():
+        frames = receiver.stream(maxsize=3)
+        receiver.start()
+        for i in range(5):
+            can_socket.frames.put(frame(RNetController.DRIVE_FRAME_ID, bytes((i, 0))))
+        while receiver.received < 5:
+            await asyncio.sleep(0.001)
+        # Let the last call_soon_threadsafe run
+        await asyncio.sleep(0.01)
+        receiver.close()
+
+        return [frames.get_nowait() for _ in range(frames.qsize())]
+
+    received = asyncio.run(main())
+
+    # Copied, so the ring wrapping twice changed nothing, and the two frames past maxsize were dropped
+    assert received == [(RNetController.DRIVE_FRAME_ID, bytes((i, 0))) for i in range(3)]
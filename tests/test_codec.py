@@ -0,0 +1,80 @@
+"""
+file: test_codec.py
+
+description: The duration table and batch codec against the division loop they replaced, around MAX_MANTISSA too
+"""
+import numpy as np
+import pytest
+
+from wheelchair_interface.protocol.processor import decode_many, decode_move_cmd, encode_many, encode_move_cmd, \
+    DURATION_TABLE_MILLISECONDS, InvalidCmdException, InvalidTimeException
+from wheelchair_interface.protocol.resources import *
+
+
+def loop_encode_time(ms: int) -> tuple[int, int]:
+    """
+    Reduce milliseconds a decade at a time, as durations were encoded before the table
+
+    :param ms: Duration in milliseconds
+    :return: (mantissa, exponent)
+    """
+    mantissa, exponent = ms, 0
+    while mantissa % 10 == 0 or mantissa > MAX_MANTISSA:
+        mantissa //= 10
+        exponent += 1
+
+    return mantissa, exponent
+
+
+# Every duration in the table, and ones past it around the mantissa boundary at each decade
+TABLE_MS = list(range(MIN_MILLISECONDS, DURATION_TABLE_MILLISECONDS + 1))
+BEYOND_MS = [mantissa * 10 ** exponent + offset for exponent in range(2, 7)
+             for mantissa in (MAX_MANTISSA - 1, MAX_MANTISSA, MAX_MANTISSA + 1, MAX_MANTISSA + 2)
+             for offset in (0, 1, 7)]
+BEYOND_MS = [ms for ms in BEYOND_MS if ms > DURATION_TABLE_MILLISECONDS] + [12345, 99999, 10 ** 9]
+
+
+@pytest.mark.parametrize("ms", [TABLE_MS, BEYOND_MS], ids=["table", "beyond_table"])
+def test_encode_matches_the_loop(ms):
+    expected = [loop_encode_time(value) for value in ms]
+
+    single = [tuple(encode_move_cmd(Direction.FORWARD, value / 1000)[2:4]) for value in ms]
+    batch = encode_many([Direction.FORWARD] * len(ms), [value / 1000 for value in ms])
+
+    assert single == expected
+    assert [tuple(cmd) for cmd in batch[:, 2:4].tolist()] == expected
+    # Payload bytes never take the framing values
+    assert batch[:, 2].max() <= MAX_MANTISSA and batch[:, 3].max() <= MAX_EXPONENT
+
+
+def test_mantissa_boundary():
+    assert loop_encode_time(253) == (253, 0)
+    assert encode_move_cmd(Direction.LEFT, 0.253)[2:4] == bytearray((253, 0))
+    assert encode_move_cmd(Direction.LEFT, 0.254)[2:4] == bytearray((25, 1))
+    assert encode_move_cmd(Direction.LEFT, 2.53)[2:4] == bytearray((253, 1))
+    assert encode_move_cmd(Direction.LEFT, 2.54)[2:4] == bytearray((25, 2))
+
+
+def test_batch_matches_single_commands():
+    durations = [ms / 1000 for ms in TABLE_MS[::97] + BEYOND_MS]
+    directions = [list(Direction)[i % len(Direction)] for i in range(len(durations))]
+
+    batch = encode_many(directions, durations)
+    single = b"".join(encode_move_cmd(direction, duration) for direction, duration in zip(directions, durations))
+    assert batch.tobytes() == single
+
+    decoded_directions, decoded_durations = decode_many(single)
+    expected = [decode_move_cmd(single[i:i + PROTOCOL_LENGTH]) for i in range(0, len(single), PROTOCOL_LENGTH)]
+    assert decoded_directions.tolist() == [int(direction) for direction, _ in expected]
+    assert np.allclose(decoded_durations, [duration for _, duration in expected], rtol=1e-12)
+
+
+def test_batch_rejects_what_single_commands_reject():
+    with pytest.raises(InvalidTimeException):
+        encode_many([Direction.FORWARD], [0])
+    with pytest.raises(InvalidCmdException):
+        encode_many([max(Direction) + 1], [1])
+    with pytest.raises(InvalidCmdException):
+        decode_many(bytes(encode_move_cmd(Direction.FORWARD, 1))[:-1] + b"\x00")
+    with pytest.raises(InvalidCmdException):
+        decode_many(bytes(PROTOCOL_LENGTH + 1))
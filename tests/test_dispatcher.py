@@ -0,0 +1,120 @@
+"""
+file: test_dispatcher.py
+
+description: Latest wins, STOP preemption and merging of the pi server's CommandDispatcher
+"""
+import threading
+import time
+
+from wheelchair_interface.clientserver.pi_server import CommandDispatcher
+from wheelchair_interface.clock import Clock, SYSTEM_CLOCK, VirtualClock
+from wheelchair_interface.protocol.processor import encode_move_cmd
+from wheelchair_interface.protocol.resources import Direction
+
+
+class RecordingController:
+    """
+    Stand-in controller whose motions wait out their duration unless cancelled, as the real one does
+    """
+    def __init__(self, clock: Clock = SYSTEM_CLOCK):
+        self._clock = clock
+        self.drives = []
+        """ (direction, seconds, seconds it ran for) of every motion, appended once it ends """
+
+        self.started = threading.Event()
+        """ Set whenever a motion starts """
+
+        self.direction = None
+
+    def drive_direction_seconds(self, direction: Direction, seconds: float, cancel: threading.Event = None) -> bool:
+        self.direction = direction
+        self.started.set()
+        start = self._clock()
+        cancelled = cancel.wait(seconds) if cancel is not None else False
+        self.direction = None
+        self.drives.append((direction, seconds, self._clock() - start))
+        return not cancelled
+
+    def extend_motion(self, direction: Direction, seconds: float) -> bool:
+        return self.direction == direction
+
+    def stop_setpoint_stream(self) -> None:
+        pass
+
+    def set_setpoint(self, x: int, y: int) -> None:
+        pass
+
+
+def wait_for(predicate, timeout: float = 2.0) -> bool:
+    """
+    :return: Whether the predicate became true within the timeout
+    """
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def test_only_the_latest_queued_command_runs():
+    controller = RecordingController()
+    dispatcher = CommandDispatcher(controller, coalesce=False)
+    for direction in (Direction.FORWARD, Direction.LEFT, Direction.RIGHT):
+        dispatcher.submit(encode_move_cmd(direction, 0.01))
+
+    dispatcher.start()
+
+    assert wait_for(lambda: controller.drives)
+    time.sleep(0.05)
+    assert [drive[0] for drive in controller.drives] == [Direction.RIGHT]
+    assert dispatcher.dropped == 2
+    assert dispatcher.queue_depth == 0
+
+
+def test_stop_preempts_the_running_motion():
+    controller = RecordingController()
+    dispatcher = CommandDispatcher(controller)
+    dispatcher.start()
+
+    dispatcher.submit(encode_move_cmd(Direction.FORWARD, 10))
+    assert controller.started.wait(1)
+    controller.started.clear()
+    dispatcher.submit(encode_move_cmd(Direction.STOP, 0.01))
+
+    assert wait_for(lambda: len(controller.drives) == 2)
+    (first, _, ran_for), (second, _, _) = controller.drives
+    assert first == Direction.FORWARD and ran_for < 0.05
+    assert second == Direction.STOP
+
+
+def test_stop_preempts_the_running_motion_in_virtual_time():
+    clock = VirtualClock()
+    controller = RecordingController(clock)
+    dispatcher = CommandDispatcher(controller, clock=clock)
+    dispatcher.start()
+
+    dispatcher.submit(encode_move_cmd(Direction.FORWARD, 10))
+    clock.sleep(1.0)
+    dispatcher.submit(encode_move_cmd(Direction.STOP, 0.5))
+    clock.sleep(1.0)
+
+    # Preempted the moment the stop was submitted, and the stop then ran its whole duration
+    assert controller.drives == [(Direction.FORWARD, 10, 1.0), (Direction.STOP, 0.5, 0.5)]
+    assert clock() == 2.0
+
+
+def test_move_in_the_running_direction_is_merged():
+    controller = RecordingController()
+    dispatcher = CommandDispatcher(controller)
+    dispatcher.start()
+
+    dispatcher.submit(encode_move_cmd(Direction.FORWARD, 0.2))
+    assert controller.started.wait(1)
+    dispatcher.submit(encode_move_cmd(Direction.FORWARD, 0.2))
+
+    assert wait_for(lambda: controller.drives)
+    assert dispatcher.merged == 1
+    assert [drive[0] for drive in controller.drives] == [Direction.FORWARD]
+    # Running through its whole duration shows the merge did not preempt it
+    assert controller.drives[0][2] >= 0.19
@@ -0,0 +1,60 @@
+"""
+file: test_metrics.py
+
+description: Rendering the metrics registry while other threads register metrics, or from a signal handler
+"""
+import os
+import signal
+import threading
+import time
+
+from wheelchair_interface.metrics import dump_on_signal, Registry, METRICS
+
+
+def test_render_while_registering():
+    registry = Registry()
+    registry.counter("nxt_test_total", "Counter present from the start").inc()
+    done = threading.Event()
+
+    def register():
+        for i in range(20_000):
+            registry.counter(f"nxt_test_{i}_total", "Counter registered during a render", bus=str(i % 3))
+        done.set()
+
+    thread = threading.Thread(target=register)
+    thread.start()
+    while not done.is_set():
+        assert "nxt_test_total 1" in registry.render()
+    thread.join()
+
+    assert "nxt_test_19999_total" in registry.render()
+
+
+def test_dump_signal_while_registering_does_not_deadlock(tmp_path):
+    path = tmp_path / "metrics.prom"
+    METRICS.counter("nxt_test_signal_total", "Counter present when the signal arrives").inc()
+
+    def timed_out(*_):
+        raise TimeoutError("Signal handler deadlocked on the registry lock")
+
+    previous = signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    previous_alarm = signal.signal(signal.SIGALRM, timed_out)
+    try:
+        dump_on_signal(str(path))
+        signal.alarm(2)
+        # The main thread is interrupted by the signal in the middle of registering a metric
+        with METRICS._lock:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            time.sleep(0.05)
+            assert not path.exists()
+        signal.alarm(0)
+
+        deadline = time.monotonic() + 2
+        while not path.exists():
+            assert time.monotonic() < deadline, "Metrics were not dumped after the registry lock was released"
+            time.sleep(0.01)
+        assert "nxt_test_signal_total 1" in path.read_text()
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGUSR1, previous)
+        signal.signal(signal.SIGALRM, previous_alarm)
@@ -0,0 +1,139 @@
+"""
+file: test_multi_bus.py
+
+description: Stop retries and motion hand over of the MultiBusController scheduler
+"""
+import asyncio
+import errno
+
+from wheelchair_interface.protocol.resources import Direction
+from wheelchair_interface.rnet_controller.MultiBusController import MultiBusController
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+
+
+STOP = RNetController.STOP_FRAME_BYTES
+FORWARD = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.FORWARD])
+
+
+class FlakySocket:
+    """
+    Stand-in can socket whose next sends fail with ENOBUFS, as a full transmit queue does
+    """
+    def __init__(self):
+        self.failures = 0
+        self.frames = []
+
+    def send(self, frame: bytes, flags: int = 0) -> int:
+        if self.failures:
+            self.failures -= 1
+            raise OSError(errno.ENOBUFS, "No buffer space available")
+        self.frames.append(frame)
+        return len(frame)
+
+    def setblocking(self, flag: bool) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def run_with_bus(test) -> None:
+    """
+    Run a test coroutine against a started controller with one flaky bus
+
+    :param test: Coroutine function taking (controller, socket)
+    """
+    async def main():
+        controller = MultiBusController(frame_period=0.005)
+        can_socket = FlakySocket()
+        controller.add_bus(0, can_socket)
+        controller.start()
+        try:
+            await test(controller, can_socket)
+        finally:
+            await controller.close()
+
+    asyncio.run(main())
+
+
+async def wait_until(condition, timeout: float = 1.0) -> None:
+    """
+    :param condition: Function returning whether to stop waiting
+    :param timeout: Seconds to wait for at most
+    """
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.001)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_stop_frame_is_retried_until_sent():
+    async def test(controller, can_socket):
+        can_socket.failures = 3
+        controller.stop(0)
+        schedule = controller.buses[0]
+        assert schedule.stop_pending
+
+        await wait_until(lambda: not schedule.stop_pending)
+        assert can_socket.frames == [STOP]
+        assert schedule.send_stats.retried == 3
+
+    run_with_bus(test)
+
+
+def test_drive_frames_which_do_not_fit_are_dropped():
+    async def test(controller, can_socket):
+        can_socket.failures = 2
+        assert await asyncio.wait_for(controller.drive(0, Direction.FORWARD, 0.05), 1.0)
+
+        schedule = controller.buses[0]
+        assert schedule.send_stats.dropped == 2
+        assert schedule.send_stats.retried == 0
+        assert FORWARD in can_socket.frames
+        assert can_socket.frames[-1] == STOP
+
+    run_with_bus(test)
+
+
+def test_drive_started_while_stop_is_pending_is_served():
+    async def test(controller, can_socket):
+        can_socket.failures = 1
+        controller.stop(0)
+        assert controller.buses[0].stop_pending
+
+        assert await asyncio.wait_for(controller.drive(0, Direction.FORWARD, 0.05), 1.0)
+        # The stop still goes out first, then the new motion and its own stop
+        assert can_socket.frames[0] == STOP
+        assert can_socket.frames.count(FORWARD) >= 2
+        assert can_socket.frames[-1] == STOP
+
+    run_with_bus(test)
+
+
+def test_drive_started_while_stop_retry_keeps_failing_waits_for_it():
+    async def test(controller, can_socket):
+        can_socket.failures = 4
+        controller.stop(0)
+        future = controller.drive(0, Direction.FORWARD, 0.05)
+
+        assert await asyncio.wait_for(future, 1.0)
+        assert can_socket.frames[0] == STOP
+        assert FORWARD in can_socket.frames
+
+    run_with_bus(test)
+
+
+def test_replaced_and_cancelled_motions():
+    async def test(controller, can_socket):
+        first = controller.drive(0, Direction.FORWARD, 10)
+        await wait_until(lambda: FORWARD in can_socket.frames)
+        second = controller.drive(0, Direction.LEFT, 10)
+        assert await first is False
+
+        second.cancel()
+        await asyncio.sleep(0)
+        assert can_socket.frames[-1] == STOP
+        assert controller.buses[0].direction is None
+
+    run_with_bus(test)
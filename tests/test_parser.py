@@ -0,0 +1,72 @@
+"""
+file: test_parser.py
+
+description: Framing and resynchronization of the FrameParser over chunked, corrupted and truncated streams
+"""
+import pytest
+
+from wheelchair_interface.protocol.parser import FrameParser
+from wheelchair_interface.protocol.processor import encode_move_cmd
+from wheelchair_interface.protocol.resources import *
+
+
+FORWARD = bytes(encode_move_cmd(Direction.FORWARD, 0.25))
+STOP = bytes(encode_move_cmd(Direction.STOP, 1))
+
+
+def test_frames_fed_a_byte_at_a_time():
+    parser = FrameParser()
+    stream = FORWARD + STOP
+
+    frames = []
+    for i in range(len(stream)):
+        frames += parser.feed(stream[i:i + 1])
+
+    assert frames == [FORWARD, STOP]
+    assert parser.frames == 2
+    assert parser.resyncs == 0 and parser.dropped_bytes == 0
+
+
+def test_partial_frame_is_kept_across_feeds():
+    parser = FrameParser()
+
+    assert parser.feed(FORWARD + STOP[:3]) == [FORWARD]
+    assert parser.feed(STOP[3:]) == [STOP]
+
+
+def test_garbage_between_frames_is_skipped():
+    parser = FrameParser()
+    garbage = bytes([0x00, 0x42, 0x07])
+
+    assert parser.feed(garbage + FORWARD + garbage + STOP) == [FORWARD, STOP]
+    assert parser.resyncs == 2
+    assert parser.dropped_bytes == 2 * len(garbage)
+
+
+def test_truncated_frame_is_dropped_for_the_one_after_it():
+    parser = FrameParser()
+    truncated = FORWARD[:2]
+
+    assert parser.feed(truncated + STOP) == [STOP]
+    assert parser.resyncs == 1
+    assert parser.dropped_bytes == len(truncated)
+
+
+def test_stray_etx_is_skipped():
+    parser = FrameParser()
+
+    assert parser.feed(bytes([ETX]) + FORWARD) == [FORWARD]
+    assert parser.dropped_bytes == 1
+
+
+def test_full_buffer_without_a_frame_is_dropped():
+    parser = FrameParser(buffer_size=8)
+    garbage = bytes(20)
+
+    assert parser.feed(garbage + FORWARD) == [FORWARD]
+    assert parser.dropped_bytes == len(garbage)
+
+
+def test_buffer_smaller_than_a_frame_is_refused():
+    with pytest.raises(ValueError):
+        FrameParser(buffer_size=PROTOCOL_LENGTH - 1)
@@ -0,0 +1,134 @@
+"""
+file: test_recording.py
+
+description: Records written by the recorder read back by replay.py, frames compared byte for byte
+"""
+import numpy as np
+import pytest
+
+from wheelchair_interface.benchmarks.standins import RecordingSocket
+from wheelchair_interface.protocol.processor import encode_move_cmd, encode_setpoint_cmd
+from wheelchair_interface.protocol.resources import Direction
+from wheelchair_interface.recording import Recorder, RECORD, RECORDER, HEADER_MAGIC, KIND_CAN_JOB, KIND_CAN_RX, \
+    KIND_CAN_TX, KIND_HEADER, KIND_UART
+from wheelchair_interface.replay import analyse, frames, load, replay, CAN_FRAME_DTYPE
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+
+FORWARD = RNetController.drive_frame(0, RNetController.MAX_POSITIVE)
+LEFT = RNetController.drive_frame(RNetController.MAX_NEGATIVE, 0)
+SPEED = RNetController.speed_frame(50)
+STOP = RNetController.STOP_FRAME_BYTES
+
+
+@pytest.fixture
+def recorder():
+    recorder = Recorder()
+    yield recorder
+    recorder.close()
+
+
+def test_records_are_fixed_width(recorder, tmp_path):
+    path = tmp_path / "session.rlog"
+    recorder.open(str(path), flush_interval=60)
+    recorder.record_frame(KIND_CAN_TX, FORWARD)
+    recorder.record(KIND_UART, 0, bytes(encode_move_cmd(Direction.FORWARD, 1)))
+    recorder.close()
+
+    raw = path.read_bytes()
+    assert RECORD.size == 24 and len(raw) == 3 * RECORD.size
+    fields = [RECORD.unpack_from(raw, offset) for offset in range(0, len(raw), RECORD.size)]
+    assert [(kind, length, can_id) for _, kind, length, can_id, _ in fields] == \
+        [(KIND_HEADER, 8, HEADER_MAGIC), (KIND_CAN_TX, 2, RNetController.DRIVE_FRAME_ID), (KIND_UART, 5, 0)]
+    # Short data is padded out to the full 8 bytes
+    assert fields[2][4] == bytes(encode_move_cmd(Direction.FORWARD, 1)) + bytes(3)
+    assert [ns for ns, *_ in fields] == sorted(ns for ns, *_ in fields)
+
+
+def test_round_trip_rebuilds_frames_byte_for_byte(recorder, tmp_path):
+    path = tmp_path / "session.rlog"
+    sent = [SPEED, FORWARD, FORWARD, LEFT, STOP]
+    jobs = [FORWARD, STOP]
+    uart = [encode_move_cmd(Direction.FORWARD, 1.5), encode_move_cmd(Direction.LEFT, 0.2), encode_setpoint_cmd(10, -10)]
+
+    recorder.open(str(path), flush_interval=60)
+    for frame in sent:
+        recorder.record_frame(KIND_CAN_TX, frame)
+    for frame in jobs:
+        recorder.record_frame(KIND_CAN_JOB, frame)
+    for command in uart:
+        recorder.record(KIND_UART, 0, bytes(command))
+    recorder.close()
+
+    records = load(str(path))
+    assert len(records) == 1 + len(sent) + len(jobs) + len(uart)
+    assert records.flags.writeable is False
+
+    rebuilt = frames(records[records["kind"] == KIND_CAN_TX])
+    assert rebuilt == sent
+    assert frames(records[records["kind"] == KIND_CAN_JOB]) == jobs
+    assert all(len(frame) == CAN_FRAME_DTYPE.itemsize == RNetController.CAN_FRAME.size for frame in rebuilt)
+    assert [bytes(data[:length]) for data, length in zip(records["data"][records["kind"] == KIND_UART],
+                                                         records["length"][records["kind"] == KIND_UART])] == \
+        [bytes(command) for command in uart]
+
+    summary = analyse(records)
+    assert summary["records"] == len(sent) + len(jobs) + len(uart)
+    assert summary["kinds"] == {"can_tx": len(sent), "can_job": len(jobs), "can_rx": 0, "uart": len(uart)}
+    assert summary["can_tx_directions"] == {"FORWARD": 2, "LEFT": 1, "STOP": 1}
+    assert summary["can_job_directions"] == {"FORWARD": 1, "STOP": 1}
+    # The setpoint is not a move and is left out of the move histogram
+    assert summary["uart_directions"] == {"FORWARD": 1, "LEFT": 1}
+    assert summary["uart_move_seconds"]["max"] == pytest.approx(1.5)
+
+
+def test_every_open_starts_with_a_header(recorder, tmp_path):
+    path = tmp_path / "session.rlog"
+    for frame in (FORWARD, STOP):
+        recorder.open(str(path), flush_interval=60)
+        recorder.record_frame(KIND_CAN_TX, frame)
+        recorder.close()
+
+    records = load(str(path))
+    assert records["kind"].tolist() == [KIND_HEADER, KIND_CAN_TX, KIND_HEADER, KIND_CAN_TX]
+    assert (records["can_id"][records["kind"] == KIND_HEADER] == HEADER_MAGIC).all()
+    wall_ns = records["data"][records["kind"] == KIND_HEADER].copy().view("<u8").ravel()
+    assert wall_ns[0] <= wall_ns[1]
+
+    # Headers are not counted, and the frames of both opens rebuild in order
+    assert analyse(records)["kinds"]["can_tx"] == 2
+    assert frames(records[records["kind"] != KIND_HEADER]) == [FORWARD, STOP]
+
+
+def test_partial_and_empty_logs(tmp_path):
+    empty = tmp_path / "empty.rlog"
+    empty.touch()
+    assert len(load(str(empty))) == 0
+    assert analyse(load(str(empty))) == {"records": 0}
+
+    torn = tmp_path / "torn.rlog"
+    torn.write_bytes(RECORD.pack(1, KIND_CAN_RX, 2, RNetController.DRIVE_FRAME_ID, b"\x00\x64") + bytes(10))
+    assert len(load(str(torn))) == 1
+
+
+def test_controller_frames_replay_byte_for_byte(tmp_path):
+    path = tmp_path / "session.rlog"
+    bus = RecordingSocket()
+    controller = RNetController(frame_period=0.005, can_socket=bus)
+
+    RECORDER.open(str(path), flush_interval=60)
+    try:
+        controller.set_speed_range(50)
+        controller.drive_forward_seconds(0.03)
+        controller.turn_left_seconds(0.02)
+    finally:
+        RECORDER.close()
+
+    records = load(str(path))
+    sent = [frame for _, frame in bus.frames]
+    assert SPEED in sent and FORWARD in sent and LEFT in sent
+    assert frames(records[records["kind"] == KIND_CAN_TX]) == sent
+
+    replayed = RecordingSocket()
+    assert replay(records, replayed, speed=0) == len(sent)
+    assert [frame for _, frame in replayed.frames] == sent
+    assert np.diff(records["ns"][records["kind"] == KIND_CAN_TX]).min() >= 0
@@ -0,0 +1,96 @@
+"""
+file: test_setpoint.py
+
+description: The setpoint codec, clamping of out of range setpoints, and the hold timeout stopping a stale setpoint
+"""
+import pytest
+
+from wheelchair_interface.clock import VirtualClock
+from wheelchair_interface.protocol.processor import decode_setpoint_cmd, encode_setpoint_cmd, is_setpoint_cmd, \
+    encode_move_cmd, InvalidCmdException, InvalidSetpointException
+from wheelchair_interface.protocol.resources import *
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+from wheelchair_interface.simulation import SimulatedChair
+
+FRAME_PERIOD = RNetController.FRAME_PERIOD
+
+
+def test_round_trip_over_the_whole_range():
+    for x in range(MIN_SETPOINT, MAX_SETPOINT + 1):
+        for y in (MIN_SETPOINT, -1, 0, 1, MAX_SETPOINT, x):
+            raw = encode_setpoint_cmd(x, y)
+            assert len(raw) == PROTOCOL_LENGTH
+            # The offset keeps the payload clear of the framing bytes
+            assert STX not in raw[2:4] and ETX not in raw[2:4]
+            assert is_setpoint_cmd(raw)
+            assert decode_setpoint_cmd(raw) == (x, y)
+
+
+@pytest.mark.parametrize("x, y", [(MIN_SETPOINT - 1, 0), (0, MAX_SETPOINT + 1), (1000, -1000)])
+def test_encode_rejects_out_of_range(x, y):
+    with pytest.raises(InvalidSetpointException):
+        encode_setpoint_cmd(x, y)
+
+
+def test_decode_rejects_out_of_range_and_other_commands():
+    raw = encode_setpoint_cmd(0, 0)
+    raw[2] = SETPOINT_OFFSET + MAX_SETPOINT + 1
+    with pytest.raises(InvalidCmdException):
+        decode_setpoint_cmd(raw)
+
+    move = encode_move_cmd(Direction.FORWARD, 1)
+    assert not is_setpoint_cmd(move)
+    with pytest.raises(InvalidCmdException):
+        decode_setpoint_cmd(move)
+
+
+def stream(setpoints: list[tuple[float, int, int]], seconds: float) -> SimulatedChair:
+    """
+    Stream setpoints to a simulated chair on a virtual clock
+
+    :param setpoints: (seconds from the start, x, y) sorted by time
+    :param seconds: Seconds to run for after the start
+    :return: The chair, once the stream has been stopped
+    """
+    clock = VirtualClock()
+    chair = SimulatedChair(clock)
+    controller = RNetController(can_socket=chair, clock=clock)
+
+    for at, x, y in setpoints:
+        clock.sleep(at - clock())
+        controller.set_setpoint(x, y)
+    clock.sleep(seconds - clock())
+    controller.stop_setpoint_stream()
+
+    return chair
+
+
+@pytest.mark.parametrize("x, y, clamped", [(300, -250, (MAX_SETPOINT, MIN_SETPOINT)),
+                                           (-200, 0, (MIN_SETPOINT, 0)),
+                                           (40, -60, (40, -60))])
+def test_out_of_range_setpoint_is_clamped(x, y, clamped):
+    chair = stream([(0.0, x, y)], 0.1)
+
+    # Wrapped to the low byte instead, -200 would drive right at 56
+    assert chair.segments[0][1:] == clamped
+
+
+def test_stale_setpoint_decays_to_stop_after_the_hold_timeout():
+    chair = stream([(0.0, 30, 60)], 1.0)
+
+    (start, *driving), (stopped, *still) = chair.segments
+    assert driving == [30, 60] and still == [0, 0]
+    assert start == 0.0
+    assert SETPOINT_HOLD_TIMEOUT < stopped <= SETPOINT_HOLD_TIMEOUT + FRAME_PERIOD + 1e-9
+    # The stop frame keeps being sent until the stream is stopped
+    assert chair.frames >= 0.9 / FRAME_PERIOD
+
+
+def test_refreshed_setpoint_is_held_until_the_last_refresh_times_out():
+    refreshes = [0.0, 0.15, 0.3, 0.45]
+    chair = stream([(at, 30, 60) for at in refreshes] + [(0.6, -20, 10)], 1.0)
+
+    assert [segment[1:] for segment in chair.segments] == [(30, 60), (-20, 10), (0, 0)]
+    assert chair.segments[1][0] == pytest.approx(0.6, abs=FRAME_PERIOD)
+    stopped = chair.segments[2][0] - 0.6
+    assert SETPOINT_HOLD_TIMEOUT - 1e-9 < stopped <= SETPOINT_HOLD_TIMEOUT + FRAME_PERIOD + 1e-9
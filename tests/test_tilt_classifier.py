@@ -0,0 +1,105 @@
+"""
+file: test_tilt_classifier.py
+
+description: Calibration, hysteresis and decision latency of the head tilt classifier on generated samples
+"""
+import numpy as np
+
+from wheelchair_interface.input_receivers.tilt_classifier import classify, TiltClassifier, FORWARD_THRESHOLDS, \
+    TURN_THRESHOLDS
+from wheelchair_interface.protocol.resources import Direction
+
+
+SAMPLE_RATE = 250
+""" Samples per second of the Cyton and synthetic boards """
+
+DECISION_RATE = 20
+""" Decisions per second, as headtilt makes them """
+
+NEUTRAL = np.array([0.08, -0.97, 0.1])
+""" A head at rest, away from the default neutral pose so calibration has to find it """
+
+
+def generate(segments: list[tuple[float, float, float]], noise: float = 0.03, seed: int = 0) -> np.ndarray:
+    """
+    Accelerometer samples of a head moving through a series of poses
+
+    :param segments: (seconds, x tilt, y tilt) from the neutral pose of each pose held in turn
+    :param noise: Standard deviation (g) of the sensor noise
+    :param seed: Seed of the noise
+    :return: Array of shape (3, samples)
+    """
+    blocks = []
+    for seconds, x, y in segments:
+        count = round(seconds * SAMPLE_RATE)
+        blocks.append(np.tile((NEUTRAL + (x, y, 0))[:, None], count))
+    samples = np.hstack(blocks)
+
+    return samples + np.random.default_rng(seed).normal(0, noise, samples.shape)
+
+
+def changes(decisions: list[tuple[float, Direction]]) -> list[tuple[float, Direction]]:
+    """
+    :return: The decisions which differ from the one before, starting from STOP
+    """
+    result = []
+    last = Direction.STOP
+    for time, direction in decisions:
+        if direction != last:
+            result.append((time, direction))
+            last = direction
+
+    return result
+
+
+def test_neutral_pose_is_calibrated():
+    samples = generate([(2.0, 0, 0), (5.0, 0, 0)])
+    classifier = TiltClassifier(SAMPLE_RATE)
+    classifier.calibrate(samples[:, :2 * SAMPLE_RATE])
+
+    assert np.allclose(classifier.neutral, NEUTRAL, atol=0.01)
+    assert all(direction == Direction.STOP
+               for _, direction in classify(samples, SAMPLE_RATE, DECISION_RATE, calibration=2.0))
+    # Uncalibrated, the offset of the rest pose alone reads as a right turn
+    assert classify(samples, SAMPLE_RATE, DECISION_RATE)[-1][1] == Direction.RIGHT
+
+
+def test_forward_hysteresis_does_not_flap():
+    forward_enter, forward_exit = FORWARD_THRESHOLDS
+    between = (forward_enter + forward_exit) / 2
+    # Rest, a small nod which never reaches the entry threshold, a firm nod, easing back to between the thresholds,
+    # then rest again
+    samples = generate([(2.0, 0, 0), (2.0, 0, between), (1.0, 0, 0), (2.0, 0, 0.4), (2.0, 0, between),
+                        (2.0, 0, 0)])
+
+    decisions = changes(classify(samples, SAMPLE_RATE, DECISION_RATE, calibration=2.0))
+
+    assert [direction for _, direction in decisions] == [Direction.FORWARD, Direction.STOP]
+    assert 5.0 < decisions[0][0] < 5.2
+    assert 9.0 < decisions[1][0] < 9.3
+
+
+def test_turn_hysteresis_does_not_flap():
+    turn_enter, turn_exit = TURN_THRESHOLDS
+    between = (turn_enter + turn_exit) / 2
+    samples = generate([(2.0, 0, 0), (2.0, -between, 0), (2.0, -0.1, 0), (2.0, -between, 0), (2.0, 0, 0),
+                        (2.0, 0.1, 0), (2.0, 0, 0)], noise=0.01)
+
+    decisions = changes(classify(samples, SAMPLE_RATE, DECISION_RATE, calibration=2.0))
+
+    assert [direction for _, direction in decisions] == [Direction.LEFT, Direction.STOP, Direction.RIGHT,
+                                                         Direction.STOP]
+
+
+def test_decision_latency_is_bounded():
+    period = 1 / DECISION_RATE
+    for seed in range(10):
+        samples = generate([(2.0, 0, 0), (3.0, 0, 0), (1.0, 0, 0.4), (1.0, 0, 0)], seed=seed)
+
+        decisions = changes(classify(samples, SAMPLE_RATE, DECISION_RATE, calibration=2.0))
+
+        (started, forward), (stopped, stop) = decisions
+        assert forward == Direction.FORWARD and stop == Direction.STOP
+        # The filter settles within about a tenth of a second, plus up to a decision period
+        assert 5.0 < started <= 5.1 + period
+        assert 6.0 < stopped <= 6.15 + period
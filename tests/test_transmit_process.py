@@ -0,0 +1,173 @@
+"""
+file: test_transmit_process.py
+
+description: The transmit process logs when forked under the event log, and stops the chair when its owner hangs or
+    dies
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from multiprocessing import resource_tracker, shared_memory
+
+from wheelchair_interface.clock import Clock
+from wheelchair_interface.protocol.resources import Direction
+
+from wheelchair_interface import eventlog
+from wheelchair_interface.eventlog import EVENTS
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+from wheelchair_interface.rnet_controller.TransmitProcess import TransmitProcess
+
+
+def test_child_forked_with_event_log_running_logs_directly(tmp_path):
+    path = tmp_path / "log.txt"
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    root.handlers = [logging.FileHandler(path)]
+    root.setLevel(logging.INFO)
+    can_socket, bus_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    try:
+        eventlog.start()
+        # No machine has this CPU, so the child warns that it could not pin itself
+        process = TransmitProcess(can_socket, RNetController.STOP_FRAME_BYTES, 0.01, cpu=100_000)
+        time.sleep(0.2)
+        process.close()
+        assert not process.is_alive()
+
+    finally:
+        EVENTS.close()
+        for handler in root.handlers:
+            handler.close()
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+        can_socket.close()
+        bus_socket.close()
+
+    assert "Failed to pin the transmit process to CPU 100000" in path.read_text()
+
+
+STOP = RNetController.STOP_FRAME_BYTES
+FORWARD = RNetController.drive_frame(*RNetController.DIRECTION_POSITIONS[Direction.FORWARD])
+
+
+class HangingClock(Clock):
+    """
+    Wall clock whose sleeps never return until released, as a controlling process stuck mid motion
+    """
+    def __init__(self):
+        self.released = threading.Event()
+
+    def sleep(self, seconds: float) -> None:
+        self.released.wait()
+
+
+def frames_until(bus_socket: socket.socket, frame: bytes, timeout: float = 2.0) -> tuple[float, list[bytes]]:
+    """
+    :return: Time the frame was first received, and every frame received before it
+    """
+    bus_socket.settimeout(timeout)
+    deadline = time.monotonic() + timeout
+    before = []
+    while time.monotonic() < deadline:
+        received = bus_socket.recv(16)
+        if received == frame:
+            return time.monotonic(), before
+        before.append(received)
+
+    raise AssertionError(f"No {frame.hex()} within {timeout}s, {len(before)} other frames instead")
+
+
+def own_transmit_process(can_socket: socket.socket, connection) -> None:
+    """
+    Body of the owner process: start a transmit process driving forward with no hold, then wait to be killed
+    """
+    process = TransmitProcess(can_socket, STOP, 0.01)
+    process.set_frame(FORWARD)
+    connection.send((process._shm.name, process._process.pid))
+    time.sleep(60)
+
+
+def test_child_stops_the_chair_when_its_owner_is_killed():
+    can_socket, bus_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    # Shared with the owner, so the segment it leaks can be unlinked from here
+    resource_tracker.ensure_running()
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    owner = context.Process(target=own_transmit_process, args=(can_socket, sender))
+    owner.start()
+
+    try:
+        shm_name, child = receiver.recv()
+        frames_until(bus_socket, FORWARD)
+        os.kill(owner.pid, signal.SIGKILL)
+        owner.join()
+        killed = time.monotonic()
+
+        stopped, before = frames_until(bus_socket, STOP)
+        assert set(before) <= {FORWARD}
+        assert stopped - killed < 0.5
+
+        # Only stop frames follow, then the child has exited and the bus goes quiet
+        bus_socket.settimeout(0.3)
+        try:
+            while True:
+                assert bus_socket.recv(16) == STOP
+        except socket.timeout:
+            pass
+
+    finally:
+        # Only still there if it failed to stop by itself
+        try:
+            os.kill(child, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        shared_memory.SharedMemory(shm_name).unlink()
+        can_socket.close()
+        bus_socket.close()
+
+
+def run_hung_motion(extend: float = None) -> tuple[float, float]:
+    """
+    Drive forward for 0.2s through the transmit process from a controller which hangs as soon as the motion starts
+
+    :param extend: Seconds to extend the motion by 0.1s in, None to leave it
+    :return: Seconds from the motion starting until the first stop frame, and the extension's result
+    """
+    can_socket, bus_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    clock = HangingClock()
+    controller = RNetController(transport=RNetController.TRANSPORT_PROCESS, can_socket=can_socket, clock=clock)
+
+    try:
+        threading.Thread(target=controller.drive_forward_seconds, args=(0.2,), daemon=True).start()
+        started, _ = frames_until(bus_socket, FORWARD)
+        extended = None
+        if extend is not None:
+            time.sleep(0.1)
+            extended = controller.extend_motion(Direction.FORWARD, extend)
+
+        stopped, before = frames_until(bus_socket, STOP)
+        assert set(before) <= {FORWARD}
+        return stopped - started, extended
+
+    finally:
+        clock.released.set()
+        controller.close()
+        bus_socket.close()
+
+
+def test_motion_runs_out_when_its_owner_hangs():
+    held, _ = run_hung_motion()
+
+    assert 0.15 < held < 0.4
+
+
+def test_extension_carries_the_hold_with_it():
+    held, extended = run_hung_motion(extend=0.4)
+
+    assert extended
+    assert 0.45 < held < 0.7
@@ -0,0 +1,109 @@
+"""
+file: test_transport.py
+
+description: The shared memory ring across its wrap, and its reader waiting out slots that are not fully visible yet
+"""
+import os
+import struct
+import threading
+
+import pytest
+
+from wheelchair_interface.clientserver.transport import SharedMemoryRing
+from wheelchair_interface.protocol.processor import encode_move_cmd, encode_setpoint_cmd
+from wheelchair_interface.protocol.resources import Direction
+
+SLOT = SharedMemoryRing.SLOT
+DATA = SharedMemoryRing.HEADER.size + SLOT.size
+""" Offset of the data of the first slot """
+
+
+@pytest.fixture
+def ring():
+    pi_end = SharedMemoryRing(f"nxt_test_{os.getpid()}", create=True, size=4 * SharedMemoryRing.SLOT_SIZE)
+    nano_end = SharedMemoryRing(pi_end.name, create=False)
+    yield pi_end, nano_end
+    nano_end.close()
+    pi_end.close()
+
+
+def read_in_thread(pi_end: SharedMemoryRing, size: int) -> tuple[threading.Thread, list]:
+    """
+    :return: The started thread reading once, and the list its bytes are appended to
+    """
+    received = []
+    thread = threading.Thread(target=lambda: received.append(pi_end.read(size)), daemon=True)
+    thread.start()
+    return thread, received
+
+
+def test_commands_round_trip_across_the_wrap(ring):
+    pi_end, nano_end = ring
+    commands = [bytes(encode_move_cmd(Direction.FORWARD, i / 10 + 0.1)) for i in range(50)]
+    commands += [bytes(encode_setpoint_cmd(i, -i)) for i in range(50)]
+
+    received = b""
+    for i in range(0, len(commands), 3):
+        batch = b"".join(commands[i:i + 3])
+        assert nano_end.write(batch) == len(batch)
+        assert pi_end.in_waiting == len(batch)
+        received += pi_end.read(len(batch))
+
+    assert received == b"".join(commands)
+    assert pi_end.in_waiting == 0
+
+
+def test_write_longer_than_a_slot_is_read_in_order_and_in_parts(ring):
+    pi_end, nano_end = ring
+    data = bytes(range(3 * SharedMemoryRing.SLOT_DATA + 7))
+
+    assert nano_end.write(data) == len(data)
+    assert pi_end.read(5) == data[:5]
+    assert pi_end.in_waiting == len(data) - 5
+    assert pi_end.read(len(data)) == data[5:]
+
+
+def test_full_ring_drops_the_write(ring):
+    pi_end, nano_end = ring
+    slot = bytes(SharedMemoryRing.SLOT_DATA)
+    for _ in range(4):
+        assert nano_end.write(slot) == len(slot)
+
+    assert nano_end.write(b"\x01") == 0
+    assert nano_end.write(bytes(5 * SharedMemoryRing.SLOT_DATA)) == 0
+    assert pi_end.read(10 * len(slot)) == 4 * slot
+
+
+def test_reader_waits_until_the_slot_is_visible(ring):
+    pi_end, nano_end = ring
+    command = bytes(encode_move_cmd(Direction.LEFT, 1))
+    nano_end.write(command)
+
+    # As on ARM, the head is seen but the slot still holds what was there before
+    buffer = pi_end._buffer
+    buffer[DATA] ^= 0xff
+    thread, received = read_in_thread(pi_end, 10)
+    thread.join(0.05)
+    assert received == []
+
+    buffer[DATA] ^= 0xff
+    thread.join(1)
+    assert received == [command]
+
+
+def test_reader_rejects_a_slot_left_from_the_previous_lap(ring):
+    pi_end, nano_end = ring
+    for i in range(4):
+        nano_end.write(bytes((i,)))
+        assert pi_end.read() == bytes((i,))
+
+    # The head of lap two is seen before its slot, which still holds position 0 with a valid CRC
+    struct.pack_into("<Q", pi_end._buffer, 0, 5)
+    thread, received = read_in_thread(pi_end, 10)
+    thread.join(0.05)
+    assert received == []
+
+    struct.pack_into("<Q", pi_end._buffer, 0, 4)
+    nano_end.write(b"\x09")
+    thread.join(1)
+    assert received == [b"\x09"]
@@ -0,0 +1,193 @@
+"""
+file: test_watchdog.py
+
+description: The chair is stopped within the watchdog window of losing the link, and when its producer disconnects
+"""
+import asyncio
+import os
+import threading
+import time
+
+import serial
+
+from wheelchair_interface.benchmarks.standins import RecordingSocket, open_uart
+from wheelchair_interface.clientserver import pi_server
+from wheelchair_interface.clientserver.nano_client import CommandHub
+from wheelchair_interface.protocol.parser import FrameParser
+from wheelchair_interface.protocol.processor import decode_move_cmd, encode_heartbeat_cmd, encode_move_cmd, \
+    is_heartbeat_cmd
+from wheelchair_interface.protocol.resources import *
+from wheelchair_interface.rnet_controller.RNetController import RNetController
+from wheelchair_interface.simulation import run_session
+
+
+STOP = RNetController.STOP_FRAME_BYTES
+
+
+def test_link_loss_stops_chair_within_window():
+    can_socket = RecordingSocket()
+    controller = RNetController(can_socket=can_socket)
+    nano_end, serial_device = open_uart()
+
+    def serve():
+        try:
+            pi_server.serve(controller, serial_device, WATCHDOG_WINDOW)
+        except serial.SerialException:
+            # The Nano end was closed at the end of the test
+            pass
+
+    threading.Thread(target=serve, daemon=True).start()
+
+    try:
+        os.write(nano_end, encode_move_cmd(Direction.FORWARD, 60))
+        for sequence in range(10):
+            time.sleep(HEARTBEAT_PERIOD)
+            os.write(nano_end, encode_heartbeat_cmd(sequence))
+
+        # Heartbeats kept the chair driving
+        link_lost = time.monotonic()
+        assert STOP not in [frame for _, frame in can_socket.frames]
+        assert len(can_socket.frames) > 10
+
+        time.sleep(WATCHDOG_WINDOW * 3)
+        stops = [sent for sent, frame in can_socket.frames if sent > link_lost and frame == STOP]
+        assert stops, "the watchdog did not stop the chair"
+        assert min(stops) - link_lost < WATCHDOG_WINDOW * 1.5
+
+    finally:
+        os.close(nano_end)
+        controller.close()
+
+
+def heartbeats_then_silence(beats: int, gap: float = None) -> tuple[list[tuple[float, bytes]], float]:
+    """
+    Script of the Nano starting a long forward move and keeping the link alive with heartbeats, then going quiet
+
+    :param beats: Heartbeats sent a heartbeat period apart
+    :param gap: Seconds of silence before the last heartbeat, a heartbeat period if None
+    :return: (seconds from the start, command) of everything sent, and the time of the last heartbeat
+    """
+    commands = [(0.0, bytes(encode_move_cmd(Direction.FORWARD, 60)))]
+    at = 0.0
+    for sequence in range(beats):
+        at += gap if gap is not None and sequence == beats - 1 else HEARTBEAT_PERIOD
+        commands.append((at, bytes(encode_heartbeat_cmd(sequence))))
+
+    return commands, at
+
+
+def test_watchdog_stops_chair_one_window_after_link_loss_in_virtual_time():
+    commands, link_lost = heartbeats_then_silence(10)
+
+    chair = run_session(commands, link_lost + 3 * WATCHDOG_WINDOW)
+
+    # Driven from the first move until the stop frame, which comes a window after the last heartbeat
+    (started, *forward), (stopped, *stop) = chair.segments
+    assert forward == list(RNetController.DIRECTION_POSITIONS[Direction.FORWARD]) and stop == [0, 0]
+    assert started == 0.0
+    assert link_lost + WATCHDOG_WINDOW <= stopped <= link_lost + WATCHDOG_WINDOW + RNetController.FRAME_PERIOD
+    # The same every time
+    assert run_session(commands, link_lost + 3 * WATCHDOG_WINDOW).segments == chair.segments
+
+
+def test_heartbeat_just_inside_the_window_keeps_chair_driving_in_virtual_time():
+    commands, link_lost = heartbeats_then_silence(10, gap=WATCHDOG_WINDOW * 0.95)
+
+    chair = run_session(commands, link_lost + WATCHDOG_WINDOW * 0.95)
+
+    assert len(chair.segments) == 1
+    # Still driving along x at the end, it never stopped
+    assert chair.pose()[0] > 0
+
+
+class RecordingSerial:
+    """
+    Serial device stand-in which timestamps every write
+    """
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data: bytes) -> int:
+        self.writes.append((time.monotonic(), bytes(data)))
+        return len(data)
+
+    def moves(self, after: float = 0.0) -> list[tuple[float, Direction]]:
+        """
+        :param after: Only moves written after this time
+        :return: (time, direction) of every move written, heartbeats left out
+        """
+        moves = []
+        parser = FrameParser()
+        for written, data in self.writes:
+            for command in parser.feed(data):
+                if written > after and not is_heartbeat_cmd(command):
+                    moves.append((written, decode_move_cmd(command)[0]))
+
+        return moves
+
+
+def run_hub(test, tmp_path) -> RecordingSerial:
+    """
+    Serve a hub on a unix socket writing to a RecordingSerial while a test coroutine runs
+
+    :param test: Coroutine function taking the socket path
+    :param tmp_path: Directory for the socket
+    :return: The serial device stand-in
+    """
+    device = RecordingSerial()
+    path = str(tmp_path / "hub.sock")
+
+    async def main():
+        hub = CommandHub(device)
+        await hub.listen_unix(path)
+        task = asyncio.create_task(hub.serve())
+        try:
+            await test(path)
+        finally:
+            task.cancel()
+
+    asyncio.run(main())
+    return device
+
+
+async def send(path: str, direction: Direction, seconds: float) -> asyncio.StreamWriter:
+    """
+    :return: Open connection of a producer which has sent a move
+    """
+    _, writer = await asyncio.open_unix_connection(path)
+    writer.write(encode_move_cmd(direction, seconds))
+    await writer.drain()
+
+    return writer
+
+
+def test_producer_disconnecting_mid_command_stops_chair(tmp_path):
+    closed = None
+
+    async def test(path):
+        nonlocal closed
+        writer = await send(path, Direction.FORWARD, 5)
+        # Long enough for heartbeats to be written behind the move
+        await asyncio.sleep(HEARTBEAT_PERIOD * 3)
+        closed = time.monotonic()
+        writer.close()
+        await asyncio.sleep(WATCHDOG_WINDOW)
+
+    device = run_hub(test, tmp_path)
+    assert [direction for _, direction in device.moves()] == [Direction.FORWARD, Direction.STOP]
+    stopped, _ = device.moves(closed)[0]
+    assert stopped - closed < WATCHDOG_WINDOW
+
+
+def test_producer_disconnecting_after_losing_the_chair_writes_no_stop(tmp_path):
+    async def test(path):
+        first = await send(path, Direction.FORWARD, 5)
+        await asyncio.sleep(HEARTBEAT_PERIOD)
+        second = await send(path, Direction.LEFT, 5)
+        await asyncio.sleep(HEARTBEAT_PERIOD)
+        first.close()
+        await asyncio.sleep(WATCHDOG_WINDOW)
+        second.close()
+
+    device = run_hub(test, tmp_path)
+    assert [direction for _, direction in device.moves()] == [Direction.FORWARD, Direction.LEFT]